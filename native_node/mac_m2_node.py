@@ -5,11 +5,13 @@ SynapseGrid Mac M2 Native Node - Redis Connection Fixed
 import asyncio
 import json
 import logging
+import os
 import time
 import platform
 import psutil
 import sys
 import socket
+import zlib
 from typing import Dict, Any, Optional
 from datetime import datetime
 from pathlib import Path
@@ -32,7 +34,7 @@ except ImportError:
 
 try:
     import transformers
-    from transformers import pipeline
+    from transformers import pipeline, StoppingCriteriaList, TextIteratorStreamer
     TRANSFORMERS_AVAILABLE = True
     print("✅ Transformers available")
 except ImportError:
@@ -50,6 +52,108 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Take one job from the back of the longest peer queue this node can run.
+# Owners pop from the right, so the left end holds the jobs that would wait
+# the longest. Peers with fewer than ARGV[3] queued jobs are left alone.
+# The stolen jobs' assignments and slots move to the thief in the same step,
+# so a crash or a rival thief cannot leave them pointing at the old owner.
+# Like JOB_COMPLETE, slot and assignment keys are derived here, which assumes
+# a single Redis instance.
+# KEYS: nodes:load, then peer job lists (node_jobs:{peer_id})
+# ARGV: thief node id, JSON list of supported models (empty = any), minimum
+#       peer queue length, thief total slots, assignment ttl, now, peer ids...
+# The thief's free slots are its total minus the slots it holds right now.
+# Returns {peer index (1-based), delivery JSON} or nil.
+STEAL_JOB = """
+local supported = {}
+local any_model = true
+for _, model in ipairs(cjson.decode(ARGV[2])) do
+    supported[model] = true
+    any_model = false
+end
+
+local peers = {}
+for i = 2, #KEYS do
+    local length = redis.call('LLEN', KEYS[i])
+    if length >= tonumber(ARGV[3]) then
+        table.insert(peers, {i, length})
+    end
+end
+table.sort(peers, function(a, b) return a[2] > b[2] end)
+
+local thief = ARGV[1]
+local free = tonumber(ARGV[4]) - redis.call('ZCARD', 'node_slots:' .. thief)
+if free <= 0 then
+    return nil
+end
+local expires = tonumber(ARGV[6]) + tonumber(ARGV[5])
+for _, peer in ipairs(peers) do
+    local key = KEYS[peer[1]]
+    local victim = ARGV[peer[1] + 5]
+    -- Keep the owner's next job (rightmost) for the owner
+    for _, delivery in ipairs(redis.call('LRANGE', key, 0, peer[2] - 2)) do
+        local decoded = cjson.decode(delivery)
+        local jobs = decoded['jobs'] or {decoded}
+        -- A hedged copy must stay off the primary's node and keeps its own assignment
+        if (any_model or supported[decoded['model_name']]) and #jobs <= free
+                and not decoded['hedge'] then
+            redis.call('LREM', key, 1, delivery)
+            for _, job in ipairs(jobs) do
+                redis.call('SET', 'job:' .. job['job_id'] .. ':assigned', thief, 'EX', tonumber(ARGV[5]))
+                redis.call('ZREM', 'node_slots:' .. victim, job['job_id'])
+                redis.call('ZADD', 'node_slots:' .. thief, expires, job['job_id'])
+            end
+            redis.call('HSET', KEYS[1], victim, redis.call('ZCARD', 'node_slots:' .. victim))
+            redis.call('HSET', KEYS[1], thief, redis.call('ZCARD', 'node_slots:' .. thief))
+            redis.call('HINCRBY', 'metrics:work_stealing', 'stolen', #jobs)
+            return {peer[1] - 1, delivery}
+        end
+    end
+end
+return nil
+"""
+
+# Report that this node began a job in one step: the start time the dispatcher
+# measures stragglers from, the started event and the move to running. The
+# state update mirrors JOB_TRANSITION in shared/redis_scripts.py (running is
+# reachable from pending and assigned, see shared/models.py), which a
+# standalone node cannot import.
+# KEYS: started key, job state key, metrics:jobs, job event stream
+# ARGV: now, assignment ttl, job id, node id, state ttl
+# Returns 1 if the job moved to running, 0 if it is in another state
+# (a hedged copy whose twin runs, or a job that already finished).
+JOB_START = """
+redis.call('SET', KEYS[1], ARGV[1], 'EX', tonumber(ARGV[2]))
+redis.call('XADD', KEYS[4], '*', 'job_id', ARGV[3], 'event', 'started', 'ts', ARGV[1], 'node_id', ARGV[4])
+local current = redis.call('GET', KEYS[2])
+local status = current and string.match(current, '^([^|]*)|') or 'pending'
+if status ~= 'pending' and status ~= 'assigned' then
+    return 0
+end
+redis.call('SET', KEYS[2], 'running|' .. ARGV[4], 'EX', tonumber(ARGV[5]))
+redis.call('HINCRBY', KEYS[3], 'running', 1)
+return 1
+"""
+
+# Release a job's assignment and its slot; same script as JOB_COMPLETE in
+# shared/redis_scripts.py. Safe to call more than once.
+# KEYS: assignment key, nodes:load
+# ARGV: job id
+JOB_RELEASE = """
+local node = redis.call('GET', KEYS[1])
+if not node then
+    return 0
+end
+local slots = 'node_slots:' .. node
+redis.call('DEL', KEYS[1])
+redis.call('ZREM', slots, ARGV[1])
+redis.call('HSET', KEYS[2], node, redis.call('ZCARD', slots))
+return 1
+"""
+
+class JobCancelled(Exception):
+    """Raised inside a job that was cancelled while running"""
+
 class MacM2Node:
     def __init__(self):
         self.node_id = f"mac_m2_{platform.node()}_{int(time.time())}"
@@ -60,7 +164,30 @@ class MacM2Node:
             "redis://0.0.0.0:6379"
         ]
         self.redis_url = None  # Will be set by connection test
-        self.region = "local-mac"
+        # Same default as the cluster's DEFAULT_REGION so default jobs run here without spilling
+        self.region = os.getenv("NODE_REGION", os.getenv("DEFAULT_REGION", "eu-west-1"))
+        self.work_stealing = os.getenv("WORK_STEALING", "true").lower() == "true"
+        self.steal_min_queue = int(os.getenv("STEAL_MIN_QUEUE", "2"))
+        # Jobs the dispatcher may hand us at once (running + waiting in node_jobs)
+        self.slots = int(os.getenv("NODE_SLOTS", "4"))
+        # Must match the cluster's JOB_ASSIGNMENT_TTL; stolen jobs get a fresh assignment
+        self.assignment_ttl = int(os.getenv("JOB_ASSIGNMENT_TTL", "300"))
+        # Partial results are trimmed to the newest chunks so a client that
+        # never reads cannot grow the stream without bound
+        self.partial_maxlen = int(os.getenv("PARTIAL_STREAM_MAXLEN", "256"))
+        self.partial_ttl = int(os.getenv("PARTIAL_STREAM_TTL", "600"))
+        # Must match the cluster's EVENT_LOG_PARTITIONS (see shared/job_events.py)
+        self.event_partitions = int(os.getenv("EVENT_LOG_PARTITIONS", "16"))
+        self.state_ttl = int(os.getenv("JOB_STATE_TTL", "86400"))
+        # Models are loaded on first use; PRELOAD_MODELS ("all" or a comma-separated
+        # list) loads some at startup instead
+        self.preload_models = [m.strip() for m in os.getenv("PRELOAD_MODELS", "").split(",") if m.strip()]
+        self.model_locks = {}
+        # Jobs cancelled over the control channel; running ones stop at their next check
+        self.cancelled_jobs = set()
+        self.steal_job = None
+        self.job_start = None
+        self.job_release = None
         self.running = False
         self.loaded_models = {}
         self.total_jobs = 0
@@ -159,7 +286,7 @@ class MacM2Node:
         # Register with gateway with retries
         await self._register_with_retries()
         
-        # Load models
+        # Preload models if configured, the others are loaded lazily
         await self._prepare_models()
         
         self.running = True
@@ -168,7 +295,8 @@ class MacM2Node:
         # Start loops
         await asyncio.gather(
             self._job_polling_loop(),
-            self._heartbeat_loop()
+            self._heartbeat_loop(),
+            self._control_loop()
         )
     
     async def _connect_redis(self):
@@ -184,6 +312,10 @@ class MacM2Node:
                 health_check_interval=30
             )
             
+            self.steal_job = self.redis.register_script(STEAL_JOB)
+            self.job_start = self.redis.register_script(JOB_START)
+            self.job_release = self.redis.register_script(JOB_RELEASE)
+            
             # Test connection
             await self.redis.ping()
             logger.info(f"✅ Connected to Redis at {self.redis_url}")
@@ -233,7 +365,7 @@ class MacM2Node:
                 },
                 "memory_gb": memory.total / (1024**3),
                 "capabilities": {
-                    "supported_models": ["resnet50", "bert-base", "gpt2"] if TORCH_AVAILABLE else [],
+                    "supported_models": self._supported_models(),
                     "frameworks": ["pytorch"] if TORCH_AVAILABLE else [],
                     "max_batch_size": 4,
                     "supports_metal": True,
@@ -270,7 +402,8 @@ class MacM2Node:
             "status": "available",
             "current_load": "0.0",
             "success_rate": "1.0",
-            "avg_latency": "50.0",
+            "slots": str(self.slots),
+            "warm_models": json.dumps(sorted(self.loaded_models)),
             "last_seen": datetime.utcnow().isoformat(),
             "redis_url": self.redis_url
         }
@@ -280,14 +413,43 @@ class MacM2Node:
             await self.redis.hset(node_key, key, value)
         await self.redis.expire(node_key, 60)
         await self.redis.sadd("native_nodes", self.node_id)
+        await self.redis.hset("nodes:region", self.node_id, self.region)
         
         logger.info(f"✅ Registered in Redis with key: {node_key}")
     
+    def _supported_models(self):
+        """Models advertised to the dispatcher (empty list = accepts anything)"""
+        return ["resnet50", "bert-base", "gpt2"] if TORCH_AVAILABLE else []
+    
     async def _prepare_models(self):
-        """Load AI models"""
-        logger.info("🤖 Loading AI models...")
+        """Preload the models listed in PRELOAD_MODELS, the rest load on first use"""
+        loadable = self._loadable_models()
+        preload = loadable if "all" in self.preload_models else [m for m in self.preload_models if m in loadable]
+        if not preload:
+            logger.info(f"🤖 Models load on first use: {', '.join(loadable) or 'none'}")
+            return
         
+        logger.info(f"🤖 Preloading AI models: {', '.join(preload)}")
+        for model_name in preload:
+            await self._load_model(model_name)
+    
+    def _loadable_models(self):
+        """Models this node knows how to load"""
+        models = []
         if TORCH_AVAILABLE:
+            models.append("resnet50")
+        if TRANSFORMERS_AVAILABLE:
+            models.append("gpt2")
+        return models
+    
+    async def _load_model(self, model_name: str) -> bool:
+        """Load a single model into memory, returns True if it is now warm"""
+        # Loading downloads weights and builds the model; keep heartbeats going meanwhile
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self._build_model, model_name)
+    
+    def _build_model(self, model_name: str) -> bool:
+        if model_name == "resnet50" and TORCH_AVAILABLE:
             try:
                 model = resnet50(pretrained=True)
                 model.eval()
@@ -314,17 +476,51 @@ class MacM2Node:
                     ])
                 }
                 logger.info("✅ ResNet50 loaded")
+                return True
                 
             except Exception as e:
                 logger.error(f"❌ Error loading PyTorch models: {e}")
         
-        if TRANSFORMERS_AVAILABLE:
+        elif model_name == "gpt2" and TRANSFORMERS_AVAILABLE:
             try:
                 gpt2_pipeline = pipeline("text-generation", model="gpt2", max_length=50)
                 self.loaded_models["gpt2"] = {"pipeline": gpt2_pipeline}
                 logger.info("✅ GPT-2 loaded")
+                return True
             except Exception as e:
                 logger.error(f"❌ Error loading Transformers models: {e}")
+        
+        return False
+    
+    async def _ensure_model_loaded(self, model_name: str):
+        """Cold-load a model on demand and record the cost"""
+        if model_name in self.loaded_models or model_name not in self._loadable_models():
+            return
+        
+        # Concurrent jobs for a cold model wait for a single load
+        lock = self.model_locks.setdefault(model_name, asyncio.Lock())
+        async with lock:
+            if model_name in self.loaded_models:
+                return
+            logger.info(f"🧊 Cold start: loading {model_name}")
+            load_start = time.time()
+            if not await self._load_model(model_name):
+                return
+            load_ms = (time.time() - load_start) * 1000
+        
+        try:
+            await self.redis.hincrby("metrics:cold_start", "loads", 1)
+            await self.redis.hincrbyfloat("metrics:cold_start", "load_ms_total", load_ms)
+            await self._publish_warm_models()
+        except Exception as e:
+            logger.warning(f"⚠️ Failed to record cold start metrics: {e}")
+        
+        logger.info(f"✅ {model_name} cold-loaded in {load_ms:.0f}ms")
+    
+    async def _publish_warm_models(self):
+        """Advertise the warm model set so the dispatcher can prefer this node"""
+        node_key = f"node:{self.node_id}:{self.region}:info"
+        await self.redis.hset(node_key, "warm_models", json.dumps(sorted(self.loaded_models)))
     
     async def _job_polling_loop(self):
         """Poll for jobs with connection recovery"""
@@ -337,8 +533,11 @@ class MacM2Node:
                 job_data = await self.redis.brpop(job_key, timeout=1)
                 
                 if job_data:
-                    job = json.loads(job_data[1])
-                    await self._execute_job(job)
+                    await self._run_delivery(json.loads(job_data[1]))
+                elif self.work_stealing:
+                    delivery = await self._steal_job()
+                    if delivery:
+                        await self._run_delivery(delivery)
                 
                 consecutive_errors = 0  # Reset error counter on success
                 
@@ -357,6 +556,64 @@ class MacM2Node:
                 
                 await asyncio.sleep(min(consecutive_errors, 10))  # Exponential backoff
     
+    async def _control_loop(self):
+        """Listen on node:{node_id}:control for commands such as job cancellation"""
+        channel = f"node:{self.node_id}:control"
+        while self.running:
+            try:
+                pubsub = self.redis.pubsub()
+                await pubsub.subscribe(channel)
+                async for message in pubsub.listen():
+                    if message["type"] != "message":
+                        continue
+                    command = json.loads(message["data"])
+                    if command.get("type") == "cancel":
+                        self.cancelled_jobs.add(command["job_id"])
+                        logger.info(f"🛑 Cancel requested for job {command['job_id']}")
+            except Exception as e:
+                logger.error(f"Error in control channel: {e}")
+                await asyncio.sleep(5)
+    
+    def _check_cancelled(self, job_id: str):
+        if job_id in self.cancelled_jobs:
+            raise JobCancelled(job_id)
+    
+    async def _steal_job(self) -> Optional[Dict[str, Any]]:
+        """Idle: take a job (or batch) this node can run from a backed-up peer in our region"""
+        peers = [
+            node_id for node_id in await self.redis.smembers("native_nodes")
+            if node_id != self.node_id
+            and await self.redis.hget("nodes:region", node_id) == self.region
+        ]
+        if not peers:
+            return None
+        
+        # The script also moves the assignments, slots and load over to this node
+        stolen = await self.steal_job(
+            keys=["nodes:load", *[f"node_jobs:{node_id}" for node_id in peers]],
+            args=[self.node_id, json.dumps(self._supported_models()), self.steal_min_queue,
+                  self.slots, self.assignment_ttl, time.time(), *peers]
+        )
+        if not stolen:
+            return None
+        
+        victim = peers[int(stolen[0]) - 1]
+        delivery = json.loads(stolen[1])
+        jobs = delivery.get("jobs", [delivery])
+        
+        logger.info(f"🦝 Stole {len(jobs)} job(s) from {victim}")
+        return delivery
+    
+    async def _run_delivery(self, delivery: Dict[str, Any]):
+        """Run a single job or a batch envelope from the dispatcher"""
+        if "jobs" not in delivery:
+            await self._execute_job(delivery)
+            return
+        
+        logger.info(f"📦 Batch {delivery['batch_id']}: {len(delivery['jobs'])} {delivery['model_name']} jobs")
+        for job in delivery["jobs"]:
+            await self._execute_job(job)
+    
     async def _heartbeat_loop(self):
         """Send heartbeats with connection recovery"""
         consecutive_errors = 0
@@ -376,6 +633,7 @@ class MacM2Node:
                     "memory_usage": str(memory.percent),
                     "success_rate": str(success_rate),
                     "total_jobs": str(self.total_jobs),
+                    "warm_models": json.dumps(sorted(self.loaded_models)),
                     "last_seen": datetime.utcnow().isoformat()
                 }
                 
@@ -407,18 +665,33 @@ class MacM2Node:
         model_name = job["model_name"]
         input_data = job.get("input_data", {})
         
+        # Cancelled by the client, or a hedged copy whose twin already finished
+        if await self.redis.exists(f"job:{job_id}:cancelled"):
+            self.cancelled_jobs.discard(job_id)
+            # The cancel may have come before this job was assigned to us: give
+            # the slot back now rather than at the assignment TTL, where the
+            # reconciler would count it as our timeout
+            assignment = f"job:{job_id}:hedge_assigned" if job.get("hedge") else f"job:{job_id}:assigned"
+            await self.job_release(keys=[assignment, "nodes:load"], args=[job_id])
+            logger.info(f"⏭️ Skipping cancelled job {job_id}")
+            return
+        
         logger.info(f"🚀 Executing job {job_id} with model {model_name}")
         start_time = time.time()
+        await self._mark_started(job_id, start_time)
         
         try:
             self.total_jobs += 1
+            await self._ensure_model_loaded(model_name)
+            await self._publish_partial(job_id, {"type": "progress", "stage": "running"})
             
             if model_name == "resnet50" and "resnet50" in self.loaded_models:
                 result = await self._execute_resnet50(input_data)
             elif model_name == "gpt2" and "gpt2" in self.loaded_models:
-                result = await self._execute_gpt2(input_data)
+                result = await self._execute_gpt2(input_data, job_id)
             else:
                 await asyncio.sleep(0.5)
+                self._check_cancelled(job_id)
                 result = {
                     "model": model_name,
                     "message": f"Simulated execution on Mac M2",
@@ -429,16 +702,28 @@ class MacM2Node:
                     }
                 }
             
+            # Single-step models cannot stop midway; drop their result instead
+            self._check_cancelled(job_id)
             execution_time = time.time() - start_time
             self.successful_jobs += 1
             
-            await self._send_result(job_id, True, result, execution_time)
+            await self._send_result(job, True, result, execution_time)
+            await self._publish_partial(job_id, {"type": "end", "status": "completed"})
             logger.info(f"✅ Job {job_id} completed in {execution_time:.2f}s")
             
+        except JobCancelled:
+            # The gateway already released our slot and finalized the job
+            await self._publish_partial(job_id, {"type": "end", "status": "cancelled"})
+            logger.info(f"🛑 Job {job_id} cancelled after {time.time() - start_time:.2f}s")
+            
         except Exception as e:
             execution_time = time.time() - start_time
-            await self._send_result(job_id, False, None, execution_time, str(e))
+            await self._send_result(job, False, None, execution_time, str(e))
+            await self._publish_partial(job_id, {"type": "end", "status": "failed", "error": str(e)})
             logger.error(f"❌ Job {job_id} failed: {e}")
+        
+        finally:
+            self.cancelled_jobs.discard(job_id)
     
     async def _execute_resnet50(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
         """Execute ResNet50 inference"""
@@ -469,30 +754,90 @@ class MacM2Node:
             "framework": "pytorch_mps" if device.type == "mps" else "pytorch_cpu"
         }
     
-    async def _execute_gpt2(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
-        """Execute GPT-2 text generation"""
+    async def _execute_gpt2(self, input_data: Dict[str, Any], job_id: str) -> Dict[str, Any]:
+        """Execute GPT-2 text generation, publishing tokens as they are produced"""
         prompt = input_data.get("prompt", "Hello, I am")
         generator = self.loaded_models["gpt2"]["pipeline"]
-        result = generator(prompt, max_length=50, num_return_sequences=1, do_sample=True)
+        tokenizer = generator.tokenizer
+        loop = asyncio.get_running_loop()
+        
+        # generate() runs in a worker thread and feeds the streamer; the
+        # timeout keeps us from waiting forever if generation dies
+        streamer = TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True, timeout=60)
+        inputs = tokenizer(prompt, return_tensors="pt").to(generator.model.device)
+        # Checked by generate() after every token, so a cancel stops the thread too
+        stop_if_cancelled = StoppingCriteriaList([lambda input_ids, scores, **kwargs: job_id in self.cancelled_jobs])
+        generation = loop.run_in_executor(None, lambda: generator.model.generate(
+            **inputs, streamer=streamer, max_length=50, do_sample=True,
+            pad_token_id=tokenizer.eos_token_id, stopping_criteria=stop_if_cancelled
+        ))
+        
+        generated_text = prompt
+        while True:
+            token = await loop.run_in_executor(None, next, streamer, None)
+            if token is None:
+                break
+            if token:
+                generated_text += token
+                await self._publish_partial(job_id, {"type": "token", "text": token})
+        await generation
+        self._check_cancelled(job_id)
         
         return {
             "model": "gpt2",
             "prompt": prompt,
-            "generated_text": result[0]["generated_text"],
+            "generated_text": generated_text,
             "framework": "transformers"
         }
     
-    async def _send_result(self, job_id: str, success: bool, result: Optional[Dict], 
+    async def _mark_started(self, job_id: str, start_time: float):
+        """Move the job to running, log the started event and record the start time
+
+        The dispatcher measures stragglers from that time.
+        """
+        # Same event log partitioning as shared.queues
+        stream = f"job_events:p{zlib.crc32(job_id.encode()) % self.event_partitions}"
+        try:
+            await self.job_start(
+                keys=[f"job:{job_id}:started", f"job:{job_id}:state", "metrics:jobs", stream],
+                args=[start_time, self.assignment_ttl, job_id, self.node_id, self.state_ttl]
+            )
+        except Exception as e:
+            logger.warning(f"⚠️ Failed to record the start of job {job_id}: {e}")
+    
+    async def _publish_partial(self, job_id: str, chunk: Dict[str, Any]):
+        """Append a chunk to the job's partial result stream (job:{id}:partial)"""
+        key = f"job:{job_id}:partial"
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.xadd(key, {"type": chunk["type"], "data": json.dumps(chunk)},
+                      maxlen=self.partial_maxlen, approximate=True)
+            pipe.expire(key, self.partial_ttl)
+            await pipe.execute()
+        except Exception as e:
+            # Partial results are best effort; the final result still goes out
+            logger.warning(f"⚠️ Failed to publish partial result for job {job_id}: {e}")
+    
+    async def _send_result(self, job: Dict[str, Any], success: bool, result: Optional[Dict], 
                           execution_time: float, error: Optional[str] = None):
         """Send result to aggregator"""
+        job_id = job["job_id"]
         result_data = {
             "job_id": job_id,
             "node_id": self.node_id,
+            "node_type": "mac_m2_native",
+            "region": self.region,
+            "model_name": job["model_name"],
+            "input_size": str(len(json.dumps(job.get("input_data", {})))),
             "success": str(success).lower(),
             "execution_time": str(execution_time),
             "timestamp": datetime.utcnow().isoformat()
         }
         
+        if job.get("deadline_ts") is not None:
+            result_data["deadline_ts"] = str(job["deadline_ts"])
+        if job.get("cache_key"):
+            result_data["cache_key"] = job["cache_key"]
         if success and result:
             result_data["result"] = json.dumps(result)
         if error:
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""Compare the per-job Redis round trips of the old and atomic dispatch paths
+
+Run from the repository root against a disposable Redis:
+    python -m scripts.dispatch_benchmark [jobs]
+"""
+import asyncio
+import json
+import sys
+import time
+
+import aioredis
+
+from shared.redis_scripts import DISPATCH_ASSIGN, LEASE_ACK, LEASE_ACQUIRE
+
+PREFIX = "bench:dispatch"
+QUEUE = f"{PREFIX}:queue"
+PROCESSING = f"{QUEUE}:processing"
+LEASES = f"{QUEUE}:leases"
+LOAD = f"{PREFIX}:nodes:load"
+NODE_ID = "bench-node"
+NODE_JOBS = f"{PREFIX}:node_jobs:{NODE_ID}"
+NODE_SLOTS = f"{PREFIX}:node_slots:{NODE_ID}"
+
+
+async def fill_and_lease(redis, acquire, total):
+    jobs = []
+    for i in range(total):
+        await redis.lpush(QUEUE, json.dumps({"job_id": f"job_{i}", "model_name": "resnet50"}))
+    for _ in range(total):
+        _, job_json = await acquire(keys=[QUEUE, PROCESSING, LEASES], args=[9999999999])
+        jobs.append(job_json)
+    return jobs
+
+
+async def separate_commands(redis, ack, jobs):
+    """Previous dispatch path: one round trip per step"""
+    for job_json in jobs:
+        job_id = json.loads(job_json)["job_id"]
+        await redis.hincrby(LOAD, NODE_ID, 1)
+        await redis.lpush(NODE_JOBS, job_json)
+        await redis.setex(f"{PREFIX}:job:{job_id}:assigned", 300, NODE_ID)
+        await ack(keys=[QUEUE, PROCESSING, LEASES], args=[job_json])
+    return 4
+
+
+async def atomic_script(redis, dispatch, jobs):
+    """DISPATCH_ASSIGN: one round trip per job"""
+    for job_json in jobs:
+        job_id = json.loads(job_json)["job_id"]
+        await dispatch(
+            keys=[LOAD, NODE_JOBS, NODE_SLOTS, PROCESSING, LEASES, f"{PREFIX}:job:{job_id}:assigned"],
+            args=[NODE_ID, job_json, 300, time.time(), len(jobs), job_json]
+        )
+    return 1
+
+
+async def cleanup(redis):
+    keys = await redis.keys(f"{PREFIX}:*")
+    if keys:
+        await redis.delete(*keys)
+
+
+async def benchmark(total=2000, redis_url="redis://localhost:6379"):
+    print(f"Running dispatch benchmark: {total} jobs")
+    redis = aioredis.from_url(redis_url, encoding="utf-8", decode_responses=True)
+    acquire = redis.register_script(LEASE_ACQUIRE)
+    ack = redis.register_script(LEASE_ACK)
+    dispatch = redis.register_script(DISPATCH_ASSIGN)
+
+    try:
+        for name, run, script in (("separate commands", separate_commands, ack),
+                                  ("DISPATCH_ASSIGN", atomic_script, dispatch)):
+            await cleanup(redis)
+            jobs = await fill_and_lease(redis, acquire, total)
+
+            start = time.time()
+            round_trips = await run(redis, script, jobs)
+            elapsed = time.time() - start
+
+            print(f"{name}:")
+            print(f"  Round trips/job: {round_trips}")
+            print(f"  Average per job: {elapsed / total * 1000:.3f}ms")
+            print(f"  Jobs/sec: {total / elapsed:.0f}")
+    finally:
+        await cleanup(redis)
+        await redis.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 2000))
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""Replay or compact the job lifecycle event log
+
+Rebuild derived views after a failure (run from the repository root):
+    python -m scripts.job_events replay [--views status,metrics,postgres] [--since TS]
+    python -m scripts.job_events compact [--older-than SECONDS]
+
+Views:
+    status    job:{id}:state keys used by the job state machine
+    metrics   terminal counts in metrics:jobs
+    postgres  status and assigned node of every job in the jobs table
+"""
+import argparse
+import asyncio
+import time
+
+import asyncpg
+import redis.asyncio as redis
+
+from shared.config import Config
+from shared.job_events import ASSIGNED, STARTED, SUBMITTED, EventLog
+from shared.models import JobStatus, TERMINAL_STATUSES
+
+VIEWS = ('status', 'metrics', 'postgres')
+TERMINAL = {status.value for status in TERMINAL_STATUSES}
+# Event -> job status
+STATUS_OF = {SUBMITTED: JobStatus.PENDING.value, ASSIGNED: JobStatus.ASSIGNED.value,
+             STARTED: JobStatus.RUNNING.value}
+
+BULK_STATUS = """
+    UPDATE jobs AS j
+    SET status = r.status,
+        assigned_node = COALESCE(r.node_id, j.assigned_node),
+        updated_at = NOW()
+    FROM unnest($1::text[], $2::text[], $3::text[]) AS r(job_id, status, node_id)
+    WHERE j.job_id = r.job_id
+"""
+
+
+def fold(jobs, counts, entry):
+    """Apply one event to the per-job final state and the terminal counts"""
+    name = entry['event']
+    status = STATUS_OF.get(name, name)
+    current = jobs.get(entry['job_id'])
+
+    # A terminal status is final even if a late event follows it
+    if current and current['status'] in TERMINAL:
+        return
+    jobs[entry['job_id']] = {
+        'status': status,
+        'owner': entry.get('owner', 'replay'),
+        'node_id': entry.get('node_id') or (current or {}).get('node_id')
+    }
+    if status in TERMINAL:
+        counts[status] = counts.get(status, 0) + 1
+
+
+async def rebuild_status(client, jobs):
+    pipe = client.pipeline(transaction=False)
+    for job_id, job in jobs.items():
+        pipe.set(f'job:{job_id}:state', f"{job['status']}|{job['owner']}", ex=Config.JOB_STATE_TTL)
+        if len(pipe) >= 1000:
+            await pipe.execute()
+    await pipe.execute()
+
+
+async def rebuild_metrics(client, counts):
+    pipe = client.pipeline()
+    pipe.hdel('metrics:jobs', *TERMINAL)
+    if counts:
+        pipe.hset('metrics:jobs', mapping=counts)
+    await pipe.execute()
+
+
+async def rebuild_postgres(jobs):
+    pool = await asyncpg.create_pool(Config.POSTGRES_URL)
+    rows = [(job_id, job['status'], job['node_id']) for job_id, job in jobs.items()]
+    try:
+        async with pool.acquire() as conn:
+            for i in range(0, len(rows), 1000):
+                await conn.execute(BULK_STATUS, *[list(column) for column in zip(*rows[i:i + 1000])])
+    finally:
+        await pool.close()
+
+
+async def replay(views, since=None):
+    client = redis.from_url(Config.REDIS_URL, decode_responses=True)
+    jobs, counts = {}, {}
+    events = 0
+    start = time.time()
+
+    try:
+        async for entry in EventLog(client).replay(since):
+            fold(jobs, counts, entry)
+            events += 1
+        print(f"Replayed {events} events for {len(jobs)} jobs in {time.time() - start:.2f}s")
+
+        if 'status' in views:
+            await rebuild_status(client, jobs)
+            print(f"  status: {len(jobs)} state keys")
+        if 'metrics' in views:
+            await rebuild_metrics(client, counts)
+            print(f"  metrics: {counts}")
+        if 'postgres' in views and jobs:
+            await rebuild_postgres(jobs)
+            print(f"  postgres: {len(jobs)} jobs")
+    finally:
+        await client.close()
+
+
+async def compact(older_than):
+    client = redis.from_url(Config.REDIS_URL, decode_responses=True)
+    try:
+        dropped = await EventLog(client).compact(time.time() - older_than)
+        print(f"Compaction dropped {dropped} events")
+    finally:
+        await client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Job event log tools")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    replay_parser = commands.add_parser('replay', help="rebuild derived views from the log")
+    replay_parser.add_argument('--views', default=','.join(VIEWS),
+                               help="comma-separated subset of " + ', '.join(VIEWS))
+    replay_parser.add_argument('--since', type=float, help="only events at or after this timestamp")
+
+    compact_parser = commands.add_parser('compact', help="keep only the last event of old jobs")
+    compact_parser.add_argument('--older-than', type=float, default=Config.EVENT_COMPACT_AFTER,
+                                help="seconds (default EVENT_COMPACT_AFTER)")
+
+    args = parser.parse_args()
+    if args.command == 'replay':
+        views = set(args.views.split(','))
+        unknown = views - set(VIEWS)
+        if unknown:
+            parser.error(f"unknown views: {', '.join(sorted(unknown))}")
+        if args.since is not None and 'metrics' in views:
+            parser.error("metrics are totals and need a full replay (drop --since or the metrics view)")
+        asyncio.run(replay(views, args.since))
+    else:
+        asyncio.run(compact(args.older_than))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""Compare row-by-row result UPDATEs with the micro-batched ResultWriter
+
+Uses a scratch jobs_bench table in the configured PostgreSQL:
+    python -m scripts.result_writer_benchmark [results] [flush_size]
+"""
+import asyncio
+import sys
+import time
+
+import asyncpg
+
+from shared.config import Config
+from services.aggregator.result_writer import ResultWriter
+
+TABLE = "jobs_bench"
+
+
+async def reset_table(pool, total):
+    async with pool.acquire() as conn:
+        await conn.execute(f"DROP TABLE IF EXISTS {TABLE}")
+        await conn.execute(f"""
+            CREATE TABLE {TABLE} (
+                job_id VARCHAR(64) PRIMARY KEY,
+                status VARCHAR(20) DEFAULT 'assigned',
+                result TEXT,
+                error_message TEXT,
+                execution_time_ms INTEGER,
+                completed_at TIMESTAMP,
+                updated_at TIMESTAMP
+            )
+        """)
+        await conn.executemany(
+            f"INSERT INTO {TABLE} (job_id) VALUES ($1)", [(f"job_{i}",) for i in range(total)]
+        )
+
+
+async def row_by_row(pool, total):
+    for i in range(total):
+        async with pool.acquire() as conn:
+            await conn.execute(f"""
+                UPDATE {TABLE}
+                SET status = $1, result = $2, error_message = $3, execution_time_ms = $4,
+                    completed_at = NOW(), updated_at = NOW()
+                WHERE job_id = $5
+            """, 'completed', '{"ok": true}', None, 50, f"job_{i}")
+
+
+async def micro_batched(pool, total, flush_size):
+    writer = ResultWriter(pool, flush_size, Config.RESULT_FLUSH_MS / 1000, table=TABLE)
+    flusher = asyncio.ensure_future(writer.run())
+    futures = [writer.add(f"job_{i}", 'completed', '{"ok": true}', None, 50) for i in range(total)]
+    await writer.flush()
+    await asyncio.gather(*futures)
+    writer.running = False
+    flusher.cancel()
+
+
+async def benchmark(total=5000, flush_size=Config.RESULT_FLUSH_SIZE):
+    print(f"Running result writer benchmark: {total} results, batches of {flush_size}")
+    pool = await asyncpg.create_pool(Config.POSTGRES_URL)
+
+    try:
+        for name, run in (("row-by-row UPDATE", lambda: row_by_row(pool, total)),
+                          ("UPDATE ... FROM unnest", lambda: micro_batched(pool, total, flush_size))):
+            await reset_table(pool, total)
+            start = time.time()
+            await run()
+            elapsed = time.time() - start
+
+            async with pool.acquire() as conn:
+                written = await conn.fetchval(f"SELECT COUNT(*) FROM {TABLE} WHERE status = 'completed'")
+
+            print(f"{name}:")
+            print(f"  Rows written: {written}/{total}")
+            print(f"  Total time: {elapsed:.2f}s")
+            print(f"  Results/sec: {total / elapsed:.0f}")
+    finally:
+        async with pool.acquire() as conn:
+            await conn.execute(f"DROP TABLE IF EXISTS {TABLE}")
+        await pool.close()
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:3]]
+    asyncio.run(benchmark(*args))
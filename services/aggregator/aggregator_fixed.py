@@ -0,0 +1,497 @@
+#!/usr/bin/env python3
+"""Aggregator service amélioré pour SynapseGrid"""
+
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+
+import asyncpg
+import redis.asyncio as redis
+from prometheus_client import Gauge, start_http_server
+from redis.exceptions import ResponseError
+
+from shared.config import Config
+from shared.latency_sketch import LogHistogram, WindowedSketch
+from shared.job_events import EventLog, entry_key, transition_call
+from shared.models import JobStatus
+from shared.queues import job_queue_key
+from shared.redis_scripts import EXEC_STATS_UPDATE, JOB_COMPLETE, JOB_TRANSITION, REPUTATION_UPDATE
+from shared.reputation import FAILURE, SUCCESS, TIMEOUT, reputation_key
+from shared.result_cache import ResultCache
+from shared.result_store import ResultStore
+from shared.runtime_predictor import RUNTIME_STATS_KEY, input_size, training_keys
+from services.aggregator.result_writer import ResultWriter
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+RESULTS_STREAM = 'job_results'
+DEAD_RESULTS_STREAM = 'job_results:dead'
+LATENCY_SKETCHES = 'metrics:latency:sketches'
+LATENCY_SUMMARY = 'metrics:latency'
+QUANTILES = (('p50', 0.5), ('p95', 0.95), ('p99', 0.99))
+
+latency_gauge = Gauge('synapse_job_latency_seconds', 'Job execution latency over the sliding window',
+                      ['dimension', 'value', 'quantile'])
+throughput_gauge = Gauge('synapse_job_throughput', 'Completed jobs per second over the sliding window',
+                         ['dimension', 'value'])
+
+
+class Aggregator:
+    def __init__(self):
+        self.redis = None
+        self.db_pool = None
+        self.running = True
+        self.consumer_prefix = f"{socket.gethostname()}-{os.getpid()}"
+        self.exec_stats_update = None
+        self.job_complete = None
+        self.job_transition = None
+        self.reputation_update = None
+        self.writer = None
+        self.results = None
+        self.cache = None
+        self.events = None
+        self.latency = {}  # (dimension, value) -> WindowedSketch
+
+    async def start(self):
+        """Initialize connections"""
+        self.redis = redis.from_url(Config.REDIS_URL, decode_responses=True)
+        await self.redis.ping()
+        logger.info("✅ Connected to Redis")
+
+        self.db_pool = await asyncpg.create_pool(Config.POSTGRES_URL)
+        logger.info("✅ Connected to PostgreSQL")
+        self.writer = ResultWriter(self.db_pool, Config.RESULT_FLUSH_SIZE, Config.RESULT_FLUSH_MS / 1000)
+        self.results = ResultStore(self.redis, self.db_pool)
+        self.cache = ResultCache(self.redis)
+        self.events = EventLog(self.redis)
+
+        self.exec_stats_update = self.redis.register_script(EXEC_STATS_UPDATE)
+        self.job_complete = self.redis.register_script(JOB_COMPLETE)
+        self.job_transition = self.redis.register_script(JOB_TRANSITION)
+        self.reputation_update = self.redis.register_script(REPUTATION_UPDATE)
+        await self.create_group()
+
+        if not await self.redis.exists(RUNTIME_STATS_KEY):
+            await self.bootstrap_runtime_stats()
+
+    async def update_exec_stats(self, node_id, model_name, execution_time):
+        """Fold one execution time into the node's EWMA for that model"""
+        await self.exec_stats_update(
+            keys=[f'node:{node_id}:exec_stats'],
+            args=[model_name, execution_time, Config.EXEC_STATS_ALPHA]
+        )
+
+    async def update_reputation(self, node_id, fields, success, execution_time):
+        """Record the outcome of a result against the node that produced it
+
+        A success that missed its deadline counts as a timeout.
+        """
+        outcome = SUCCESS if success else FAILURE
+        if success and fields.get('deadline_ts') and time.time() > float(fields['deadline_ts']):
+            outcome = TIMEOUT
+        await self.reputation_update(
+            keys=[reputation_key(node_id), f'node:{node_id}:exec_stats'],
+            args=[time.time(), Config.REPUTATION_HALF_LIFE, outcome, 1,
+                  execution_time if success else '', fields.get('model_name', '')]
+        )
+
+    async def train_runtime(self, model_name, node_type, size, execution_time):
+        """Feed one completed job to the runtime predictor"""
+        for key in training_keys(model_name, node_type, size):
+            await self.exec_stats_update(
+                keys=[RUNTIME_STATS_KEY],
+                args=[key, execution_time, Config.EXEC_STATS_ALPHA]
+            )
+
+    async def bootstrap_runtime_stats(self):
+        """Train the runtime predictor from completed jobs in PostgreSQL"""
+        async with self.db_pool.acquire() as conn:
+            rows = await conn.fetch("""
+                SELECT j.model_name, n.node_type, j.input_data, j.execution_time_ms
+                FROM jobs j
+                LEFT JOIN nodes n ON n.node_id = j.assigned_node
+                WHERE j.status = 'completed'
+                AND j.execution_time_ms IS NOT NULL
+                ORDER BY j.completed_at DESC
+                LIMIT $1
+            """, Config.RUNTIME_BOOTSTRAP_JOBS)
+
+        # Oldest first so the EWMA ends on the most recent runtimes
+        for row in reversed(rows):
+            await self.train_runtime(
+                row['model_name'], row['node_type'],
+                input_size(row['input_data']), row['execution_time_ms'] / 1000
+            )
+        logger.info(f"⏱️ Runtime predictor trained on {len(rows)} completed jobs")
+
+    async def transition(self, job_id, status, owner, node_id=None):
+        keys, args = transition_call(job_id, status, owner, node_id)
+        return await self.job_transition(keys=keys, args=args)
+
+    async def finalize(self, job_id, node_id, status, entry_id):
+        """Move the job to its terminal status, exactly once
+
+        Returns 1 for the first result, 2 when this same stream entry is
+        redelivered (the transition already happened but its writes may not
+        have), and 0 for a duplicate or late result, which must be dropped.
+        Retries, hedged copies and redeliveries can all produce duplicates;
+        for hedged jobs the first result wins and the other copy is cancelled.
+        """
+        outcome = await self.transition(job_id, status, entry_id, node_id)
+        hedged = await self.redis.get(f'job:{job_id}:hedged')
+        if hedged is not None and outcome == 1:
+            await self.cancel_hedge_loser(job_id, node_id)
+
+        if outcome == 0:
+            await self.redis.hincrby('metrics:jobs', 'duplicates', 1)
+            if hedged is not None:
+                await self.redis.hincrby('metrics:hedging', 'lost', 1)
+            logger.info(f"🪞 Dropping duplicate result for {job_id} from {node_id}")
+        elif outcome == 1 and hedged is not None and node_id != hedged:
+            await self.redis.hincrby('metrics:hedging', 'won', 1)
+        return outcome
+
+    async def cancel_hedge_loser(self, job_id, winner):
+        """Stop the copy that lost and free the slots of both copies"""
+        assignment_keys = [f'job:{job_id}:assigned', f'job:{job_id}:hedge_assigned']
+        nodes = await self.redis.mget(assignment_keys)
+
+        # Nodes skip cancelled jobs they have not started yet
+        await self.redis.setex(f'job:{job_id}:cancelled', 3600, winner or '')
+        for node_id in set(nodes) - {None, winner}:
+            await self.redis.publish(f'node:{node_id}:control', json.dumps({'type': 'cancel', 'job_id': job_id}))
+        for key in assignment_keys:
+            await self.job_complete(keys=[key, 'nodes:load'], args=[job_id])
+
+    async def record_deadline(self, deadline_ts, execution_time):
+        """Count deadline misses and the node time they consumed"""
+        await self.redis.hincrby('metrics:deadline', 'finished', 1)
+        if time.time() > deadline_ts:
+            await self.redis.hincrby('metrics:deadline', 'missed', 1)
+            await self.redis.hincrbyfloat('metrics:deadline', 'wasted_compute_s', execution_time)
+
+    def record_latency(self, fields, execution_time):
+        """Add one execution time to the overall, model, node and region sketches"""
+        now = time.time()
+        series = [
+            ('all', 'all'),
+            ('model', fields.get('model_name') or 'unknown'),
+            ('node', fields.get('node_id') or 'unknown'),
+            ('region', fields.get('region') or Config.DEFAULT_REGION)
+        ]
+        for key in series:
+            sketch = self.latency.get(key)
+            if sketch is None:
+                sketch = self.latency[key] = WindowedSketch(Config.LATENCY_WINDOW, Config.LATENCY_WINDOW_SLOTS)
+            sketch.record(execution_time, now)
+
+    async def publish_latency(self):
+        """Share our window sketches, then publish quantiles merged across aggregators
+
+        Every aggregator writes its own sketches under metrics:latency:sketches:{id}
+        with a short TTL and merges all of them, so each one publishes the
+        same fleet-wide numbers.
+        """
+        now = time.time()
+        local = {}
+        for (dimension, value), sketch in list(self.latency.items()):
+            snapshot = sketch.snapshot(now)
+            if snapshot is None:
+                # Drop series (e.g. departed nodes) that left the window
+                del self.latency[(dimension, value)]
+                continue
+            local[f'{dimension}:{value}'] = json.dumps(snapshot.to_dict())
+
+        own_key = f'{LATENCY_SKETCHES}:{self.consumer_prefix}'
+        pipe = self.redis.pipeline()
+        pipe.delete(own_key)
+        if local:
+            pipe.hset(own_key, mapping=local)
+            pipe.expire(own_key, int(Config.LATENCY_PUBLISH_INTERVAL * 3))
+        await pipe.execute()
+
+        merged = {}
+        async for key in self.redis.scan_iter(match=f'{LATENCY_SKETCHES}:*'):
+            for name, data in (await self.redis.hgetall(key)).items():
+                merged.setdefault(name, LogHistogram()).merge(LogHistogram.from_dict(json.loads(data)))
+
+        summary = {}
+        latency_gauge.clear()
+        throughput_gauge.clear()
+        for name, histogram in merged.items():
+            dimension, value = name.split(':', 1)
+            throughput = histogram.count / Config.LATENCY_WINDOW
+            quantiles = {label: histogram.quantile(q) for label, q in QUANTILES}
+            summary[name] = json.dumps({
+                **{label: round(seconds * 1000, 2) for label, seconds in quantiles.items()},
+                'mean': round(histogram.mean() * 1000, 2),
+                'throughput': round(throughput, 3),
+                'count': histogram.count
+            })
+            for label, seconds in quantiles.items():
+                latency_gauge.labels(dimension, value, label).set(seconds)
+            throughput_gauge.labels(dimension, value).set(throughput)
+
+        overall = merged.get('all:all', LogHistogram())
+        pipe = self.redis.pipeline()
+        pipe.delete(LATENCY_SUMMARY)
+        if summary:
+            pipe.hset(LATENCY_SUMMARY, mapping=summary)
+        pipe.set('metrics:avg_latency', round(overall.mean() * 1000, 2))
+        pipe.set('metrics:throughput', round(overall.count / Config.LATENCY_WINDOW, 3))
+        await pipe.execute()
+
+    async def latency_loop(self):
+        while self.running:
+            await asyncio.sleep(Config.LATENCY_PUBLISH_INTERVAL)
+            try:
+                await self.publish_latency()
+            except Exception as e:
+                logger.error(f"Error publishing latency metrics: {e}")
+
+    async def handle_result(self, entry_id, fields):
+        """Finalize one job result from the stream
+
+        Returns a future for the PostgreSQL write, or None for dropped results.
+        """
+        job_id = fields['job_id']
+        node_id = fields.get('node_id')
+        success = fields.get('success') == 'true'
+        execution_time = float(fields.get('execution_time', 0))
+        status = JobStatus.COMPLETED if success else JobStatus.FAILED
+
+        outcome = await self.finalize(job_id, node_id, status, entry_id)
+        if outcome == 0:
+            return None
+
+        # A redelivered entry (2) already took its statistics and counters
+        first = outcome == 1
+        if first and node_id:
+            await self.update_reputation(node_id, fields, success, execution_time)
+        if first and success and node_id and fields.get('model_name'):
+            await self.update_exec_stats(node_id, fields['model_name'], execution_time)
+            self.record_latency(fields, execution_time)
+            await self.train_runtime(
+                fields['model_name'], fields.get('node_type'),
+                int(fields.get('input_size', 0)), execution_time
+            )
+
+        if first and fields.get('deadline_ts'):
+            await self.record_deadline(float(fields['deadline_ts']), execution_time)
+
+        # Small results inline, bigger ones compressed in PostgreSQL (table or large object)
+        stored = await self.results.save(job_id, fields.get('result'))
+        # Release the assignment and its node slot (the dispatcher treats a
+        # missing assignment as a finished job)
+        await self.job_complete(keys=[f'job:{job_id}:assigned', 'nodes:load'], args=[job_id])
+
+        logger.info(f"✅ Result for {job_id} received ({'ok' if success else 'failed'}, {execution_time:.2f}s)")
+        writes = [self.writer.add(
+            job_id, status.value, stored, fields.get('error'), int(execution_time * 1000)
+        )]
+        if fields.get('cache_key'):
+            writes += await self.settle_cached(job_id, fields['cache_key'], success, fields.get('result'))
+        return asyncio.gather(*writes)
+
+    async def settle_cached(self, job_id, key, success, result):
+        """Fill the result cache and settle the jobs coalesced behind this one
+
+        On success the waiting jobs complete with the same result; on failure
+        they are requeued to run on their own. Returns their PostgreSQL writes.
+        """
+        if success and result is not None:
+            await self.cache.store(key, result)
+
+        writes = []
+        followers = await self.cache.release(key, job_id)
+        for follower in followers:
+            follower_id = follower['job_id']
+            if not success:
+                follower.pop('cache_key', None)
+                await self.redis.lpush(job_queue_key(follower['region'], follower_id), json.dumps(follower))
+                continue
+            if await self.transition(follower_id, JobStatus.COMPLETED, job_id):
+                stored = await self.results.save(follower_id, result)
+                writes.append(self.writer.add(follower_id, JobStatus.COMPLETED.value, stored, None, 0))
+
+        if followers:
+            logger.info(f"🧮 Settled {len(followers)} jobs coalesced behind {job_id}")
+        return writes
+
+    async def create_group(self):
+        """Create the consumer group, starting from the oldest retained result"""
+        try:
+            await self.redis.xgroup_create(RESULTS_STREAM, Config.AGGREGATOR_GROUP, id='0', mkstream=True)
+            logger.info(f"👥 Created consumer group {Config.AGGREGATOR_GROUP}")
+        except ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+
+    async def handle_entries(self, entries):
+        """Handle a batch of stream entries and acknowledge them in one XACK
+
+        Entries are acknowledged once their PostgreSQL write is committed.
+        Entries that fail stay pending and are retried by the reclaimer.
+        """
+        handled = []
+        writes = []
+        for entry_id, fields in entries:
+            try:
+                write = await self.handle_result(entry_id, fields)
+            except Exception as e:
+                logger.error(f"Error handling result {entry_id}: {e}")
+                continue
+            if write is None:
+                handled.append(entry_id)
+            else:
+                writes.append((entry_id, write))
+
+        outcomes = await asyncio.gather(*[write for _, write in writes], return_exceptions=True)
+        for (entry_id, _), outcome in zip(writes, outcomes):
+            if isinstance(outcome, Exception):
+                logger.error(f"Error storing result {entry_id}: {outcome}")
+            else:
+                handled.append(entry_id)
+
+        if handled:
+            await self.redis.xack(RESULTS_STREAM, Config.AGGREGATOR_GROUP, *handled)
+
+    async def consume(self, consumer):
+        """One consumer of the group"""
+        while self.running:
+            try:
+                response = await self.redis.xreadgroup(
+                    Config.AGGREGATOR_GROUP, consumer, {RESULTS_STREAM: '>'},
+                    count=Config.RESULTS_READ_COUNT, block=Config.RESULTS_BLOCK_MS
+                )
+                for _, entries in response:
+                    await self.handle_entries(entries)
+
+            except Exception as e:
+                logger.error(f"Error in consumer {consumer}: {e}")
+                await asyncio.sleep(5)
+
+    async def reclaim_pending(self, consumer):
+        """Take over results left pending by dead or failing consumers"""
+        pending = await self.redis.xpending_range(
+            RESULTS_STREAM, Config.AGGREGATOR_GROUP, min='-', max='+',
+            count=Config.RESULTS_READ_COUNT, idle=Config.RESULTS_CLAIM_IDLE_MS
+        )
+        if not pending:
+            return
+
+        # Give up on results that keep failing
+        dead = [p['message_id'] for p in pending if p['times_delivered'] >= Config.RESULTS_MAX_DELIVERIES]
+        if dead:
+            for entry_id in dead:
+                entries = await self.redis.xrange(RESULTS_STREAM, entry_id, entry_id)
+                await self.dead_letter(entry_id, entries[0][1] if entries else None)
+            await self.redis.xack(RESULTS_STREAM, Config.AGGREGATOR_GROUP, *dead)
+            logger.error(f"💀 Moved {len(dead)} undeliverable results to {DEAD_RESULTS_STREAM}")
+
+        retry = [p['message_id'] for p in pending if p['message_id'] not in dead]
+        if retry:
+            entries = await self.redis.xclaim(
+                RESULTS_STREAM, Config.AGGREGATOR_GROUP, consumer,
+                Config.RESULTS_CLAIM_IDLE_MS, retry
+            )
+            logger.info(f"♻️ Reclaimed {len(entries)} pending results")
+
+            # Entries deleted from the stream come back without fields
+            lost = [entry_id for entry_id, fields in entries if not fields]
+            if lost:
+                for entry_id in lost:
+                    await self.dead_letter(entry_id, None)
+                await self.redis.xack(RESULTS_STREAM, Config.AGGREGATOR_GROUP, *lost)
+                logger.error(f"💀 {len(lost)} pending results were deleted before being processed: "
+                             f"{', '.join(lost)}")
+            await self.handle_entries([entry for entry in entries if entry[1]])
+
+    async def dead_letter(self, entry_id, fields):
+        """Record a result we gave up on; fields is None when the entry itself is gone"""
+        await self.redis.xadd(DEAD_RESULTS_STREAM, fields or {'entry_id': entry_id, 'error': 'entry deleted'})
+
+    async def trim_results(self):
+        """Cap the stream without dropping results the group has not acknowledged
+
+        Once the stream exceeds RESULTS_STREAM_MAXLEN, entries below the
+        oldest pending one (or, with nothing pending, below the last delivered
+        one) are trimmed; undelivered and pending entries always stay.
+        """
+        if await self.redis.xlen(RESULTS_STREAM) <= Config.RESULTS_STREAM_MAXLEN:
+            return
+
+        floors = []
+        for group in await self.redis.xinfo_groups(RESULTS_STREAM):
+            floor = group['last-delivered-id']
+            if group['pending']:
+                floor = (await self.redis.xpending(RESULTS_STREAM, group['name']))['min']
+            floors.append(floor)
+        if not floors:
+            return
+
+        # An approximate MINID trim only drops whole nodes below the floor
+        await self.redis.xtrim(RESULTS_STREAM, minid=min(floors, key=entry_key), approximate=True)
+
+    async def maintenance_loop(self):
+        """Reclaim stale pending results and cap the stream length"""
+        consumer = f"{self.consumer_prefix}-reclaimer"
+        while self.running:
+            await asyncio.sleep(Config.RESULTS_CLAIM_INTERVAL)
+            try:
+                await self.reclaim_pending(consumer)
+                await self.trim_results()
+            except Exception as e:
+                logger.error(f"Error in aggregator maintenance: {e}")
+
+    async def event_archive_loop(self):
+        """Archive the job event log to disk and compact old segments, on one aggregator"""
+        owner = f"{self.consumer_prefix}-archiver"
+        last_compaction = 0
+        while self.running:
+            await asyncio.sleep(Config.EVENT_ARCHIVE_INTERVAL)
+            try:
+                if not await self.events.acquire_archiver(owner, Config.EVENT_ARCHIVE_INTERVAL * 3):
+                    continue
+                await self.events.archive()
+                if time.time() - last_compaction > 3600:
+                    last_compaction = time.time()
+                    dropped = await self.events.compact()
+                    if dropped:
+                        logger.info(f"🗜️ Compacted {dropped} job events")
+            except Exception as e:
+                logger.error(f"Error archiving job events: {e}")
+
+    async def process_results(self):
+        """Main processing loop"""
+        logger.info(f"📊 Aggregator started - {Config.AGGREGATOR_CONSUMERS} consumers "
+                    f"in group {Config.AGGREGATOR_GROUP}")
+
+        start_http_server(Config.AGGREGATOR_METRICS_PORT)
+        await asyncio.gather(
+            self.writer.run(),
+            self.maintenance_loop(),
+            self.latency_loop(),
+            self.event_archive_loop(),
+            *[self.consume(f"{self.consumer_prefix}-{i}") for i in range(Config.AGGREGATOR_CONSUMERS)]
+        )
+
+    async def run(self):
+        """Run the aggregator"""
+        await self.start()
+
+        try:
+            await self.process_results()
+        finally:
+            await self.writer.flush()
+            await self.redis.close()
+            await self.db_pool.close()
+
+
+if __name__ == "__main__":
+    aggregator = Aggregator()
+    asyncio.run(aggregator.run())
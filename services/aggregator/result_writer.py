@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""Micro-batched writer for job completions in PostgreSQL
+
+Completions are buffered and applied with a single UPDATE ... FROM unnest()
+per batch, flushed at flush_size rows or when the flush interval elapses.
+Rows already in a terminal status are left alone, so a late or duplicate
+completion never overwrites a finished job. add() returns a future that
+resolves once the row is committed, so callers ack the source message only
+after the write.
+"""
+
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+BULK_UPDATE = """
+    UPDATE {table} AS j
+    SET status = r.status,
+        result = r.result,
+        error_message = r.error_message,
+        execution_time_ms = r.execution_time_ms,
+        completed_at = NOW(),
+        updated_at = NOW()
+    FROM unnest($1::text[], $2::text[], $3::text[], $4::text[], $5::int[])
+        AS r(job_id, status, result, error_message, execution_time_ms)
+    WHERE j.job_id = r.job_id
+    AND j.status NOT IN ('completed', 'failed', 'cancelled')
+"""
+
+
+class ResultWriter:
+    def __init__(self, db_pool, flush_size, flush_interval, table='jobs'):
+        self.db_pool = db_pool
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.query = BULK_UPDATE.format(table=table)
+        self.pending = {}  # job_id -> (row, future)
+        self.running = True
+
+    def add(self, job_id, status, result, error_message, execution_time_ms):
+        """Queue a completion; the returned future resolves once it is written"""
+        future = asyncio.get_running_loop().create_future()
+
+        # A newer completion of the same job replaces the buffered one
+        previous = self.pending.pop(job_id, None)
+        if previous:
+            previous[1].set_result(False)
+
+        self.pending[job_id] = ((job_id, status, result, error_message, execution_time_ms), future)
+        if len(self.pending) >= self.flush_size:
+            asyncio.ensure_future(self.flush())
+        return future
+
+    async def flush(self):
+        """Write every buffered completion in one statement"""
+        if not self.pending:
+            return
+
+        batch, self.pending = self.pending, {}
+        rows = [row for row, _ in batch.values()]
+        try:
+            async with self.db_pool.acquire() as conn:
+                await conn.execute(self.query, *[list(column) for column in zip(*rows)])
+        except Exception as e:
+            logger.error(f"Error writing {len(rows)} results: {e}")
+            for _, future in batch.values():
+                future.set_exception(e)
+            return
+
+        for _, future in batch.values():
+            future.set_result(True)
+        logger.debug(f"💾 Wrote {len(rows)} results")
+
+    async def run(self):
+        """Flush on a timer so small batches never wait longer than the window"""
+        while self.running:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
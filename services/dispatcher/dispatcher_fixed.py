@@ -6,17 +6,53 @@ import aioredis
 import asyncpg
 import json
 import logging
+import os
+import socket
 from datetime import datetime
+import random
 import time
 
+from shared.config import Config
+from shared.job_events import transition_call
+from shared.models import TERMINAL_STATUSES, JobStatus
+from shared.queues import job_queue_key, region_queue_keys
+from shared.redis_scripts import (
+    CACHE_RELEASE, DISPATCH_ASSIGN, JOB_COMPLETE, JOB_TRANSITION, LEASE_ACQUIRE, LEASE_ACK, LEASE_REAP,
+    LEASE_RETRY, REPUTATION_UPDATE, RETRY_PROMOTE, SLOTS_RECONCILE
+)
+from shared.reputation import TIMEOUT, reputation_key
+from shared.result_cache import cache_key, lookup_keys, release_keys
+from shared.runtime_predictor import RUNTIME_STATS_KEY, runtime_p95
+from services.dispatcher.placement import (
+    PlacementContext, rank_nodes, is_cold, free_slots, max_batch_size, node_region, parse_region_latency
+)
+from services.dispatcher.policies import EDF, SJF, edf_key, sjf_key, will_miss_deadline
+from services.dispatcher.replication import DispatcherState, LeaderLease, StateReplicator
+from services.dispatcher.sharding import ShardMembership
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+def backoff_delay(attempt):
+    """Exponential backoff with full jitter for the given retry attempt"""
+    cap = min(Config.RETRY_MAX_DELAY, Config.RETRY_BASE_DELAY * (2 ** attempt))
+    return random.uniform(0, cap)
+
 class Dispatcher:
     def __init__(self):
         self.redis = None
         self.db_pool = None
         self.running = True
+        self.instance_id = Config.DISPATCHER_ID or f"{socket.gethostname()}-{os.getpid()}"
+        self.membership = None
+        self.state = DispatcherState()
+        self.replicator = None
+        self.leader = None
+        self.regions = [r.strip() for r in Config.DISPATCHER_REGIONS.split(',') if r.strip()]
+        self.queues = []  # Partition queues owned by this instance
+        self.unrecorded = []  # (job_id, node_id) assigned but not written to PostgreSQL yet
+        self._next_queue = 0
+        self._script_shas = {}
         
     async def start(self):
         """Initialize connections"""
@@ -34,97 +70,689 @@ class Dispatcher:
             database='synapse'
         )
         logger.info("✅ Connected to PostgreSQL")
+
+        partitions = {region: region_queue_keys(region) for region in self.regions}
+        self.membership = ShardMembership(
+            self.redis, self.instance_id, partitions, Config.DISPATCHER_MEMBER_TTL
+        )
+        self.replicator = StateReplicator(self.redis, self.instance_id, self.state)
+        self.leader = LeaderLease(self.redis, self.instance_id, Config.DISPATCHER_LEADER_TTL)
+        await self.replicator.load()
+
+        # Configured latencies; entries written to the hash by hand override them
+        region_latency = parse_region_latency(Config.REGION_LATENCY_MS)
+        for pair, ms in region_latency.items():
+            await self.redis.hsetnx('regions:latency', pair, ms)
+
+    async def wait_for_leadership(self):
+        """Stay in hot standby, tailing the leader's log, until we hold the lease"""
+        if await self.leader.acquire():
+            logger.info(f"👑 {self.instance_id}: running as leader")
+            return
+
+        logger.info(f"🛡️ {self.instance_id}: leader already active, running as standby")
+        while not await self.leader.acquire():
+            await self.replicator.follow(Config.STANDBY_POLL_MS)
+
+        # Pick up anything written between our last read and the takeover
+        await self.replicator.catch_up()
+        logger.info(f"👑 {self.instance_id}: took over as leader "
+                    f"({len(self.state.inflight)} in-flight jobs)")
+
+    async def leader_loop(self):
+        """Renew the leader lease, step down if it was lost"""
+        while self.running:
+            await asyncio.sleep(Config.DISPATCHER_LEADER_TTL / 3)
+            try:
+                if not await self.leader.renew():
+                    logger.error("❌ Lost leader lease, stepping down")
+                    self.running = False
+            except Exception as e:
+                logger.error(f"Error renewing leader lease: {e}")
+
+    async def snapshot_loop(self):
+        """Forget finished assignments and snapshot the state"""
+        while self.running:
+            await asyncio.sleep(Config.STATE_SNAPSHOT_INTERVAL)
+            try:
+                await self.prune_finished_jobs()
+                await self.replicator.snapshot()
+            except Exception as e:
+                logger.error(f"Error taking state snapshot: {e}")
+
+    async def prune_finished_jobs(self):
+        """Jobs whose assignment key is gone have completed or timed out"""
+        job_ids = list(self.state.inflight)
+        if not job_ids:
+            return
+
+        pipe = self.redis.pipeline()
+        futures = [pipe.exists(f'job:{job_id}:assigned') for job_id in job_ids]
+        await pipe.execute()
+
+        for job_id, future in zip(job_ids, futures):
+            if not future.result():
+                await self.replicator.record('complete', job_id=job_id)
         
-    async def get_best_node(self, job_data):
-        """Find the best available node for a job"""
-        nodes = await self.redis.smembers('nodes:registered')
-        
-        best_node = None
-        best_score = -1
-        
-        for node_id in nodes:
-            # Get node info
+    async def get_nodes(self):
+        """Load info for all registered nodes (docker and native)"""
+        nodes = {}
+
+        for node_id in await self.redis.smembers('nodes:registered'):
             node_info_raw = await self.redis.get(f'node:{node_id}:info')
-            if not node_info_raw:
-                continue
-                
-            node_info = json.loads(node_info_raw)
-            
-            # Check if node is available
-            if node_info.get('status') != 'available':
+            if node_info_raw:
+                nodes[node_id] = json.loads(node_info_raw)
+
+        # Native nodes keep their info in a hash keyed by region
+        for node_id in await self.redis.smembers('native_nodes'):
+            region = await self.redis.hget('nodes:region', node_id)
+            if not region:
                 continue
-                
-            # Calculate score (simple for now)
-            load = node_info.get('current_load', 1.0)
-            capacity = node_info.get('capacity', 1.0)
-            score = capacity * (1 - load)
-            
-            if score > best_score:
-                best_score = score
-                best_node = node_id
-                
-        return best_node
+            node_info = await self.redis.hgetall(f'node:{node_id}:{region}:info')
+            if node_info:
+                nodes[node_id] = node_info
+
+        # Observed execution times, queue depth, reputation and slots in use
+        node_ids = list(nodes)
+        pipe = self.redis.pipeline()
+        stats = [pipe.hgetall(f'node:{node_id}:exec_stats') for node_id in node_ids]
+        queued = [pipe.llen(f'node_jobs:{node_id}') for node_id in node_ids]
+        reputations = [pipe.hgetall(reputation_key(node_id)) for node_id in node_ids]
+        load = pipe.hgetall('nodes:load')
+        await pipe.execute()
+
+        slots_used = load.result()
+        for node_id, stats_future, queued_future, reputation_future in zip(node_ids, stats, queued, reputations):
+            nodes[node_id]['exec_stats'] = stats_future.result()
+            nodes[node_id]['queued'] = queued_future.result()
+            nodes[node_id]['reputation'] = reputation_future.result()
+            nodes[node_id].setdefault('slots', Config.DEFAULT_NODE_SLOTS)
+            nodes[node_id]['slots_used'] = int(slots_used.get(node_id, 0))
+
+        return nodes
+
+    async def get_placement_context(self):
+        cold_start = await self.redis.hgetall('metrics:cold_start')
+        cold_loads = int(cold_start.get('loads', 0))
+        return PlacementContext(
+            cold_start_penalty=Config.COLD_START_PENALTY,
+            region_latency=await self.redis.hgetall('regions:latency'),
+            spill_wait_threshold=Config.SPILL_WAIT_THRESHOLD,
+            spill_max_latency_ms=Config.SPILL_MAX_LATENCY_MS,
+            spill_latency_weight=Config.SPILL_LATENCY_WEIGHT,
+            completion_weight=Config.COMPLETION_WEIGHT,
+            completion_risk_factor=Config.COMPLETION_RISK_FACTOR,
+            runtime_stats=await self.redis.hgetall(RUNTIME_STATS_KEY),
+            default_runtime=Config.SJF_DEFAULT_RUNTIME,
+            cold_load_seconds=float(cold_start.get('load_ms_total', 0)) / 1000 / cold_loads if cold_loads else 0.0,
+            reputation_half_life=Config.REPUTATION_HALF_LIFE,
+            reputation_prior=Config.REPUTATION_PRIOR,
+            reputation_drain_score=Config.REPUTATION_DRAIN_SCORE,
+            reputation_weight=Config.REPUTATION_WEIGHT
+        )
+
+    async def get_best_node(self, job_data):
+        """Find the best available node for a job
+
+        Nodes in the job's region come first; once the job has waited longer
+        than SPILL_WAIT_THRESHOLD it may spill to a nearby region. Warm nodes
+        are preferred over cold ones. Returns (node_id, node_info), or
+        (None, None) when no node is eligible.
+        """
+        nodes = await self.get_nodes()
+        ctx = await self.get_placement_context()
+        ranked = rank_nodes(nodes, job_data, ctx, time.time())
+
+        if not ranked:
+            return None, None
+
+        node_id, _ = ranked[0]
+        return node_id, nodes[node_id]
         
-    async def dispatch_job(self, job_data):
-        """Dispatch a job to a node"""
+    async def dispatch_job(self, queue, job_json, job_data):
+        """Dispatch a leased job to a node"""
         job_id = job_data['job_id']
         
         # Find best node
-        node_id = await self.get_best_node(job_data)
+        node_id, node_info = await self.get_best_node(job_data)
         
         if not node_id:
             logger.warning(f"❌ No available nodes for job {job_id}")
             return False
             
-        logger.info(f"📍 Assigning job {job_id} to node {node_id}")
+        return await self.assign_jobs(node_id, node_info, [(queue, job_json, job_data)])
+
+    async def assign_jobs(self, node_id, node_info, items):
+        """Hand leased (queue, job_json, job_data) items to a node
+
+        Several jobs go out as a single batch envelope. Slots, lease release,
+        delivery and assignment keys are updated by one DISPATCH_ASSIGN call.
+        The database is updated by record_assignments once the window is out.
+        Returns False when the node no longer has enough free slots.
+        """
+        jobs = [job_data for _, _, job_data in items]
+        job_ids = [job_data['job_id'] for job_data in jobs]
+        logger.info(f"📍 Assigning {', '.join(job_ids)} to node {node_id}")
+        
+        # Deliver to the node's job list (pub/sub drops jobs nobody listens to)
+        if len(jobs) == 1:
+            envelope = jobs[0]
+        else:
+            envelope = {'batch_id': job_ids[0], 'model_name': jobs[0]['model_name'], 'jobs': jobs}
+        
+        keys = ['nodes:load', f'node_jobs:{node_id}', f'node_slots:{node_id}']
+        args = [node_id, json.dumps(envelope), Config.JOB_ASSIGNMENT_TTL,
+                time.time(), node_info['slots']]
+        for queue, job_json, job_data in items:
+            keys.extend(self.lease_keys(queue)[1:] + [f'job:{job_data["job_id"]}:assigned'])
+            args.append(job_json)
+        
+        assigned = await self.run_script(DISPATCH_ASSIGN, keys, args)
+        if assigned == -1:
+            # Another dispatcher took the last slots since we read them
+            logger.info(f"🎰 Node {node_id} has no free slot for {', '.join(job_ids)}")
+            return False
+        if not assigned:
+            # The reaper requeued at least one job; it will be dispatched again
+            logger.warning(f"⚠️ Lost queue lease while assigning {', '.join(job_ids)}")
+            return True
+        
+        self.unrecorded.extend((job_id, node_id) for job_id in job_ids)
+        
+        # Logs the assigned event; refused when the node already reported its
+        # start or the job finished meanwhile
+        refused = []
+        for job_id in job_ids:
+            if not await self.run_script(JOB_TRANSITION, *transition_call(job_id, JobStatus.ASSIGNED, '', node_id)):
+                refused.append(job_id)
+        if refused:
+            await self.release_finished(refused)
+        
+        pipe = self.redis.pipeline()
+        self.count_placements(pipe, node_id, node_info, jobs)
+        if Config.HEDGING_ENABLED:
+            # Kept so a straggler can be duplicated on another node
+            for job_data in jobs:
+                pipe.setex(f'job:{job_data["job_id"]}:payload', Config.JOB_ASSIGNMENT_TTL, json.dumps(job_data))
+            pipe.hincrby('metrics:hedging', 'dispatched', len(jobs))
+        await pipe.execute()
         
-        # Update job status in database
+        for job_data in jobs:
+            await self.replicator.record(
+                'assign', job_id=job_data['job_id'], node_id=node_id,
+                model_name=job_data['model_name'], assigned_at=time.time()
+            )
+        
+        logger.info(f"✅ {len(jobs)} job(s) dispatched to {node_id}")
+        return True
+
+    async def release_finished(self, job_ids):
+        """Free the slots of jobs cancelled (or finished) while being assigned
+
+        The gateway releases a cancelled job's slot, but not one taken after
+        its cancel; holding it until the TTL would count as a node timeout.
+        """
+        states = await self.redis.mget(*[f'job:{job_id}:state' for job_id in job_ids])
+        terminal = {status.value for status in TERMINAL_STATUSES}
+        for job_id, state in zip(job_ids, states):
+            if state and state.split('|')[0] in terminal:
+                await self.run_script(JOB_COMPLETE, [f'job:{job_id}:assigned', 'nodes:load'], [job_id])
+                logger.info(f"🛑 Released the slot of job {job_id}, {state.split('|')[0]} during assignment")
+
+    def count_placements(self, pipe, node_id, node_info, jobs):
+        """Cold-start and region spill metrics for jobs a node accepted"""
+        # Cold-start rate = cold / dispatched
+        pipe.hincrby('metrics:cold_start', 'dispatched', len(jobs))
+        target_region = node_region(node_info)
+        for job_data in jobs:
+            if is_cold(node_info, job_data['model_name']):
+                pipe.hincrby('metrics:cold_start', 'cold', 1)
+                logger.info(f"🧊 Node {node_id} will cold-load {job_data['model_name']}")
+
+            job_region = job_data.get('region')
+            if job_region and target_region and target_region != job_region:
+                pipe.hincrby('metrics:region_spill', f'{job_region}>{target_region}', 1)
+                logger.info(f"🌍 Job {job_data['job_id']} spills from {job_region} to {target_region}")
+
+    async def record_assignments(self):
+        """Write the assignments made since the last call in one UPDATE"""
+        if not self.unrecorded:
+            return
+        job_ids, node_ids = zip(*self.unrecorded)
         async with self.db_pool.acquire() as conn:
             await conn.execute("""
-                UPDATE jobs 
+                UPDATE jobs
                 SET status = 'assigned',
-                    assigned_node = $1,
+                    assigned_node = assignment.node_id,
                     updated_at = NOW(),
-                    queue_time_ms = EXTRACT(EPOCH FROM (NOW() - created_at)) * 1000
+                    queue_time_ms = EXTRACT(EPOCH FROM (NOW() - jobs.created_at)) * 1000
+                FROM UNNEST($1::text[], $2::text[]) AS assignment(job_id, node_id)
+                WHERE jobs.job_id = assignment.job_id
+                AND jobs.status NOT IN ('completed', 'failed', 'cancelled')
+            """, list(job_ids), list(node_ids))
+        self.unrecorded = []
+
+    async def hedge_budget_available(self):
+        """Hedges may not exceed HEDGE_BUDGET of the dispatched jobs"""
+        counts = await self.redis.hgetall('metrics:hedging')
+        hedged = int(counts.get('hedged', 0))
+        return hedged < Config.HEDGE_BUDGET * int(counts.get('dispatched', 0))
+
+    async def hedge_job(self, job_id, assignment):
+        """Launch a duplicate of a straggler on another node"""
+        payload = await self.redis.get(f'job:{job_id}:payload')
+        if not payload or not await self.redis.exists(f'job:{job_id}:assigned'):
+            return False
+
+        # One hedge per job; the aggregator lets the first result win
+        if not await self.redis.set(f'job:{job_id}:hedged', assignment['node_id'],
+                                    expire=3600, exist=self.redis.SET_IF_NOT_EXIST):
+            return False
+
+        # The copy takes a slot like any job, under its own assignment key so
+        # each copy's slot is released on the node that ran it
+        hedge_json = json.dumps(dict(json.loads(payload), hedge=True))
+        primary_key = f'job:{job_id}:assigned'
+        nodes = await self.get_nodes()
+        nodes.pop(assignment['node_id'], None)
+        ranked = rank_nodes(nodes, json.loads(payload), await self.get_placement_context(), time.time())
+
+        for node_id, _ in ranked:
+            keys = ['nodes:load', f'node_jobs:{node_id}', f'node_slots:{node_id}',
+                    primary_key, primary_key, f'job:{job_id}:hedge_assigned']
+            args = [node_id, hedge_json, Config.JOB_ASSIGNMENT_TTL, time.time(),
+                    nodes[node_id]['slots'], hedge_json]
+            assigned = await self.run_script(DISPATCH_ASSIGN, keys, args)
+            if assigned == -1:
+                continue
+            if assigned:
+                await self.redis.hincrby('metrics:hedging', 'hedged', 1)
+                logger.info(f"🪞 Hedging straggler {job_id}: duplicate sent to {node_id}")
+                return True
+            # The primary finished while we were placing the copy
+            break
+
+        await self.redis.delete(f'job:{job_id}:hedged')
+        return False
+
+    async def hedge_stragglers(self):
+        """Duplicate jobs running longer than the p95 runtime of their model
+
+        Runtime counts from job:{id}:started, set by the node when it begins
+        the job, so time spent queued on the node is not mistaken for a
+        straggler. Jobs not started yet are left alone.
+        """
+        if not self.state.inflight:
+            return
+
+        inflight = list(self.state.inflight.items())
+        runtime_stats = await self.redis.hgetall(RUNTIME_STATS_KEY)
+        started = await self.redis.mget(*[f'job:{job_id}:started' for job_id, _ in inflight])
+        now = time.time()
+
+        for (job_id, assignment), started_at in zip(inflight, started):
+            threshold = runtime_p95(runtime_stats, assignment['model_name'])
+            if threshold is None or started_at is None or now - float(started_at) < threshold:
+                continue
+            if not await self.hedge_budget_available():
+                return
+            await self.hedge_job(job_id, assignment)
+
+    async def hedge_loop(self):
+        """Opt-in speculative execution for stragglers"""
+        while self.running and Config.HEDGING_ENABLED:
+            await asyncio.sleep(Config.HEDGE_CHECK_INTERVAL)
+            try:
+                await self.hedge_stragglers()
+            except Exception as e:
+                logger.error(f"Error hedging stragglers: {e}")
+
+    def lease_keys(self, queue):
+        """Queue, processing list and lease zset for a queue"""
+        return [queue, f'{queue}:processing', f'{queue}:leases']
+
+    async def run_script(self, script, keys, args):
+        """Run a Lua script through EVALSHA, loading it on first use"""
+        sha = self._script_shas.get(script)
+        if sha is None:
+            sha = self._script_shas[script] = await self.redis.script_load(script)
+        try:
+            return await self.redis.evalsha(sha, keys=keys, args=args)
+        except aioredis.errors.ReplyError as e:
+            if 'NOSCRIPT' not in str(e):
+                raise
+            # Script cache was flushed (Redis restart)
+            self._script_shas[script] = await self.redis.script_load(script)
+            return await self.redis.evalsha(self._script_shas[script], keys=keys, args=args)
+
+    async def lease_next_job(self):
+        """Lease a job from the owned partitions in one round trip
+
+        Returns (queue, job_json) or (None, None) when all of them are empty.
+        The starting partition rotates so no partition is starved.
+        """
+        queues = self.queues
+        if not queues:
+            return None, None
+
+        start = self._next_queue % len(queues)
+        self._next_queue += 1
+        ordered = queues[start:] + queues[:start]
+
+        keys = []
+        for queue in ordered:
+            keys.extend(self.lease_keys(queue))
+
+        result = await self.run_script(
+            LEASE_ACQUIRE, keys, [time.time() + Config.JOB_LEASE_TIMEOUT]
+        )
+        if not result:
+            return None, None
+
+        index, job_json = result
+        return ordered[int(index) - 1], job_json
+
+    async def ack_lease(self, queue, job_json):
+        return await self.run_script(LEASE_ACK, self.lease_keys(queue), [job_json])
+
+    async def schedule_retry(self, queue, job_json, job_data):
+        """Park a job in the delayed retry zset, or fail it after MAX_RETRIES"""
+        attempts = job_data.get('attempts', 0) + 1
+
+        if attempts > Config.MAX_RETRIES:
+            await self.fail_job(job_data, f"No available node after {Config.MAX_RETRIES} retries")
+            await self.ack_lease(queue, job_json)
+            return
+
+        job_data['attempts'] = attempts
+        delay = backoff_delay(attempts)
+        await self.run_script(
+            LEASE_RETRY, self.lease_keys(queue) + [f'{queue}:retry'],
+            [job_json, json.dumps(job_data), time.time() + delay]
+        )
+        logger.info(f"⏳ Job {job_data['job_id']} retry {attempts}/{Config.MAX_RETRIES} in {delay:.1f}s")
+
+    async def fail_job(self, job_data, error_message):
+        """Fail a job unless it already reached a terminal status
+
+        Returns False when a result or cancellation got there first.
+        """
+        job_id = job_data['job_id']
+        moved = await self.run_script(JOB_TRANSITION, *transition_call(job_id, JobStatus.FAILED, ''))
+        if not moved:
+            return False
+
+        async with self.db_pool.acquire() as conn:
+            await conn.execute("""
+                UPDATE jobs
+                SET status = 'failed',
+                    error_message = $1,
+                    completed_at = NOW(),
+                    updated_at = NOW()
                 WHERE job_id = $2
-            """, node_id, job_id)
-            
-        # Update node load
-        await self.redis.hincrby('nodes:load', node_id, 1)
-        
-        # Send job to node via pub/sub
-        await self.redis.publish(f'node:{node_id}:jobs', json.dumps(job_data))
-        
-        # Track assignment
-        await self.redis.setex(f'job:{job_id}:assigned', 300, node_id)
-        
-        logger.info(f"✅ Job {job_id} dispatched to {node_id}")
+                AND status NOT IN ('completed', 'failed', 'cancelled')
+            """, error_message, job_id)
+        logger.warning(f"💀 Job {job_id} failed: {error_message}")
+
+        if job_data.get('cache_key'):
+            await self.requeue_followers(job_data)
         return True
+
+    async def requeue_followers(self, job_data):
+        """Run the jobs coalesced behind a failed job on their own"""
+        followers = await self.run_script(
+            CACHE_RELEASE, release_keys(job_data['cache_key']), [job_data['job_id']]
+        )
+        for follower_json in followers:
+            follower = json.loads(follower_json)
+            follower.pop('cache_key', None)
+            await self.redis.lpush(job_queue_key(follower['region'], follower['job_id']), json.dumps(follower))
+        if followers:
+            logger.info(f"🔁 Requeued {len(followers)} jobs coalesced behind {job_data['job_id']}")
+
+    async def promote_due_retries(self, queue):
+        return await self.run_script(
+            RETRY_PROMOTE, [f'{queue}:retry', queue],
+            [time.time(), Config.LEASE_REAP_BATCH]
+        )
+
+    async def retry_loop(self):
+        """Move retries whose backoff elapsed back into the queue"""
+        while self.running:
+            try:
+                for queue in self.queues:
+                    await self.promote_due_retries(queue)
+            except Exception as e:
+                logger.error(f"Error promoting retries: {e}")
+            await asyncio.sleep(Config.RETRY_POLL_INTERVAL)
+
+    async def reap_expired_leases(self, queue):
+        """Requeue jobs whose lease expired (dispatcher crashed or stalled)"""
+        now = time.time()
+        requeued = await self.run_script(
+            LEASE_REAP, self.lease_keys(queue),
+            [now, Config.LEASE_REAP_BATCH, now + Config.JOB_LEASE_TIMEOUT]
+        )
+        if requeued:
+            logger.info(f"🔄 Re-queued {requeued} jobs with expired leases from {queue}")
+        return requeued
+
+    async def lease_reaper_loop(self):
+        """Periodically recover jobs from expired leases"""
+        while self.running:
+            try:
+                for queue in self.queues:
+                    await self.reap_expired_leases(queue)
+            except Exception as e:
+                logger.error(f"Error in lease reaper: {e}")
+            await asyncio.sleep(Config.LEASE_REAP_INTERVAL)
+
+    async def membership_loop(self):
+        """Keep our membership lease alive and follow partition rebalances"""
+        while self.running:
+            await asyncio.sleep(Config.DISPATCHER_HEARTBEAT_INTERVAL)
+            try:
+                self.queues = await self.membership.heartbeat()
+            except Exception as e:
+                logger.error(f"Error in membership heartbeat: {e}")
+
+    async def reconcile_slots(self):
+        """Free slots held by assignments that timed out, resync nodes:load"""
+        node_ids = set(await self.redis.hkeys('nodes:load'))
+        node_ids.update(await self.get_nodes())
+        now = time.time()
+
+        for node_id in node_ids:
+            freed = await self.run_script(
+                SLOTS_RECONCILE, [f'node_slots:{node_id}', 'nodes:load'], [node_id, now]
+            )
+            if freed:
+                # Assignments that outlived their TTL count against the node
+                await self.run_script(
+                    REPUTATION_UPDATE, [reputation_key(node_id), f'node:{node_id}:exec_stats'],
+                    [now, Config.REPUTATION_HALF_LIFE, TIMEOUT, freed, '', '']
+                )
+                logger.warning(f"🎰 Freed {freed} leaked slots on node {node_id}")
+
+    async def slot_reconciler_loop(self):
+        """Periodically repair slot accounting"""
+        while self.running:
+            await asyncio.sleep(Config.SLOT_RECONCILE_INTERVAL)
+            try:
+                await self.reconcile_slots()
+            except Exception as e:
+                logger.error(f"Error reconciling slots: {e}")
+
+    async def stuck_jobs_loop(self):
+        """Safety net for jobs that never reached Redis"""
+        while self.running:
+            await asyncio.sleep(Config.STUCK_JOB_SCAN_INTERVAL)
+            try:
+                # Under a backlog, old pending jobs are simply still queued
+                if await self.queues_idle():
+                    await self.check_stuck_jobs()
+            except Exception as e:
+                logger.error(f"Error checking stuck jobs: {e}")
+
+    async def queues_idle(self):
+        """True when none of our partitions holds a queued, leased or retrying job"""
+        pipe = self.redis.pipeline()
+        futures = []
+        for queue in self.queues:
+            futures.append(pipe.llen(queue))
+            futures.append(pipe.llen(f'{queue}:processing'))
+            futures.append(pipe.zcard(f'{queue}:retry'))
+        await pipe.execute()
+        return not any(future.result() for future in futures)
+
+    async def is_cache_follower(self, job_data):
+        """True for a job waiting on an identical one (the leader requeues it)"""
+        followers_key = lookup_keys(cache_key(job_data['model_name'], job_data['input_data']))[2]
+        return any(json.loads(follower)['job_id'] == job_data['job_id']
+                   for follower in await self.redis.lrange(followers_key, 0, -1))
+
+    def is_late(self, job_data, runtime_stats):
+        """EDF: True for a job that cannot make its deadline (runtime_stats is None otherwise)"""
+        return runtime_stats is not None and will_miss_deadline(
+            job_data, runtime_stats, time.time(), Config.DEFAULT_JOB_TIMEOUT)
+
+    async def handle_job(self, queue, job_json, job_data, runtime_stats=None):
+        """Dispatch one leased job, or park it for a retry"""
+        logger.info(f"📥 Processing job {job_data['job_id']}")
+        
+        # EDF: don't spend node time on a job that cannot make its deadline
+        if self.is_late(job_data, runtime_stats):
+            await self.drop_late_job(queue, job_json, job_data)
+            return
         
+        # Try to dispatch (the assignment releases the queue lease)
+        if not await self.dispatch_job(queue, job_json, job_data):
+            # Retry later without blocking the other jobs
+            await self.schedule_retry(queue, job_json, job_data)
+
+    async def dispatch_window(self, window, runtime_stats=None):
+        """Coalesce a leased window into per-model batches
+
+        Jobs for the same model go out together, up to the max_batch_size
+        advertised by the node picked for the first job of each batch. Every
+        job is ranked on its own, so a job only joins a batch sent to a node
+        it may use (its region, or a spill it is allowed to make).
+        """
+        groups = {}
+        for queue, job_json, job_data in window:
+            if self.is_late(job_data, runtime_stats):
+                await self.drop_late_job(queue, job_json, job_data)
+                continue
+            groups.setdefault(job_data['model_name'], []).append((queue, job_json, job_data))
+
+        for items in groups.values():
+            while items:
+                nodes = await self.get_nodes()
+                ctx = await self.get_placement_context()
+                now = time.time()
+
+                placeable = []
+                for queue, job_json, job_data in items:
+                    ranked = rank_nodes(nodes, job_data, ctx, now)
+                    if ranked:
+                        placeable.append(((queue, job_json, job_data), [node_id for node_id, _ in ranked]))
+                    else:
+                        await self.schedule_retry(queue, job_json, job_data)
+                if not placeable:
+                    break
+
+                node_id = placeable[0][1][0]
+                node_info = nodes[node_id]
+                size = min(max_batch_size(node_info), free_slots(node_info))
+                batch = [item for item, eligible in placeable if node_id in eligible][:size]
+                items = [item for item, _ in placeable if item not in batch]
+                if not await self.assign_jobs(node_id, node_info, batch):
+                    for queue, job_json, job_data in batch:
+                        await self.schedule_retry(queue, job_json, job_data)
+
+    async def drop_late_job(self, queue, job_json, job_data):
+        """Fail a job fast because it would finish after its deadline"""
+        if await self.fail_job(job_data, "Deadline cannot be met"):
+            await self.redis.hincrby('metrics:deadline', 'dropped', 1)
+        await self.ack_lease(queue, job_json)
+
+    async def lease_window(self, linger=0):
+        """Lease up to DISPATCH_WINDOW jobs as (queue, job_json, job_data) tuples
+
+        Once the first job is leased, wait up to linger seconds for more.
+        """
+        window = []
+        linger_until = None
+        while len(window) < Config.DISPATCH_WINDOW:
+            queue, job_json = await self.lease_next_job()
+            if job_json:
+                window.append((queue, job_json, json.loads(job_json)))
+                if linger_until is None:
+                    linger_until = time.time() + linger
+                continue
+            if linger_until is None or time.time() >= linger_until:
+                break
+            await asyncio.sleep(Config.DISPATCH_IDLE_SLEEP)
+        return window
+
+    async def drop_cancelled(self, window):
+        """Release the leases of jobs cancelled while they were queued"""
+        if not window:
+            return window
+        states = await self.redis.mget(*[f'job:{job_data["job_id"]}:state' for _, _, job_data in window])
+        kept = []
+        for (queue, job_json, job_data), state in zip(window, states):
+            if state and state.split('|')[0] == JobStatus.CANCELLED.value:
+                await self.ack_lease(queue, job_json)
+                logger.info(f"🛑 Dropping cancelled job {job_data['job_id']}")
+            else:
+                kept.append((queue, job_json, job_data))
+        return kept
+
+    async def order_window(self, window):
+        """Order a leased window according to SCHEDULING_POLICY"""
+        if Config.SCHEDULING_POLICY == EDF:
+            return sorted(window, key=lambda item: edf_key(item[2], Config.DEFAULT_JOB_TIMEOUT))
+
+        if Config.SCHEDULING_POLICY != SJF:
+            return window
+
+        runtime_stats = await self.redis.hgetall(RUNTIME_STATS_KEY)
+        now = time.time()
+        return sorted(window, key=lambda item: sjf_key(
+            item[2], runtime_stats, now, Config.SJF_AGING_RATE, Config.SJF_DEFAULT_RUNTIME
+        ))
+
     async def process_queue(self):
         """Main processing loop"""
-        logger.info("🚀 Dispatcher started - processing queue")
+        logger.info(f"🚀 Dispatcher {self.instance_id} started - processing queue "
+                    f"({Config.SCHEDULING_POLICY})")
         
         while self.running:
             try:
-                # Get job from queue (blocking pop with timeout)
-                result = await self.redis.brpop('jobs:queue:eu-west-1', timeout=5)
+                if Config.BATCHING_ENABLED:
+                    window = await self.order_window(await self.lease_window(Config.BATCH_LINGER_MS / 1000))
+                elif Config.SCHEDULING_POLICY in (SJF, EDF):
+                    window = await self.order_window(await self.lease_window())
+                else:
+                    # Lease the next job from our partitions
+                    queue, job_json = await self.lease_next_job()
+                    window = [(queue, job_json, json.loads(job_json))] if job_json else []
+                window = await self.drop_cancelled(window)
                 
-                if result:
-                    _, job_json = result
-                    job_data = json.loads(job_json)
-                    
-                    logger.info(f"📥 Processing job {job_data['job_id']}")
-                    
-                    # Try to dispatch
-                    if not await self.dispatch_job(job_data):
-                        # Put back in queue if dispatch failed
-                        await self.redis.lpush('jobs:queue:eu-west-1', job_json)
-                        await asyncio.sleep(5)  # Wait before retry
-                        
+                runtime_stats = None
+                if window and Config.SCHEDULING_POLICY == EDF:
+                    runtime_stats = await self.redis.hgetall(RUNTIME_STATS_KEY)
+                
+                if Config.BATCHING_ENABLED:
+                    await self.dispatch_window(window, runtime_stats)
                 else:
-                    # No jobs in queue, check for stuck jobs
-                    await self.check_stuck_jobs()
+                    for queue, job_json, job_data in window:
+                        await self.handle_job(queue, job_json, job_data, runtime_stats)
+                await self.record_assignments()
+                
+                if not window:
+                    await asyncio.sleep(Config.DISPATCH_IDLE_SLEEP)
                     
             except Exception as e:
                 logger.error(f"Error in dispatcher: {e}")
@@ -134,7 +762,8 @@ class Dispatcher:
         """Check for jobs that are stuck in pending state"""
         async with self.db_pool.acquire() as conn:
             stuck_jobs = await conn.fetch("""
-                SELECT job_id, client_id, model_name, input_data, priority
+                SELECT job_id, client_id, model_name, input_data, priority,
+                       region_preference, EXTRACT(EPOCH FROM created_at) AS submitted_ts
                 FROM jobs
                 WHERE status = 'pending'
                 AND created_at < NOW() - INTERVAL '5 minutes'
@@ -147,18 +776,41 @@ class Dispatcher:
                     'client_id': job['client_id'],
                     'model_name': job['model_name'],
                     'input_data': json.loads(job['input_data']),
-                    'priority': job['priority']
+                    'priority': job['priority'],
+                    'region': job['region_preference'] or Config.DEFAULT_REGION,
+                    'submitted_ts': float(job['submitted_ts'])
                 }
-                await self.redis.lpush('jobs:queue:eu-west-1', json.dumps(job_data))
+                queue = job_queue_key(job_data['region'], job['job_id'])
+                if queue not in self.queues:
+                    continue  # Another dispatcher owns this partition
+                if await self.is_cache_follower(job_data):
+                    continue
+                await self.redis.lpush(queue, json.dumps(job_data))
                 logger.info(f"🔄 Re-queued stuck job {job['job_id']}")
                 
     async def run(self):
         """Run the dispatcher"""
         await self.start()
+        await self.wait_for_leadership()
+        self.queues = await self.membership.heartbeat()
         
         try:
-            await self.process_queue()
+            await asyncio.gather(
+                self.leader_loop(),
+                self.snapshot_loop(),
+                self.process_queue(),
+                self.lease_reaper_loop(),
+                self.retry_loop(),
+                self.stuck_jobs_loop(),
+                self.membership_loop(),
+                self.hedge_loop(),
+                self.slot_reconciler_loop()
+            )
         finally:
+            # After losing the lease our id belongs to the new leader
+            if await self.leader.renew():
+                await self.membership.leave()
+                await self.leader.release()
             self.redis.close()
             await self.redis.wait_closed()
             await self.db_pool.close()
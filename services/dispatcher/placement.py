@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""Node placement logic for the dispatcher
+
+Pure functions only (no Redis / PostgreSQL access) so the ranking rules can
+be reused and tested outside of the dispatcher process.
+"""
+
+import json
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from shared.reputation import reputation
+from shared.runtime_predictor import input_size, predict_runtime
+
+
+@dataclass
+class PlacementContext:
+    """Tunables and cluster-wide data used to rank nodes"""
+    cold_start_penalty: float = 0.5
+    # Region routing: latency in ms between regions ("src|dst" keys, either order)
+    region_latency: Dict[str, float] = field(default_factory=dict)
+    spill_wait_threshold: float = 2.0
+    spill_max_latency_ms: float = 150.0
+    spill_latency_weight: float = 0.005
+    # Expected completion: score points lost per second, std-devs of safety margin
+    completion_weight: float = 1.0
+    completion_risk_factor: float = 1.0
+    # Estimate for nodes without history: runtime predictor hash (RUNTIME_STATS_KEY),
+    # runtime when it knows nothing, mean seconds a cold model load takes
+    runtime_stats: Dict[str, str] = field(default_factory=dict)
+    default_runtime: float = 1.0
+    cold_load_seconds: float = 0.0
+    # Reputation: decay half-life (s), prior successes, drain threshold, score weight
+    reputation_half_life: float = 600.0
+    reputation_prior: float = 5.0
+    reputation_drain_score: float = 0.5
+    reputation_weight: float = 1.0
+
+
+def _json_field(value: Any, default: Any) -> Any:
+    """Decode a field that may be stored as a JSON string (Redis hashes)"""
+    if isinstance(value, str):
+        try:
+            return json.loads(value)
+        except ValueError:
+            return default
+    return default if value is None else value
+
+
+def warm_models(node_info: Dict[str, Any]) -> Optional[Set[str]]:
+    """Models already loaded on the node, or None if the node does not report them"""
+    models = _json_field(node_info.get('warm_models'), None)
+    if models is None:
+        return None
+    return set(models)
+
+
+def supports_model(node_info: Dict[str, Any], model_name: str) -> bool:
+    """Check the node's advertised capabilities (nodes without a list accept everything)"""
+    capabilities = _json_field(node_info.get('capabilities'), {})
+    if not isinstance(capabilities, dict):
+        return True
+    supported = capabilities.get('supported_models')
+    return not supported or model_name in supported
+
+
+def max_batch_size(node_info: Dict[str, Any]) -> int:
+    """Largest batch the node accepts in one delivery (1 if not advertised)"""
+    capabilities = _json_field(node_info.get('capabilities'), {})
+    if not isinstance(capabilities, dict):
+        return 1
+    return max(1, int(capabilities.get('max_batch_size', 1)))
+
+
+def free_slots(node_info: Dict[str, Any]) -> int:
+    """Concurrency slots the node declared minus those held by assigned jobs"""
+    return int(node_info.get('slots', 1)) - int(node_info.get('slots_used', 0))
+
+
+def is_available(node_info: Dict[str, Any]) -> bool:
+    return node_info.get('status') in ('available', 'active') and free_slots(node_info) > 0
+
+
+def is_cold(node_info: Dict[str, Any], model_name: str) -> bool:
+    """True when the node reports its warm set and the model is not in it"""
+    models = warm_models(node_info)
+    return models is not None and model_name not in models
+
+
+def node_region(node_info: Dict[str, Any]) -> Optional[str]:
+    return node_info.get('region')
+
+
+def parse_region_latency(spec: str) -> Dict[str, float]:
+    """Parse REGION_LATENCY_MS ("a|b=80,a|c=25") into region_latency entries"""
+    table = {}
+    for entry in spec.split(','):
+        pair, _, ms = entry.partition('=')
+        if pair.strip() and ms.strip():
+            table[pair.strip()] = float(ms)
+    return table
+
+
+def region_latency_ms(node_info: Dict[str, Any], job_region: str,
+                      ctx: PlacementContext) -> Optional[float]:
+    """Latency between the job's region and the node's, None if unknown
+
+    Unknown pairs are never spilled to.
+    """
+    region = node_region(node_info)
+    if job_region is None or region is None or region == job_region:
+        return 0.0
+
+    latency = ctx.region_latency.get(f'{job_region}|{region}')
+    if latency is None:
+        latency = ctx.region_latency.get(f'{region}|{job_region}')
+    return float(latency) if latency is not None else None
+
+
+def exec_stats(node_info: Dict[str, Any], model_name: str) -> Optional[Tuple[float, float]]:
+    """(mean, variance) of the node's observed execution time for a model"""
+    stats = node_info.get('exec_stats') or {}
+    mean = stats.get(f'{model_name}:mean')
+    if mean is None:
+        return None
+    return float(mean), float(stats.get(f'{model_name}:var', 0))
+
+
+def expected_completion(node_info: Dict[str, Any], job_data: Dict[str, Any],
+                        ctx: PlacementContext) -> float:
+    """Seconds until a job sent now would finish on the node
+
+    Every job already queued on the node is assumed to take the mean time of
+    this model; the job's own run gets a safety margin of risk_factor std-devs.
+    A node with no history for the model is estimated from the cluster-wide
+    prediction with a std-dev as large as the mean, so it never looks faster
+    than a proven node. A cold model adds the average load time.
+    """
+    model_name = job_data.get('model_name', '')
+    stats = exec_stats(node_info, model_name)
+    if stats is None:
+        mean = predict_runtime(ctx.runtime_stats, model_name, None,
+                               input_size(job_data.get('input_data', {})), ctx.default_runtime)
+        variance = mean ** 2
+    else:
+        mean, variance = stats
+
+    queued = int(node_info.get('queued', 0))
+    completion = (queued + 1) * mean + ctx.completion_risk_factor * variance ** 0.5
+    if is_cold(node_info, model_name):
+        completion += ctx.cold_load_seconds
+    return completion
+
+
+def score_node(node_info: Dict[str, Any], job_data: Dict[str, Any],
+               ctx: PlacementContext) -> float:
+    """Score a node for a job (higher is better)
+
+    Free capacity minus a penalty when the job's model would need a cold load,
+    minus a latency penalty for nodes outside the job's region, minus the
+    expected completion time.
+    """
+    load = float(node_info.get('current_load', 1.0))
+    capacity = float(node_info.get('capacity', 1.0))
+    score = capacity * (1 - load)
+
+    if is_cold(node_info, job_data.get('model_name', '')):
+        score -= ctx.cold_start_penalty
+
+    latency = region_latency_ms(node_info, job_data.get('region'), ctx) or 0.0
+    score -= latency * ctx.spill_latency_weight
+
+    score -= expected_completion(node_info, job_data, ctx) * ctx.completion_weight
+
+    return score
+
+
+def reputation_score(node_info: Dict[str, Any], now: float, ctx: PlacementContext) -> float:
+    """Smoothed success rate from observed results (1.0 without history)"""
+    record = node_info.get('reputation')
+    if not record:
+        return 1.0
+    return reputation(record, now, ctx.reputation_half_life, ctx.reputation_prior)['score']
+
+
+def can_spill(job_data: Dict[str, Any], now: float, ctx: PlacementContext) -> bool:
+    """A job may leave its region once it has waited longer than the threshold"""
+    submitted = job_data.get('submitted_ts')
+    return submitted is not None and now - float(submitted) >= ctx.spill_wait_threshold
+
+
+def is_reachable(node_info: Dict[str, Any], job_data: Dict[str, Any],
+                 spill: bool, ctx: PlacementContext) -> bool:
+    """Local nodes always; remote ones only when spilling and close enough"""
+    job_region = job_data.get('region')
+    region = node_region(node_info)
+    if job_region is None or region is None or region == job_region:
+        return True
+    if not spill:
+        return False
+
+    latency = region_latency_ms(node_info, job_region, ctx)
+    return latency is not None and latency <= ctx.spill_max_latency_ms
+
+
+def rank_nodes(nodes: Dict[str, Dict[str, Any]], job_data: Dict[str, Any],
+               ctx: PlacementContext, now: float) -> List[Tuple[str, float]]:
+    """Return eligible (node_id, score) pairs, best first
+
+    Nodes whose reputation fell below the drain threshold get no new jobs
+    until their failures decay; the others lose score as reputation drops.
+    """
+    model_name = job_data.get('model_name', '')
+    spill = can_spill(job_data, now, ctx)
+    ranked = []
+
+    for node_id, node_info in nodes.items():
+        if not is_available(node_info) or not supports_model(node_info, model_name):
+            continue
+        if not is_reachable(node_info, job_data, spill, ctx):
+            continue
+        trust = reputation_score(node_info, now, ctx)
+        if trust < ctx.reputation_drain_score:
+            continue
+        score = score_node(node_info, job_data, ctx) - (1 - trust) * ctx.reputation_weight
+        ranked.append((node_id, score))
+
+    ranked.sort(key=lambda item: item[1], reverse=True)
+    return ranked
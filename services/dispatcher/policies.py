@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""Job ordering policies for the dispatcher
+
+With the default ``fifo`` policy jobs are dispatched one at a time in queue
+order. The other policies lease a window of up to DISPATCH_WINDOW jobs and
+dispatch it in the order computed here. Pure functions only, like placement.
+"""
+
+from typing import Any, Dict, Optional
+
+from shared.runtime_predictor import input_size, predict_runtime
+
+FIFO = 'fifo'
+SJF = 'sjf'
+EDF = 'edf'
+
+
+def predicted_runtime(job_data: Dict[str, Any], runtime_stats: Dict[str, str],
+                      default: float) -> float:
+    """Expected execution time of a job on any node type"""
+    return predict_runtime(
+        runtime_stats, job_data.get('model_name', ''), None,
+        input_size(job_data.get('input_data', {})), default
+    )
+
+
+def sjf_key(job_data: Dict[str, Any], runtime_stats: Dict[str, str], now: float,
+            aging_rate: float, default: float) -> float:
+    """Sort key for shortest expected job first, with aging against starvation
+
+    Each second a job has waited takes aging_rate seconds off its predicted
+    runtime for ordering purposes.
+    """
+    waited = now - float(job_data.get('submitted_ts', now))
+    return predicted_runtime(job_data, runtime_stats, default) - aging_rate * waited
+
+
+def deadline(job_data: Dict[str, Any], default_timeout: float) -> Optional[float]:
+    """Absolute deadline of a job (submission time + timeout)"""
+    if job_data.get('deadline_ts') is not None:
+        return float(job_data['deadline_ts'])
+    if job_data.get('submitted_ts') is not None:
+        return float(job_data['submitted_ts']) + default_timeout
+    return None
+
+
+def edf_key(job_data: Dict[str, Any], default_timeout: float) -> float:
+    """Sort key for earliest deadline first (jobs without one go last)"""
+    value = deadline(job_data, default_timeout)
+    return value if value is not None else float('inf')
+
+
+def will_miss_deadline(job_data: Dict[str, Any], runtime_stats: Dict[str, str],
+                       now: float, default_timeout: float) -> bool:
+    """True when even an immediate start would finish after the deadline
+
+    Jobs the predictor knows nothing about are given the benefit of the doubt.
+    """
+    value = deadline(job_data, default_timeout)
+    if value is None:
+        return False
+    return now + predicted_runtime(job_data, runtime_stats, 0.0) > value
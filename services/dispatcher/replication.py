@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""Leader election and state replication for hot-standby dispatchers
+
+A leader and its standbys share one DISPATCHER_ID. The leader holds a short
+Redis lease (``dispatcher:{id}:leader``) and writes every state change to a
+replication log stream. It also stores a compact snapshot periodically and
+trims the log up to it. A standby restores the snapshot, then tails the log.
+Its copy of the state is current at all times, so it can take over as soon as
+the lease expires.
+"""
+
+import json
+import logging
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Renew only if we still own the lease
+RENEW_LEASE = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+RELEASE_LEASE = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class DispatcherState:
+    """In-memory dispatcher state that has to survive a failover"""
+
+    def __init__(self):
+        self.inflight = {}   # job_id -> assignment
+        self.last_log_id = '0-0'
+
+    def apply(self, op, fields):
+        """Apply one replication log entry"""
+        if op == 'assign':
+            self.inflight[fields['job_id']] = {
+                'node_id': fields['node_id'],
+                'model_name': fields.get('model_name', ''),
+                'assigned_at': float(fields['assigned_at'])
+            }
+        elif op == 'complete':
+            self.inflight.pop(fields['job_id'], None)
+
+    def to_snapshot(self):
+        # Node load is not kept here: nodes:load in Redis is authoritative
+        return json.dumps({
+            'inflight': self.inflight,
+            'last_log_id': self.last_log_id
+        }, separators=(',', ':'))
+
+    def restore(self, snapshot):
+        data = json.loads(snapshot)
+        self.inflight = data['inflight']
+        self.last_log_id = data['last_log_id']
+
+
+class StateReplicator:
+    """Snapshot + incremental log of a DispatcherState in Redis"""
+
+    def __init__(self, redis, instance_id, state):
+        self.redis = redis
+        self.state = state
+        self.log_key = f'dispatcher:{instance_id}:replog'
+        self.snapshot_key = f'dispatcher:{instance_id}:snapshot'
+
+    async def record(self, op, **fields):
+        """Apply a change locally and append it to the log (leader only)"""
+        fields['op'] = op
+        self.state.apply(op, fields)
+        self.state.last_log_id = await self.redis.xadd(self.log_key, fields)
+
+    async def snapshot(self):
+        """Store a snapshot and compact the log entries it covers"""
+        # Entries recorded while the SET is in flight advance last_log_id, so
+        # trim to the id the snapshot was taken at, not the current one
+        snapshot, covered = self.state.to_snapshot(), self.state.last_log_id
+        await self.redis.set(self.snapshot_key, snapshot)
+        await self.redis.execute('XTRIM', self.log_key, 'MINID', covered)
+
+    async def load(self):
+        """Restore the latest snapshot and replay the log written after it"""
+        snapshot = await self.redis.get(self.snapshot_key)
+        if snapshot:
+            self.state.restore(snapshot)
+
+        replayed = await self.catch_up()
+        logger.info(f"📸 Restored state: {len(self.state.inflight)} in-flight jobs, "
+                    f"{replayed} log entries replayed")
+
+    async def catch_up(self):
+        """Apply every log entry newer than our state, without blocking"""
+        entries = await self.redis.xrange(self.log_key, start=f'({self.state.last_log_id}')
+        for entry_id, fields in entries:
+            self._apply_entry(entry_id, fields)
+        return len(entries)
+
+    async def follow(self, timeout_ms):
+        """Apply new log entries as they arrive (standby)"""
+        entries = await self.redis.xread(
+            [self.log_key], timeout=timeout_ms, latest_ids=[self.state.last_log_id]
+        )
+        for _, entry_id, fields in entries:
+            self._apply_entry(entry_id, fields)
+
+    def _apply_entry(self, entry_id, fields):
+        self.state.apply(fields['op'], fields)
+        self.state.last_log_id = entry_id
+
+
+class LeaderLease:
+    """Redis lease deciding which process of a DISPATCHER_ID is active"""
+
+    def __init__(self, redis, instance_id, ttl):
+        self.redis = redis
+        self.key = f'dispatcher:{instance_id}:leader'
+        self.token = uuid.uuid4().hex
+        self.ttl_ms = int(ttl * 1000)
+
+    async def acquire(self):
+        return bool(await self.redis.set(
+            self.key, self.token, pexpire=self.ttl_ms, exist=self.redis.SET_IF_NOT_EXIST
+        ))
+
+    async def renew(self):
+        return bool(await self.redis.eval(RENEW_LEASE, keys=[self.key], args=[self.token, self.ttl_ms]))
+
+    async def release(self):
+        await self.redis.eval(RELEASE_LEASE, keys=[self.key], args=[self.token])
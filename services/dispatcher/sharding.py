@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""Partition ownership for horizontally sharded dispatchers
+
+Every dispatcher instance heartbeats into one ``dispatchers:members:{region}``
+sorted set (score = lease expiry) per region it serves. The live members of a
+region are placed on a consistent hash ring and each partition of that
+region's queue is owned by the member it hashes to, so when an instance joins
+or leaves only ~1/N of the partitions move. Rings are per region so a
+partition never hashes to a dispatcher that does not consume its region.
+"""
+
+import bisect
+import hashlib
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+def members_key(region):
+    return f'dispatchers:members:{region}'
+
+
+def _hash(value):
+    return int(hashlib.md5(value.encode()).hexdigest()[:16], 16)
+
+
+class HashRing:
+    """Consistent hash ring with virtual nodes"""
+
+    def __init__(self, members=(), vnodes=64):
+        self.vnodes = vnodes
+        self._ring = sorted(
+            (_hash(f'{member}#{i}'), member)
+            for member in members
+            for i in range(vnodes)
+        )
+        self._hashes = [h for h, _ in self._ring]
+
+    def owner(self, key):
+        if not self._ring:
+            return None
+        index = bisect.bisect(self._hashes, _hash(key)) % len(self._ring)
+        return self._ring[index][1]
+
+
+class ShardMembership:
+    """Heartbeat lease in Redis and the set of partitions this instance owns"""
+
+    def __init__(self, redis, instance_id, partitions, ttl):
+        """partitions maps each region served to its partition queues"""
+        self.redis = redis
+        self.instance_id = instance_id
+        self.partitions = {region: list(queues) for region, queues in partitions.items()}
+        self.ttl = ttl
+        self.members = {}  # region -> live members
+        self.owned = {}    # region -> owned partitions
+
+    async def heartbeat(self):
+        """Renew our leases, drop expired members and recompute ownership"""
+        now = time.time()
+        for region, partitions in self.partitions.items():
+            key = members_key(region)
+            await self.redis.zadd(key, now + self.ttl, self.instance_id)
+            await self.redis.zremrangebyscore(key, max=now)
+            members = sorted(await self.redis.zrange(key, 0, -1))
+
+            if members != self.members.get(region):
+                ring = HashRing(members)
+                self.owned[region] = [p for p in partitions if ring.owner(p) == self.instance_id]
+                logger.info(f"🔀 Rebalanced {region}: {len(members)} dispatchers, {self.instance_id} "
+                            f"owns {len(self.owned[region])}/{len(partitions)} partitions")
+                self.members[region] = members
+
+        return [p for region in self.partitions for p in self.owned[region]]
+
+    async def leave(self):
+        """Give up our partitions immediately instead of waiting for the lease to expire"""
+        for region in self.partitions:
+            await self.redis.zrem(members_key(region), self.instance_id)
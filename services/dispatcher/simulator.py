@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+"""Offline discrete-event simulator for the dispatcher's scheduling policies
+
+Replays a job trace against simulated nodes using the dispatcher's own
+placement and ordering code, without Redis or PostgreSQL:
+
+    python -m services.dispatcher.simulator trace.jsonl --policies fifo,sjf,edf
+
+A trace is either JSON lines or a CSV export of the jobs table
+(``\\copy (SELECT ...) TO 'jobs.csv' CSV HEADER``). Each job needs a
+model_name and an arrival time (submitted_ts or created_at). The runtime
+comes from execution_time (s) or execution_time_ms, defaulting to
+--default-runtime. Optional fields: job_id, region / region_preference,
+input_data, timeout / deadline_ts.
+
+Nodes run one job per slot in parallel, with a cold-start delay the first
+time they run a model. The dispatcher takes up to DISPATCH_WINDOW queued
+jobs, orders them by policy and places them with rank_nodes. Jobs no node
+can take are set aside, as the dispatcher's retry queue does, and retried
+when a node frees up or when they become allowed to spill to another region
+(--region-latency). Jobs still queued at the end are reported as unplaced.
+"""
+
+import argparse
+import csv
+import heapq
+import json
+import math
+from dataclasses import dataclass, field, replace
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from shared.config import Config
+from shared.runtime_predictor import input_size, training_keys
+from services.dispatcher.placement import PlacementContext, is_cold, parse_region_latency, rank_nodes
+from services.dispatcher.policies import EDF, FIFO, SJF, edf_key, sjf_key, will_miss_deadline
+
+ARRIVAL = 0
+FINISH = 1
+RETRY = 2  # a waiting job may spill now
+
+
+def ewma_update(stats: Dict[str, str], prefix: str, x: float, alpha: float):
+    """Python twin of the EXEC_STATS_UPDATE Lua script"""
+    mean = stats.get(f'{prefix}:mean')
+    if mean is None:
+        mean, var = x, 0.0
+    else:
+        mean = float(mean)
+        diff = x - mean
+        incr = alpha * diff
+        mean += incr
+        var = (1 - alpha) * (float(stats.get(f'{prefix}:var', 0)) + diff * incr)
+    stats[f'{prefix}:mean'] = mean
+    stats[f'{prefix}:var'] = var
+    stats[f'{prefix}:n'] = int(stats.get(f'{prefix}:n', 0)) + 1
+
+
+def _timestamp(value: Any) -> float:
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def load_trace(path: str, default_runtime: float) -> List[Dict[str, Any]]:
+    """Read a JSONL or CSV trace into job dicts sorted by arrival"""
+    with open(path, newline='') as f:
+        if path.endswith('.csv'):
+            rows = list(csv.DictReader(f))
+        else:
+            rows = [json.loads(line) for line in f if line.strip()]
+
+    jobs = []
+    for i, row in enumerate(rows):
+        arrival = row.get('submitted_ts') or row.get('created_at')
+        if not row.get('model_name') or arrival in (None, ''):
+            continue
+
+        if row.get('execution_time') not in (None, ''):
+            runtime = float(row['execution_time'])
+        elif row.get('execution_time_ms') not in (None, ''):
+            runtime = float(row['execution_time_ms']) / 1000
+        else:
+            runtime = default_runtime
+
+        input_data = row.get('input_data') or {}
+        if isinstance(input_data, str):
+            try:
+                input_data = json.loads(input_data)
+            except ValueError:
+                pass
+
+        job = {
+            'job_id': row.get('job_id') or f'sim_{i}',
+            'model_name': row['model_name'],
+            'input_data': input_data,
+            'region': row.get('region') or row.get('region_preference') or Config.DEFAULT_REGION,
+            'submitted_ts': _timestamp(arrival),
+            'runtime': runtime
+        }
+        if row.get('deadline_ts') not in (None, ''):
+            job['deadline_ts'] = float(row['deadline_ts'])
+        elif row.get('timeout') not in (None, ''):
+            job['deadline_ts'] = job['submitted_ts'] + float(row['timeout'])
+        jobs.append(job)
+
+    jobs.sort(key=lambda job: job['submitted_ts'])
+    return jobs
+
+
+@dataclass
+class SimNode:
+    node_id: str
+    region: str
+    slots: int = 1
+    speed: float = 1.0  # runtime multiplier
+    cold_start: float = 0.0
+    running: int = 0
+    busy_time: float = 0.0
+    warm: set = field(default_factory=set)
+    exec_stats: Dict[str, str] = field(default_factory=dict)
+
+    def info(self) -> Dict[str, Any]:
+        """Node info in the shape the dispatcher reads from Redis"""
+        return {
+            'node_id': self.node_id,
+            'region': self.region,
+            'status': 'available',
+            'current_load': str(self.running / self.slots),
+            'capacity': '1.0',
+            'slots': self.slots,
+            'slots_used': self.running,
+            'queued': 0,
+            'warm_models': json.dumps(sorted(self.warm)),
+            'exec_stats': self.exec_stats
+        }
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+class Simulator:
+    def __init__(self, jobs, nodes, policy, ctx, window, speed=1.0):
+        self.jobs = jobs
+        self.nodes = {node.node_id: node for node in nodes}
+        self.policy = policy
+        self.window = window
+        self.speed = speed
+        self.runtime_stats = {}
+        # Placement estimates nodes without history from the same online predictor
+        self.ctx = replace(ctx, runtime_stats=self.runtime_stats)
+        self.queue = []
+        self.events = []
+        self._seq = 0
+        self.now = 0.0
+        self.completed = []
+        self.dropped = 0
+
+    def push(self, when, kind, payload):
+        self._seq += 1
+        heapq.heappush(self.events, (when, self._seq, kind, payload))
+
+    def order(self, window):
+        if self.policy == SJF:
+            return sorted(window, key=lambda job: sjf_key(
+                job, self.runtime_stats, self.now, Config.SJF_AGING_RATE, Config.SJF_DEFAULT_RUNTIME
+            ))
+        if self.policy == EDF:
+            return sorted(window, key=lambda job: edf_key(job, Config.DEFAULT_JOB_TIMEOUT))
+        return window
+
+    def has_free_slot(self) -> bool:
+        return any(node.running < node.slots for node in self.nodes.values())
+
+    def dispatch(self):
+        """Dispatcher passes over the queue, one window at a time
+
+        Jobs no node can take stay queued without holding up the jobs behind
+        them; passes stop once every slot is busy.
+        """
+        pending = self.queue
+        waiting = []
+        while pending and self.has_free_slot():
+            window = self.order(pending[:self.window])
+            pending = pending[self.window:]
+            waiting.extend(self.dispatch_window(window))
+        self.queue = waiting + pending
+
+    def dispatch_window(self, window) -> List[Dict[str, Any]]:
+        """Place the jobs of one window, returns those left waiting"""
+        waiting = []
+        for job in window:
+            if self.policy == EDF and will_miss_deadline(
+                    job, self.runtime_stats, self.now, Config.DEFAULT_JOB_TIMEOUT):
+                self.dropped += 1
+                continue
+
+            infos = {node_id: node.info() for node_id, node in self.nodes.items()}
+            ranked = rank_nodes(infos, job, self.ctx, self.now)
+            if not ranked:
+                waiting.append(job)
+                continue
+
+            node = self.nodes[ranked[0][0]]
+            runtime = job['runtime'] * node.speed
+            if is_cold(infos[node.node_id], job['model_name']):
+                runtime += node.cold_start
+                node.warm.add(job['model_name'])
+
+            node.running += 1
+            node.busy_time += runtime
+            job['dispatched_at'] = self.now
+            self.push(self.now + runtime, FINISH, (node.node_id, job, runtime))
+
+        return waiting
+
+    def finish(self, node_id, job, runtime):
+        node = self.nodes[node_id]
+        node.running -= 1
+        job['finished_at'] = self.now
+        self.completed.append(job)
+
+        # Same online training as the aggregator
+        ewma_update(node.exec_stats, job['model_name'], runtime, Config.EXEC_STATS_ALPHA)
+        size = input_size(job['input_data'])
+        for prefix in training_keys(job['model_name'], None, size):
+            ewma_update(self.runtime_stats, prefix, runtime, Config.EXEC_STATS_ALPHA)
+
+    def run(self) -> Dict[str, Any]:
+        start = self.jobs[0]['submitted_ts'] if self.jobs else 0.0
+        for job in self.jobs:
+            job = dict(job)
+            # Replay speed compresses the gaps between arrivals, not timeouts
+            offset = (job['submitted_ts'] - start) / self.speed
+            if 'deadline_ts' in job:
+                job['deadline_ts'] = offset + job['deadline_ts'] - job['submitted_ts']
+            job['submitted_ts'] = offset
+            self.push(offset, ARRIVAL, job)
+            # Nothing else would wake the dispatcher when the job may spill
+            self.push(offset + self.ctx.spill_wait_threshold, RETRY, None)
+
+        while self.events:
+            self.now, _, kind, payload = heapq.heappop(self.events)
+            if kind == ARRIVAL:
+                self.queue.append(payload)
+            elif kind == FINISH:
+                self.finish(*payload)
+            # Handle every event at this instant before dispatching
+            if not self.events or self.events[0][0] > self.now:
+                self.dispatch()
+
+        return self.report()
+
+    def report(self) -> Dict[str, Any]:
+        waits = [job['dispatched_at'] - job['submitted_ts'] for job in self.completed]
+        latencies = [job['finished_at'] - job['submitted_ts'] for job in self.completed]
+        makespan = max((job['finished_at'] for job in self.completed), default=0.0)
+        total_slots = sum(node.slots for node in self.nodes.values())
+        missed = sum(1 for job in self.completed
+                     if 'deadline_ts' in job and job['finished_at'] > job['deadline_ts'])
+
+        return {
+            'policy': self.policy,
+            'completed': len(self.completed),
+            'dropped': self.dropped,
+            'unplaced': len(self.queue),
+            'deadline_missed': missed,
+            'mean_wait': sum(waits) / len(waits) if waits else 0.0,
+            'p99_wait': percentile(waits, 99),
+            'mean_latency': sum(latencies) / len(latencies) if latencies else 0.0,
+            'p50_latency': percentile(latencies, 50),
+            'p99_latency': percentile(latencies, 99),
+            'utilization': sum(n.busy_time for n in self.nodes.values()) / (total_slots * makespan)
+                           if makespan else 0.0,
+            'throughput': len(self.completed) / makespan if makespan else 0.0
+        }
+
+
+def build_nodes(spec: str, cold_start: float) -> List[SimNode]:
+    """Nodes from 'count:region:slots:speed' groups separated by commas"""
+    nodes = []
+    for group in spec.split(','):
+        parts = group.split(':')
+        count = int(parts[0])
+        region = parts[1] if len(parts) > 1 and parts[1] else Config.DEFAULT_REGION
+        slots = int(parts[2]) if len(parts) > 2 else 1
+        speed = float(parts[3]) if len(parts) > 3 else 1.0
+        for _ in range(count):
+            nodes.append(SimNode(f'sim_node_{len(nodes)}', region, slots, speed, cold_start))
+    return nodes
+
+
+def print_report(reports: List[Dict[str, Any]]):
+    print(f"{'policy':<8}{'done':>7}{'drop':>6}{'stuck':>7}{'late':>6}{'wait':>9}{'p99 wait':>10}"
+          f"{'mean':>9}{'p50':>9}{'p99':>9}{'util':>7}{'jobs/s':>9}")
+    for r in reports:
+        print(f"{r['policy']:<8}{r['completed']:>7}{r['dropped']:>6}{r['unplaced']:>7}{r['deadline_missed']:>6}"
+              f"{r['mean_wait']:>9.3f}{r['p99_wait']:>10.3f}{r['mean_latency']:>9.3f}"
+              f"{r['p50_latency']:>9.3f}{r['p99_latency']:>9.3f}{r['utilization']:>7.1%}"
+              f"{r['throughput']:>9.2f}")
+
+    baseline = reports[0]
+    for r in reports[1:]:
+        if baseline['mean_latency']:
+            change = (r['mean_latency'] - baseline['mean_latency']) / baseline['mean_latency']
+            print(f"{r['policy']} vs {baseline['policy']}: mean latency {change:+.1%}")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('trace', help='JSONL or CSV job trace')
+    parser.add_argument('--policies', default=f'{FIFO},{SJF},{EDF}')
+    parser.add_argument('--nodes', default='4', help="'count:region:slots:speed' groups, comma separated")
+    parser.add_argument('--speed', type=float, default=1.0, help='replay speed (2 = arrivals twice as fast)')
+    parser.add_argument('--window', type=int, default=Config.DISPATCH_WINDOW)
+    parser.add_argument('--cold-start', type=float, default=0.0, help='seconds to load a model on a node')
+    parser.add_argument('--default-runtime', type=float, default=Config.SJF_DEFAULT_RUNTIME)
+    parser.add_argument('--region-latency', default=Config.REGION_LATENCY_MS,
+                        help="'src|dst=ms' pairs, comma separated (default REGION_LATENCY_MS)")
+    args = parser.parse_args(argv)
+
+    jobs = load_trace(args.trace, args.default_runtime)
+    ctx = PlacementContext(
+        cold_start_penalty=Config.COLD_START_PENALTY,
+        region_latency=parse_region_latency(args.region_latency),
+        spill_wait_threshold=Config.SPILL_WAIT_THRESHOLD,
+        spill_max_latency_ms=Config.SPILL_MAX_LATENCY_MS,
+        spill_latency_weight=Config.SPILL_LATENCY_WEIGHT,
+        completion_weight=Config.COMPLETION_WEIGHT,
+        completion_risk_factor=Config.COMPLETION_RISK_FACTOR,
+        default_runtime=args.default_runtime,
+        cold_load_seconds=args.cold_start
+    )
+
+    print(f"Simulating {len(jobs)} jobs at {args.speed}x on nodes '{args.nodes}'")
+    reports = []
+    for policy in args.policies.split(','):
+        nodes = build_nodes(args.nodes, args.cold_start)
+        reports.append(Simulator(jobs, nodes, policy, ctx, args.window, args.speed).run())
+    print_report(reports)
+
+
+if __name__ == '__main__':
+    main()
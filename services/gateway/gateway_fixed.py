@@ -12,12 +12,25 @@ from datetime import datetime
 import hashlib
 import uuid
 import logging
+import time
+from typing import Optional
+
+from shared.config import Config
+from shared.job_events import SUBMITTED, event, event_stream, transition_call
+from shared.models import JobStatus
+from shared.queues import job_queue_key, region_queue_keys, served_regions
+from shared.redis_scripts import CACHE_LOOKUP, CACHE_RELEASE, JOB_COMPLETE, JOB_TRANSITION
+from shared.reputation import reputation, reputation_key
+from shared.result_cache import LRU_KEY, cache_key, lookup_keys, release_keys
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 app = FastAPI(title="SynapseGrid Gateway")
 
+# CACHE_LOOKUP outcome -> metrics:result_cache counter
+CACHE_OUTCOMES = {'hit': 'hits', 'lead': 'misses', 'follow': 'coalesced'}
+
 # Global connections
 redis_pool = None
 db_pool = None
@@ -27,6 +40,9 @@ class JobSubmission(BaseModel):
     input_data: dict
     priority: int = 1
     gpu_requirements: dict = {}
+    region: Optional[str] = None
+    timeout: int = Config.DEFAULT_JOB_TIMEOUT
+    cache: bool = False  # reuse the result of an identical (model, input) job
 
 @app.on_event("startup")
 async def startup():
@@ -76,6 +92,14 @@ async def submit_job(
     token = authorization.replace("Bearer ", "")
     client_id = x_client_id or "anonymous"
     
+    # A region no dispatcher consumes would strand the job in its queue
+    region = job.region or Config.DEFAULT_REGION
+    if region not in served_regions():
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown region '{region}', expected one of: {', '.join(served_regions())}"
+        )
+    
     # Verify client exists
     async with db_pool.acquire() as conn:
         client = await conn.fetchrow(
@@ -110,25 +134,64 @@ async def submit_job(
             ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9)
         """, job_id, client_id, job.model_name, json.dumps(job.input_data),
             'pending', job.priority, job.priority * 0.01, json.dumps(job.gpu_requirements),
-            'eu-west-1'
+            region
         )
         
-        # Add to Redis queue
+        submitted_ts = time.time()
         job_data = {
             'job_id': job_id,
             'client_id': client_id,
             'model_name': job.model_name,
             'input_data': job.input_data,
             'priority': job.priority,
+            'region': region,
+            'submitted_ts': submitted_ts,
+            'deadline_ts': submitted_ts + job.timeout,
             'timestamp': datetime.utcnow().isoformat()
         }
         
-        await redis_pool.lpush('jobs:queue:eu-west-1', json.dumps(job_data))
+        await redis_pool.xadd(event_stream(job_id), event(job_id, SUBMITTED, client_id=client_id,
+                                                          model_name=job.model_name, region=region))
         
-        # Publish event
-        await redis_pool.publish('jobs:new', job_id)
+        role = 'lead'
+        if job.cache:
+            job_data['cache_key'] = cache_key(job.model_name, job.input_data)
+            role, value = await redis_pool.eval(
+                CACHE_LOOKUP, keys=lookup_keys(job_data['cache_key']),
+                args=[job_id, json.dumps(job_data), job.timeout]
+            )
+            await redis_pool.hincrby('metrics:result_cache', CACHE_OUTCOMES[role], 1)
+        
+        if role == 'hit':
+            # Served from the cache: the job completes without running
+            await redis_pool.zadd(LRU_KEY, time.time(), job_data['cache_key'], exist=redis_pool.ZSET_IF_EXIST)
+            keys, args = transition_call(job_id, JobStatus.COMPLETED, 'cache')
+            await redis_pool.eval(JOB_TRANSITION, keys=keys, args=args)
+            await conn.execute("""
+                UPDATE jobs
+                SET status = 'completed', result = $1, estimated_cost = 0,
+                    completed_at = NOW(), updated_at = NOW()
+                WHERE job_id = $2
+            """, value, job_id)
+            logger.info(f"🧮 Job {job_id} served from the result cache for {client_id}")
+            return {
+                "job_id": job_id,
+                "status": "completed",
+                "estimated_cost": 0,
+                "cached": True,
+                "message": "Job completed from cache",
+                "submitted_at": datetime.utcnow().isoformat()
+            }
         
-        logger.info(f"✅ Job {job_id} submitted by {client_id}")
+        # Followers wait for the identical job already running
+        if role == 'lead':
+            await redis_pool.lpush(job_queue_key(region, job_id), json.dumps(job_data))
+            
+            # Publish event
+            await redis_pool.publish('jobs:new', job_id)
+        
+        logger.info(f"✅ Job {job_id} submitted by {client_id}" +
+                    (f" (coalesced with {value})" if role == 'follow' else ""))
         
     return {
         "job_id": job_id,
@@ -153,21 +216,86 @@ async def get_job_status(job_id: str):
         
         return dict(job)
 
+@app.delete("/jobs/{job_id}")
+async def cancel_job(
+    job_id: str,
+    authorization: str = Header(None),
+    x_client_id: str = Header(None)
+):
+    """Cancel a job: queued jobs are dropped at dispatch, running ones are
+    stopped on their node and their slot is released immediately"""
+    if not authorization or not authorization.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Invalid authorization")
+    # Same default as submit_job, so a missing header cannot cancel anyone's job
+    client_id = x_client_id or "anonymous"
+    
+    async with db_pool.acquire() as conn:
+        job = await conn.fetchrow(
+            "SELECT client_id, model_name, input_data FROM jobs WHERE job_id = $1", job_id
+        )
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job['client_id'] != client_id:
+        raise HTTPException(status_code=403, detail="Job belongs to another client")
+    
+    keys, args = transition_call(job_id, JobStatus.CANCELLED, 'client')
+    if not await redis_pool.eval(JOB_TRANSITION, keys=keys, args=args):
+        raise HTTPException(status_code=409, detail="Job already finished")
+    
+    # Nodes skip cancelled jobs they have not started yet; the dispatcher
+    # drops them when they come out of the queue
+    await redis_pool.setex(f'job:{job_id}:cancelled', Config.JOB_STATE_TTL, 'client')
+    
+    # Running: tell the node(s) to stop and free the slot now
+    assignment_keys = [f'job:{job_id}:assigned', f'job:{job_id}:hedge_assigned']
+    node_id, hedge_node = await redis_pool.mget(*assignment_keys)
+    for target in {node_id, hedge_node} - {None}:
+        await redis_pool.publish(f'node:{target}:control', json.dumps({'type': 'cancel', 'job_id': job_id}))
+    for key in assignment_keys:
+        await redis_pool.eval(JOB_COMPLETE, keys=[key, 'nodes:load'], args=[job_id])
+    
+    # Jobs coalesced behind this one must now run on their own
+    input_data = json.loads(job['input_data']) if isinstance(job['input_data'], str) else job['input_data']
+    followers = await redis_pool.eval(
+        CACHE_RELEASE, keys=release_keys(cache_key(job['model_name'], input_data)), args=[job_id]
+    )
+    for follower_json in followers:
+        follower = json.loads(follower_json)
+        follower.pop('cache_key', None)
+        await redis_pool.lpush(job_queue_key(follower['region'], follower['job_id']), json.dumps(follower))
+    
+    async with db_pool.acquire() as conn:
+        await conn.execute("""
+            UPDATE jobs
+            SET status = 'cancelled', completed_at = NOW(), updated_at = NOW()
+            WHERE job_id = $1
+            AND status NOT IN ('completed', 'failed', 'cancelled')
+        """, job_id)
+    
+    logger.info(f"🛑 Job {job_id} cancelled ({'running on ' + node_id if node_id else 'queued'})")
+    return {"job_id": job_id, "status": "cancelled", "was_running": node_id is not None}
+
 @app.get("/nodes")
 async def get_nodes():
-    """Get list of active nodes"""
+    """Get list of active nodes, with their reputation from observed results"""
     nodes = []
     node_ids = await redis_pool.smembers('nodes:registered')
     
     for node_id in node_ids:
         node_info = await redis_pool.get(f'node:{node_id}:info')
         if node_info:
-            nodes.append(json.loads(node_info))
+            node = json.loads(node_info)
+            node['reputation'] = reputation(
+                await redis_pool.hgetall(reputation_key(node_id)), time.time(),
+                Config.REPUTATION_HALF_LIFE, Config.REPUTATION_PRIOR
+            )
+            node['success_rate'] = node['reputation']['success_rate']
+            nodes.append(node)
     
     return nodes
 
 @app.get("/metrics")
-async def get_metrics():
+async def get_metrics(region: Optional[str] = None):
     """Get system metrics"""
     async with db_pool.acquire() as conn:
         metrics = await conn.fetchrow("""
@@ -180,14 +308,28 @@ async def get_metrics():
             WHERE created_at > NOW() - INTERVAL '1 hour'
         """)
         
-    queue_length = await redis_pool.llen('jobs:queue:eu-west-1')
+    queue_length = 0
+    for queue in region_queue_keys(region or Config.DEFAULT_REGION):
+        queue_length += await redis_pool.llen(queue)
+    
+    deadline = await redis_pool.hgetall('metrics:deadline')
+    dropped = int(deadline.get('dropped', 0))
+    with_deadline = int(deadline.get('finished', 0)) + dropped
+    missed = int(deadline.get('missed', 0)) + dropped
+    
+    cache = await redis_pool.hgetall('metrics:result_cache')
+    lookups = sum(int(cache.get(field, 0)) for field in ('hits', 'misses', 'coalesced'))
     
     return {
         "pending_jobs": metrics['pending_jobs'],
         "processing_jobs": metrics['processing_jobs'],
         "completed_jobs": metrics['completed_jobs'],
         "active_nodes": metrics['active_nodes'],
-        "queue_length": queue_length
+        "queue_length": queue_length,
+        "deadline_miss_rate": missed / with_deadline if with_deadline else 0,
+        "wasted_compute_s": float(deadline.get('wasted_compute_s', 0)),
+        "result_cache_hit_rate": int(cache.get('hits', 0)) / lookups if lookups else 0,
+        "result_cache_coalesced": int(cache.get('coalesced', 0))
     }
 
 if __name__ == "__main__":
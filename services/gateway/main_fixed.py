@@ -12,9 +12,15 @@ import redis.asyncio as aioredis
 import asyncpg
 from fastapi import FastAPI, HTTPException, Depends, Header, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, ConfigDict
 import uvicorn
 
+from shared.config import Config
+from shared.models import TERMINAL_STATUSES
+from shared.queues import job_queue_key
+from shared.result_store import ResultStore
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -45,6 +51,7 @@ class ConnectionManager:
     def __init__(self):
         self.active_connections: Set[WebSocket] = set()
         self.subscriptions: Dict[WebSocket, Set[str]] = {}
+        self.relays: Dict[str, asyncio.Task] = {}
 
     async def connect(self, websocket: WebSocket):
         await websocket.accept()
@@ -78,6 +85,27 @@ class ConnectionManager:
             for conn in disconnected:
                 self.disconnect(conn)
 
+    def follow_job(self, job_id: str):
+        """Relay a job's partial results to the "jobs" channel, once per job"""
+        if job_id not in self.relays:
+            self.relays[job_id] = asyncio.create_task(self._relay_partials(job_id))
+
+    async def _relay_partials(self, job_id: str):
+        try:
+            async for _, fields in partial_chunks(job_id):
+                if not any("jobs" in channels for channels in self.subscriptions.values()):
+                    break
+                if fields:
+                    await self.broadcast({
+                        "type": "job_partial",
+                        "job_id": job_id,
+                        "payload": json.loads(fields["data"])
+                    }, channel="jobs")
+        except Exception as e:
+            logger.error(f"Error relaying partial results for {job_id}: {e}")
+        finally:
+            self.relays.pop(job_id, None)
+
 manager = ConnectionManager()
 
 # Utility functions
@@ -87,6 +115,52 @@ def generate_job_id() -> str:
 def verify_token(token: str) -> bool:
     return token == "test-token"
 
+async def terminal_status(job_id: str) -> Optional[str]:
+    """Final status from the job state machine, None while the job is live"""
+    state = await redis_client.get(f"job:{job_id}:state")
+    status = state.split("|")[0] if state else None
+    return status if status in {s.value for s in TERMINAL_STATUSES} else None
+
+def end_chunk(status: str) -> Dict[str, str]:
+    """End chunk for streams the node did not close itself"""
+    return {"type": "end", "data": json.dumps({"type": "end", "status": status})}
+
+async def partial_chunks(job_id: str, last_id: str = "0"):
+    """Yield (entry_id, fields) from job:{id}:partial until the stream ends
+
+    The stream ends with the node's end chunk, or once job:{id}:state is
+    terminal (failed before streaming, cancelled, result never cached...),
+    or after PARTIAL_STREAM_TIMEOUT; the last two yield a synthetic end
+    chunk with entry_id None. Yields (None, None) whenever a blocking read
+    times out so callers can send keepalives. Each read is capped at one
+    stream's worth of chunks, and the node trims the stream, so a slow
+    reader only ever holds a bounded backlog.
+    """
+    key = f"job:{job_id}:partial"
+    deadline = time.time() + Config.PARTIAL_STREAM_TIMEOUT
+    while True:
+        # Once the job is over, drain what is left without blocking
+        status = await terminal_status(job_id)
+        entries = await redis_client.xread(
+            {key: last_id}, count=Config.PARTIAL_STREAM_MAXLEN,
+            block=None if status else Config.PARTIAL_BLOCK_MS
+        )
+        for entry_id, fields in (entries[0][1] if entries else []):
+            last_id = entry_id
+            yield entry_id, fields
+            if fields.get("type") == "end":
+                return
+
+        if entries:
+            continue
+        if status:
+            yield None, end_chunk(status)
+            return
+        if time.time() >= deadline:
+            yield None, end_chunk("timeout")
+            return
+        yield None, None
+
 # Lifespan context manager avec retry pour PostgreSQL
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -197,12 +271,29 @@ async def get_current_metrics():
         active_jobs = await redis_client.get("metrics:active_jobs") or "0"
         avg_latency = await redis_client.get("metrics:avg_latency") or "0"
         throughput = await redis_client.get("metrics:throughput") or "0"
+        latency = json.loads(await redis_client.hget("metrics:latency", "all:all") or "{}")
+        cold_start = await redis_client.hgetall("metrics:cold_start")
+        
+        dispatched = int(cold_start.get("dispatched", 0))
+        cold_loads = int(cold_start.get("loads", 0))
+        
+        deadline = await redis_client.hgetall("metrics:deadline")
+        dropped = int(deadline.get("dropped", 0))
+        with_deadline = int(deadline.get("finished", 0)) + dropped
+        missed = int(deadline.get("missed", 0)) + dropped
         
         return {
             "totalNodes": int(total_nodes),
             "activeJobs": int(active_jobs),
             "avgLatency": float(avg_latency),
-            "throughput": float(throughput)
+            "throughput": float(throughput),
+            "latencyP50": latency.get("p50", 0),
+            "latencyP95": latency.get("p95", 0),
+            "latencyP99": latency.get("p99", 0),
+            "coldStartRate": int(cold_start.get("cold", 0)) / dispatched if dispatched else 0,
+            "avgColdStartMs": float(cold_start.get("load_ms_total", 0)) / cold_loads if cold_loads else 0,
+            "deadlineMissRate": missed / with_deadline if with_deadline else 0,
+            "wastedComputeS": float(deadline.get("wasted_compute_s", 0))
         }
     except Exception as e:
         logger.error(f"Error getting metrics: {e}")
@@ -263,6 +354,36 @@ async def get_nodes():
         logger.error(f"Error fetching nodes: {e}")
         return []
 
+@app.get("/job/{job_id}/result")
+async def get_job_result(job_id: str):
+    """Get a job's result from whichever storage tier holds it"""
+    if not redis_client:
+        raise HTTPException(status_code=503, detail="Service temporarily unavailable")
+    
+    result = await ResultStore(redis_client, postgres_pool).load(job_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Result not found or expired")
+    
+    return {"job_id": job_id, "result": json.loads(result)}
+
+@app.get("/job/{job_id}/stream")
+async def stream_job(job_id: str, last_event_id: Optional[str] = Header(None)):
+    """Stream a job's partial results (tokens, progress) as server-sent events"""
+    if not redis_client:
+        raise HTTPException(status_code=503, detail="Service temporarily unavailable")
+    
+    async def events():
+        async for entry_id, fields in partial_chunks(job_id, last_event_id or "0"):
+            if fields is None:
+                yield ": keepalive\n\n"
+            elif entry_id is None:
+                yield f"event: {fields['type']}\ndata: {fields['data']}\n\n"
+            else:
+                yield f"id: {entry_id}\nevent: {fields['type']}\ndata: {fields['data']}\n\n"
+    
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 @app.get("/jobs")
 async def get_jobs():
     """Get active jobs"""
@@ -316,6 +437,7 @@ async def submit_job(
         # Generate job ID
         job_id = generate_job_id()
         submitted_at = datetime.utcnow().isoformat()
+        submitted_ts = time.time()
         
         # Store job in Redis
         job_data = {
@@ -324,15 +446,27 @@ async def submit_job(
             "input_data": json.dumps(request.input_data),
             "priority": request.priority,
             "timeout": request.timeout,
+            "deadline_ts": str(submitted_ts + request.timeout),
             "status": "pending",
             "progress": 0,
             "client_id": x_client_id or "unknown",
             "submitted_at": submitted_at,
-            "start_time": str(time.time())
+            "start_time": str(submitted_ts)
         }
         
         await redis_client.hset(f"job:{job_id}:info", mapping=job_data)
-        await redis_client.lpush(f"jobs:queue:{request.priority}", job_id)
+        # Same payload and partitioned queue as the main gateway, so a dispatcher consumes it
+        await redis_client.lpush(job_queue_key(Config.DEFAULT_REGION, job_id), json.dumps({
+            "job_id": job_id,
+            "client_id": job_data["client_id"],
+            "model_name": request.model_name,
+            "input_data": request.input_data,
+            "priority": request.priority,
+            "region": Config.DEFAULT_REGION,
+            "submitted_ts": submitted_ts,
+            "deadline_ts": submitted_ts + request.timeout,
+            "timestamp": submitted_at
+        }))
         await redis_client.incr("metrics:active_jobs")
         
         # Broadcast job creation
@@ -386,6 +520,16 @@ async def websocket_endpoint(websocket: WebSocket):
                     "channels": channels
                 }))
             
+            elif message.get("type") == "stream":
+                # Partial results arrive on the "jobs" channel as job_partial
+                job_id = message.get("job_id")
+                await manager.subscribe(websocket, ["jobs"])
+                manager.follow_job(job_id)
+                await websocket.send_text(json.dumps({
+                    "type": "streaming",
+                    "job_id": job_id
+                }))
+            
             elif message.get("type") == "ping":
                 await websocket.send_text(json.dumps({
                     "type": "pong",
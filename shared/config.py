@@ -15,18 +15,104 @@ class Config:
     # Gateway Configuration
     GATEWAY_HOST: str = os.getenv("GATEWAY_HOST", "0.0.0.0")
     GATEWAY_PORT: int = int(os.getenv("GATEWAY_PORT", "8080"))
+    PARTIAL_STREAM_MAXLEN: int = int(os.getenv("PARTIAL_STREAM_MAXLEN", "256"))
+    PARTIAL_STREAM_TTL: int = int(os.getenv("PARTIAL_STREAM_TTL", "600"))
+    PARTIAL_BLOCK_MS: int = int(os.getenv("PARTIAL_BLOCK_MS", "15000"))
+    PARTIAL_STREAM_TIMEOUT: float = float(os.getenv("PARTIAL_STREAM_TIMEOUT", "900"))
     
     # Security
     JWT_SECRET: str = os.getenv("JWT_SECRET", "synapse-secret-key-change-in-production")
     TOKEN_CACHE_TTL: int = int(os.getenv("TOKEN_CACHE_TTL", "15"))
     
     # Job Configuration
+    DEFAULT_REGION: str = os.getenv("DEFAULT_REGION", "eu-west-1")
+    QUEUE_PARTITIONS: int = int(os.getenv("QUEUE_PARTITIONS", "16"))
     DEFAULT_JOB_TIMEOUT: int = int(os.getenv("DEFAULT_JOB_TIMEOUT", "300"))
     MAX_RETRIES: int = int(os.getenv("MAX_RETRIES", "3"))
+    JOB_LEASE_TIMEOUT: int = int(os.getenv("JOB_LEASE_TIMEOUT", "30"))
+    JOB_ASSIGNMENT_TTL: int = int(os.getenv("JOB_ASSIGNMENT_TTL", "300"))
+    JOB_STATE_TTL: int = int(os.getenv("JOB_STATE_TTL", "86400"))
+    EVENT_LOG_PARTITIONS: int = int(os.getenv("EVENT_LOG_PARTITIONS", "16"))
+    EVENT_LOG_DIR: str = os.getenv("EVENT_LOG_DIR", "/data/events")
+    EVENT_SEGMENT_BYTES: int = int(os.getenv("EVENT_SEGMENT_BYTES", str(64 * 1024 * 1024)))
+    EVENT_STREAM_RETENTION: float = float(os.getenv("EVENT_STREAM_RETENTION", "3600"))
+    EVENT_ARCHIVE_INTERVAL: float = float(os.getenv("EVENT_ARCHIVE_INTERVAL", "5.0"))
+    EVENT_ARCHIVE_BATCH: int = int(os.getenv("EVENT_ARCHIVE_BATCH", "1000"))
+    EVENT_COMPACT_AFTER: float = float(os.getenv("EVENT_COMPACT_AFTER", str(7 * 86400)))
+    LEASE_REAP_INTERVAL: float = float(os.getenv("LEASE_REAP_INTERVAL", "1.0"))
+    LEASE_REAP_BATCH: int = int(os.getenv("LEASE_REAP_BATCH", "100"))
+    RETRY_BASE_DELAY: float = float(os.getenv("RETRY_BASE_DELAY", "1.0"))
+    RETRY_MAX_DELAY: float = float(os.getenv("RETRY_MAX_DELAY", "60.0"))
+    RETRY_POLL_INTERVAL: float = float(os.getenv("RETRY_POLL_INTERVAL", "0.5"))
+    STUCK_JOB_SCAN_INTERVAL: int = int(os.getenv("STUCK_JOB_SCAN_INTERVAL", "300"))
     
     # Node Configuration
     NODE_HEARTBEAT_INTERVAL: int = int(os.getenv("NODE_HEARTBEAT_INTERVAL", "10"))
     NODE_TIMEOUT: int = int(os.getenv("NODE_TIMEOUT", "30"))
+    DEFAULT_NODE_SLOTS: int = int(os.getenv("DEFAULT_NODE_SLOTS", "1"))
+    SLOT_RECONCILE_INTERVAL: float = float(os.getenv("SLOT_RECONCILE_INTERVAL", "15.0"))
+    REPUTATION_HALF_LIFE: float = float(os.getenv("REPUTATION_HALF_LIFE", "600"))
+    REPUTATION_PRIOR: float = float(os.getenv("REPUTATION_PRIOR", "5"))
+    REPUTATION_DRAIN_SCORE: float = float(os.getenv("REPUTATION_DRAIN_SCORE", "0.5"))
+    REPUTATION_WEIGHT: float = float(os.getenv("REPUTATION_WEIGHT", "1.0"))
+    
+    # Dispatcher Configuration
+    DISPATCHER_ID: str = os.getenv("DISPATCHER_ID", "")
+    DISPATCHER_MEMBER_TTL: float = float(os.getenv("DISPATCHER_MEMBER_TTL", "5.0"))
+    DISPATCHER_HEARTBEAT_INTERVAL: float = float(os.getenv("DISPATCHER_HEARTBEAT_INTERVAL", "1.0"))
+    DISPATCHER_LEADER_TTL: float = float(os.getenv("DISPATCHER_LEADER_TTL", "0.75"))
+    STANDBY_POLL_MS: int = int(os.getenv("STANDBY_POLL_MS", "100"))
+    STATE_SNAPSHOT_INTERVAL: float = float(os.getenv("STATE_SNAPSHOT_INTERVAL", "10.0"))
+    DISPATCH_IDLE_SLEEP: float = float(os.getenv("DISPATCH_IDLE_SLEEP", "0.05"))
+    
+    # Aggregator Configuration
+    AGGREGATOR_GROUP: str = os.getenv("AGGREGATOR_GROUP", "aggregators")
+    AGGREGATOR_CONSUMERS: int = int(os.getenv("AGGREGATOR_CONSUMERS", "4"))
+    RESULTS_READ_COUNT: int = int(os.getenv("RESULTS_READ_COUNT", "100"))
+    RESULTS_BLOCK_MS: int = int(os.getenv("RESULTS_BLOCK_MS", "5000"))
+    RESULTS_CLAIM_IDLE_MS: int = int(os.getenv("RESULTS_CLAIM_IDLE_MS", "60000"))
+    RESULTS_CLAIM_INTERVAL: float = float(os.getenv("RESULTS_CLAIM_INTERVAL", "30.0"))
+    RESULTS_MAX_DELIVERIES: int = int(os.getenv("RESULTS_MAX_DELIVERIES", "5"))
+    RESULTS_STREAM_MAXLEN: int = int(os.getenv("RESULTS_STREAM_MAXLEN", "100000"))
+    RESULT_FLUSH_SIZE: int = int(os.getenv("RESULT_FLUSH_SIZE", "200"))
+    RESULT_FLUSH_MS: float = float(os.getenv("RESULT_FLUSH_MS", "50"))
+    RESULT_INLINE_MAX_BYTES: int = int(os.getenv("RESULT_INLINE_MAX_BYTES", "4096"))
+    RESULT_PG_MAX_BYTES: int = int(os.getenv("RESULT_PG_MAX_BYTES", "262144"))
+    RESULT_INLINE_TTL: int = int(os.getenv("RESULT_INLINE_TTL", "3600"))
+    RESULT_INLINE_BUDGET_BYTES: int = int(os.getenv("RESULT_INLINE_BUDGET_BYTES", str(64 * 1024 * 1024)))
+    RESULT_PG_BUDGET_BYTES: int = int(os.getenv("RESULT_PG_BUDGET_BYTES", str(1024 ** 3)))
+    RESULT_LOB_BUDGET_BYTES: int = int(os.getenv("RESULT_LOB_BUDGET_BYTES", str(10 * 1024 ** 3)))
+    RESULT_CACHE_TTL: int = int(os.getenv("RESULT_CACHE_TTL", "3600"))
+    RESULT_CACHE_MAX_BYTES: int = int(os.getenv("RESULT_CACHE_MAX_BYTES", "65536"))
+    RESULT_CACHE_BUDGET_BYTES: int = int(os.getenv("RESULT_CACHE_BUDGET_BYTES", str(256 * 1024 * 1024)))
+    LATENCY_WINDOW: float = float(os.getenv("LATENCY_WINDOW", "60"))
+    LATENCY_WINDOW_SLOTS: int = int(os.getenv("LATENCY_WINDOW_SLOTS", "6"))
+    LATENCY_PUBLISH_INTERVAL: float = float(os.getenv("LATENCY_PUBLISH_INTERVAL", "5.0"))
+    AGGREGATOR_METRICS_PORT: int = int(os.getenv("AGGREGATOR_METRICS_PORT", "8002"))
+    
+    # Scheduling Configuration
+    COLD_START_PENALTY: float = float(os.getenv("COLD_START_PENALTY", "0.5"))
+    DISPATCHER_REGIONS: str = os.getenv("DISPATCHER_REGIONS", os.getenv("DEFAULT_REGION", "eu-west-1"))
+    # Every region some dispatcher consumes; the gateway rejects jobs for any other
+    REGIONS: str = os.getenv("REGIONS", os.getenv("DISPATCHER_REGIONS", os.getenv("DEFAULT_REGION", "eu-west-1")))
+    # Inter-region latency, symmetric: "eu-west-1|us-east-1=80,eu-west-1|eu-central-1=25"
+    REGION_LATENCY_MS: str = os.getenv("REGION_LATENCY_MS", "")
+    SPILL_WAIT_THRESHOLD: float = float(os.getenv("SPILL_WAIT_THRESHOLD", "2.0"))
+    SPILL_MAX_LATENCY_MS: float = float(os.getenv("SPILL_MAX_LATENCY_MS", "150"))
+    EXEC_STATS_ALPHA: float = float(os.getenv("EXEC_STATS_ALPHA", "0.2"))
+    COMPLETION_WEIGHT: float = float(os.getenv("COMPLETION_WEIGHT", "1.0"))
+    COMPLETION_RISK_FACTOR: float = float(os.getenv("COMPLETION_RISK_FACTOR", "1.0"))
+    SPILL_LATENCY_WEIGHT: float = float(os.getenv("SPILL_LATENCY_WEIGHT", "0.005"))
+    SCHEDULING_POLICY: str = os.getenv("SCHEDULING_POLICY", "fifo")  # fifo | sjf | edf
+    DISPATCH_WINDOW: int = int(os.getenv("DISPATCH_WINDOW", os.getenv("SJF_WINDOW", "16")))
+    SJF_AGING_RATE: float = float(os.getenv("SJF_AGING_RATE", "0.1"))
+    SJF_DEFAULT_RUNTIME: float = float(os.getenv("SJF_DEFAULT_RUNTIME", "1.0"))
+    RUNTIME_BOOTSTRAP_JOBS: int = int(os.getenv("RUNTIME_BOOTSTRAP_JOBS", "10000"))
+    BATCHING_ENABLED: bool = os.getenv("BATCHING_ENABLED", "false").lower() == "true"
+    BATCH_LINGER_MS: float = float(os.getenv("BATCH_LINGER_MS", "20"))
+    HEDGING_ENABLED: bool = os.getenv("HEDGING_ENABLED", "false").lower() == "true"
+    HEDGE_CHECK_INTERVAL: float = float(os.getenv("HEDGE_CHECK_INTERVAL", "1.0"))
+    HEDGE_BUDGET: float = float(os.getenv("HEDGE_BUDGET", "0.05"))  # max hedges / dispatched jobs
     
     # Blockchain Configuration
     POLYGON_RPC_URL: str = os.getenv("POLYGON_RPC_URL", "https://polygon-rpc.com")
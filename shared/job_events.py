@@ -0,0 +1,223 @@
+"""Append-only job lifecycle event log
+
+Every job transition appends one event to job_events:p{n}, the partition
+picked from the job_id, so the events of a job stay in order:
+
+- submitted: by the gateway
+- assigned: by the dispatcher's JOB_TRANSITION, once per assignment (a
+  requeued job is assigned again) unless the node already reported its start
+- started: by the node, atomically with the move to running
+- completed / failed / cancelled: by JOB_TRANSITION, atomically with the
+  state change, so exactly once per job
+
+The archiver copies each partition to JSONL segment files in
+EVENT_LOG_DIR/p{n}/, named after their first entry id and fsynced before
+anything is trimmed from Redis; the stream keeps the last
+EVENT_STREAM_RETENTION seconds. Compaction rewrites segments older than
+EVENT_COMPACT_AFTER keeping only each job's last event, which still carries
+its final status and node. replay() reads the segments, then the stream
+entries not archived yet.
+
+EventLog uses the redis.asyncio client API.
+"""
+
+import asyncio
+import json
+import os
+import time
+from typing import Dict, List, Optional
+
+from shared.config import Config
+from shared.models import JobStatus, transition_sources
+from shared.queues import partition_for
+
+SUBMITTED = 'submitted'
+ASSIGNED = 'assigned'
+STARTED = 'started'
+
+ARCHIVER_LOCK = 'job_events:archiver'
+
+
+def partition_stream(partition: int) -> str:
+    return f'job_events:p{partition}'
+
+
+def event_stream(job_id: str) -> str:
+    return partition_stream(partition_for(job_id, Config.EVENT_LOG_PARTITIONS))
+
+
+def event(job_id: str, name: str, **data) -> Dict[str, str]:
+    """Stream fields of an event; empty values are left out"""
+    fields = {'job_id': job_id, 'event': name, 'ts': str(time.time())}
+    fields.update({key: str(value) for key, value in data.items() if value not in (None, '')})
+    return fields
+
+
+def transition_call(job_id: str, status: JobStatus, owner: str, node_id: Optional[str] = None):
+    """(keys, args) for JOB_TRANSITION"""
+    keys = [f'job:{job_id}:state', 'metrics:jobs', event_stream(job_id)]
+    args = [status.value, owner, Config.JOB_STATE_TTL, job_id, time.time(), node_id or '',
+            *transition_sources(status)]
+    return keys, args
+
+
+def entry_key(entry_id: str):
+    """Sortable form of a stream entry id"""
+    ms, _, seq = entry_id.partition('-')
+    return int(ms), int(seq or 0)
+
+
+# Segment files
+
+def partition_dir(directory: str, partition: int) -> str:
+    return os.path.join(directory, f'p{partition}')
+
+
+def segments(directory: str, partition: int) -> List[str]:
+    """Segment paths of a partition, oldest first"""
+    path = partition_dir(directory, partition)
+    if not os.path.isdir(path):
+        return []
+    names = [name for name in os.listdir(path) if name.endswith('.jsonl')]
+    names.sort(key=lambda name: entry_key(name[:-len('.jsonl')]))
+    return [os.path.join(path, name) for name in names]
+
+
+def read_segment(path: str) -> List[Dict[str, str]]:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def last_archived_id(directory: str, partition: int) -> Optional[str]:
+    """Entry id of the last archived event of a partition"""
+    paths = segments(directory, partition)
+    if not paths:
+        return None
+    with open(paths[-1], 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        f.seek(max(0, f.tell() - 65536))
+        lines = f.read().splitlines()
+    return json.loads(lines[-1])['id'] if lines else None
+
+
+def append_segment(directory: str, partition: int, events: List[Dict[str, str]]):
+    """Append events to the newest segment, starting a new one when it is full"""
+    paths = segments(directory, partition)
+    if paths and os.path.getsize(paths[-1]) < Config.EVENT_SEGMENT_BYTES:
+        path = paths[-1]
+    else:
+        os.makedirs(partition_dir(directory, partition), exist_ok=True)
+        path = os.path.join(partition_dir(directory, partition), f"{events[0]['id']}.jsonl")
+
+    with open(path, 'a') as f:
+        for entry in events:
+            f.write(json.dumps(entry) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def compact_partition(directory: str, partition: int, before: float) -> int:
+    """Merge the closed segments whose events all predate `before`
+
+    Only each job's last event is kept. Returns the number of events dropped.
+    """
+    old = []
+    for path in segments(directory, partition)[:-1]:
+        events = read_segment(path)
+        if events and float(events[-1]['ts']) >= before:
+            break
+        old.append((path, events))
+    if not old:
+        return 0
+
+    latest = {}
+    total = 0
+    for _, events in old:
+        total += len(events)
+        for entry in events:
+            latest[entry['job_id']] = entry
+    kept = sorted(latest.values(), key=lambda entry: entry_key(entry['id']))
+    if len(old) == 1 and len(kept) == total:
+        return 0
+
+    # The merged segment replaces the first one in place, then the rest go
+    first = old[0][0]
+    tmp = f'{first}.tmp'
+    with open(tmp, 'w') as f:
+        for entry in kept:
+            f.write(json.dumps(entry) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, first)
+    for path, _ in old[1:]:
+        os.remove(path)
+    return total - len(kept)
+
+
+class EventLog:
+    def __init__(self, redis, directory=None):
+        self.redis = redis
+        self.directory = directory or Config.EVENT_LOG_DIR
+
+    async def acquire_archiver(self, owner, ttl):
+        """Only one process archives, since segments live on one disk"""
+        if await self.redis.set(ARCHIVER_LOCK, owner, nx=True, ex=int(ttl)):
+            return True
+        if await self.redis.get(ARCHIVER_LOCK) == owner:
+            await self.redis.expire(ARCHIVER_LOCK, int(ttl))
+            return True
+        return False
+
+    async def archive_partition(self, partition):
+        loop = asyncio.get_running_loop()
+        stream = partition_stream(partition)
+        last = await loop.run_in_executor(None, last_archived_id, self.directory, partition)
+
+        response = await self.redis.xread({stream: last or '0'}, count=Config.EVENT_ARCHIVE_BATCH)
+        entries = response[0][1] if response else []
+        if entries:
+            events = [{'id': entry_id, **fields} for entry_id, fields in entries]
+            await loop.run_in_executor(None, append_segment, self.directory, partition, events)
+            last = entries[-1][0]
+
+        # Keep recent events in Redis for live readers, never unarchived ones
+        if last:
+            retention = f'{int((time.time() - Config.EVENT_STREAM_RETENTION) * 1000)}-0'
+            await self.redis.xtrim(stream, minid=min(last, retention, key=entry_key), approximate=True)
+        return len(entries)
+
+    async def archive(self):
+        """Archive one batch per partition; returns the number of events written"""
+        archived = 0
+        for partition in range(Config.EVENT_LOG_PARTITIONS):
+            archived += await self.archive_partition(partition)
+        return archived
+
+    async def compact(self, before=None):
+        before = before if before is not None else time.time() - Config.EVENT_COMPACT_AFTER
+        loop = asyncio.get_running_loop()
+        dropped = 0
+        for partition in range(Config.EVENT_LOG_PARTITIONS):
+            dropped += await loop.run_in_executor(None, compact_partition, self.directory, partition, before)
+        return dropped
+
+    async def replay(self, since=None):
+        """Yield every event in order per partition: segments, then the stream tail"""
+        loop = asyncio.get_running_loop()
+        for partition in range(Config.EVENT_LOG_PARTITIONS):
+            last = None
+            for path in await loop.run_in_executor(None, segments, self.directory, partition):
+                for entry in await loop.run_in_executor(None, read_segment, path):
+                    last = entry['id']
+                    if since is None or float(entry['ts']) >= since:
+                        yield entry
+
+            stream = partition_stream(partition)
+            while True:
+                response = await self.redis.xread({stream: last or '0'}, count=Config.EVENT_ARCHIVE_BATCH)
+                if not response or not response[0][1]:
+                    break
+                for entry_id, fields in response[0][1]:
+                    last = entry_id
+                    if since is None or float(fields['ts']) >= since:
+                        yield {'id': entry_id, **fields}
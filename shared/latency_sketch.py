@@ -0,0 +1,119 @@
+"""Fixed-memory latency sketches
+
+LogHistogram is an HDR-style histogram over log-spaced buckets: a value v
+lands in bucket floor(log(v / LATENCY_MIN) / log(GAMMA)), so every bucket
+spans the same relative width and a quantile read from it is within
+(GAMMA - 1) of the true value. Recording is O(1), memory is a fixed array
+of BUCKETS counters, and two histograms merge by adding counters, which is
+what lets aggregator replicas combine their sketches.
+
+WindowedSketch keeps a ring of histograms, one per sub-window, so
+quantiles cover the last `window` seconds without storing samples.
+"""
+
+import math
+from typing import Dict, Optional
+
+LATENCY_MIN = 0.001    # seconds; anything faster lands in the first bucket
+LATENCY_MAX = 3600.0   # seconds; anything slower lands in the last bucket
+GAMMA = 1.02
+BUCKETS = int(math.ceil(math.log(LATENCY_MAX / LATENCY_MIN) / math.log(GAMMA))) + 1
+
+_LOG_GAMMA = math.log(GAMMA)
+
+
+def bucket_index(value: float) -> int:
+    if value <= LATENCY_MIN:
+        return 0
+    return min(int(math.log(value / LATENCY_MIN) / _LOG_GAMMA), BUCKETS - 1)
+
+
+def bucket_value(index: int) -> float:
+    """Midpoint of a bucket, used as the value of every sample in it"""
+    return LATENCY_MIN * GAMMA ** index * (1 + GAMMA) / 2
+
+
+class LogHistogram:
+    __slots__ = ('counts', 'count', 'total')
+
+    def __init__(self):
+        self.counts = [0] * BUCKETS
+        self.count = 0
+        self.total = 0.0
+
+    def record(self, value: float):
+        self.counts[bucket_index(value)] += 1
+        self.count += 1
+        self.total += value
+
+    def merge(self, other: 'LogHistogram'):
+        for index, n in enumerate(other.counts):
+            if n:
+                self.counts[index] += n
+        self.count += other.count
+        self.total += other.total
+
+    def reset(self):
+        self.counts = [0] * BUCKETS
+        self.count = 0
+        self.total = 0.0
+
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = q * (self.count - 1)
+        seen = 0
+        for index, n in enumerate(self.counts):
+            seen += n
+            if seen > rank:
+                return bucket_value(index)
+        return bucket_value(BUCKETS - 1)
+
+    def to_dict(self) -> Dict:
+        """Sparse form for storing in Redis"""
+        return {
+            'buckets': {str(i): n for i, n in enumerate(self.counts) if n},
+            'count': self.count,
+            'total': self.total
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'LogHistogram':
+        histogram = cls()
+        for index, n in data.get('buckets', {}).items():
+            histogram.counts[int(index)] = n
+        histogram.count = data.get('count', 0)
+        histogram.total = data.get('total', 0.0)
+        return histogram
+
+
+class WindowedSketch:
+    """Latency histogram over a sliding window of `window` seconds"""
+
+    def __init__(self, window: float, slots: int):
+        self.slot_length = window / slots
+        self.slots = [LogHistogram() for _ in range(slots)]
+        self.epochs = [-1] * slots
+
+    def _slot(self, now: float) -> int:
+        epoch = int(now // self.slot_length)
+        index = epoch % len(self.slots)
+        if self.epochs[index] != epoch:
+            self.slots[index].reset()
+            self.epochs[index] = epoch
+        return index
+
+    def record(self, value: float, now: float):
+        self.slots[self._slot(now)].record(value)
+
+    def snapshot(self, now: float) -> Optional[LogHistogram]:
+        """Merged histogram of the live window, None if it saw nothing"""
+        oldest = int(now // self.slot_length) - len(self.slots) + 1
+        merged = LogHistogram()
+        for histogram, epoch in zip(self.slots, self.epochs):
+            if epoch >= oldest:
+                merged.merge(histogram)
+        return merged if merged.count else None
@@ -13,6 +13,28 @@ class JobStatus(Enum):
     FAILED = "failed"
     CANCELLED = "cancelled"
 
+TERMINAL_STATUSES = {JobStatus.COMPLETED, JobStatus.FAILED, JobStatus.CANCELLED}
+
+# Allowed job state transitions. The dispatcher moves a job to ASSIGNED right
+# after delivering it, so the node may report RUNNING first (PENDING ->
+# RUNNING); a job may also finish straight from ASSIGNED when its start was
+# not recorded. ASSIGNED -> PENDING is a requeue and PENDING -> COMPLETED a
+# result cache hit.
+JOB_TRANSITIONS = {
+    JobStatus.PENDING: {JobStatus.ASSIGNED, JobStatus.RUNNING, JobStatus.COMPLETED,
+                        JobStatus.FAILED, JobStatus.CANCELLED},
+    JobStatus.ASSIGNED: {JobStatus.PENDING, JobStatus.ASSIGNED, JobStatus.RUNNING,
+                         JobStatus.COMPLETED, JobStatus.FAILED, JobStatus.CANCELLED},
+    JobStatus.RUNNING: {JobStatus.COMPLETED, JobStatus.FAILED, JobStatus.CANCELLED},
+    JobStatus.COMPLETED: set(),
+    JobStatus.FAILED: set(),
+    JobStatus.CANCELLED: set(),
+}
+
+def transition_sources(status: JobStatus) -> list:
+    """Statuses a job may move to `status` from"""
+    return [source.value for source, targets in JOB_TRANSITIONS.items() if status in targets]
+
 class NodeStatus(Enum):
     ONLINE = "online"
     OFFLINE = "offline"
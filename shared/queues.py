@@ -0,0 +1,34 @@
+"""Job queue naming shared by the gateway and the dispatchers
+
+Each region's queue is split into QUEUE_PARTITIONS lists so several
+dispatcher instances can consume it in parallel. A job always lands in the
+partition picked from its job_id.
+"""
+
+import zlib
+
+from shared.config import Config
+
+
+def partition_for(job_id: str, partitions: int = None) -> int:
+    partitions = partitions or Config.QUEUE_PARTITIONS
+    return zlib.crc32(job_id.encode()) % partitions
+
+
+def queue_key(region: str, partition: int) -> str:
+    return f"jobs:queue:{region}:p{partition}"
+
+
+def job_queue_key(region: str, job_id: str) -> str:
+    """Queue a job must be pushed to"""
+    return queue_key(region, partition_for(job_id))
+
+
+def served_regions() -> list:
+    """Regions whose queues are consumed by a dispatcher"""
+    return [r.strip() for r in Config.REGIONS.split(',') if r.strip()]
+
+
+def region_queue_keys(region: str) -> list:
+    """All partition queues of a region"""
+    return [queue_key(region, p) for p in range(Config.QUEUE_PARTITIONS)]
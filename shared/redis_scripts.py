@@ -0,0 +1,333 @@
+"""Redis Lua scripts shared by the services
+
+Each script runs atomically on the Redis server, which keeps multi-key
+bookkeeping consistent even if the calling process dies midway.
+"""
+
+# Job queue leases
+#
+# A dispatcher moves a job from the queue list to a processing list and
+# records a lease deadline for it in a sorted set, both in LEASE_ACQUIRE
+# (non-blocking RPOPLPUSH + ZADD). The member of both structures is the raw
+# job JSON.
+#
+# KEYS: queue, processing list, lease zset
+
+# Lease the next job from the first non-empty queue, without blocking.
+# KEYS: (queue, processing list, lease zset) repeated for each queue
+# ARGV: lease deadline
+# Returns {queue index (1-based), job JSON} or nil when every queue is empty.
+LEASE_ACQUIRE = """
+for i = 1, #KEYS, 3 do
+    local job = redis.call('RPOPLPUSH', KEYS[i], KEYS[i + 1])
+    if job then
+        redis.call('ZADD', KEYS[i + 2], ARGV[1], job)
+        return {(i + 2) / 3, job}
+    end
+end
+return nil
+"""
+
+# Remove a lease once the job has been handed to a node.
+# Returns 1 if the lease was still held.
+LEASE_ACK = """
+redis.call('LREM', KEYS[2], 1, ARGV[1])
+return redis.call('ZREM', KEYS[3], ARGV[1])
+"""
+
+# Requeue every lease whose deadline has passed, in bulk.
+# Jobs found in the processing list without a lease are adopted with a fresh
+# deadline. LEASE_ACQUIRE pops and leases atomically, so these only appear if
+# the lease zset lost entries the processing list kept.
+# ARGV: now, max jobs to requeue, deadline for adopted orphans
+LEASE_REAP = """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[3], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+for _, job in ipairs(expired) do
+    redis.call('LREM', KEYS[2], 1, job)
+    redis.call('ZREM', KEYS[3], job)
+    redis.call('RPUSH', KEYS[1], job)
+end
+for _, job in ipairs(redis.call('LRANGE', KEYS[2], 0, -1)) do
+    if not redis.call('ZSCORE', KEYS[3], job) then
+        redis.call('ZADD', KEYS[3], ARGV[3], job)
+    end
+end
+return #expired
+"""
+
+# Move a leased job to the delayed retry zset (scored by due time).
+# KEYS: queue, processing list, lease zset, retry zset
+# ARGV: leased job JSON, job JSON to retry (attempt count bumped), due time
+LEASE_RETRY = """
+redis.call('LREM', KEYS[2], 1, ARGV[1])
+redis.call('ZREM', KEYS[3], ARGV[1])
+redis.call('ZADD', KEYS[4], ARGV[3], ARGV[2])
+return 1
+"""
+
+# Push due retries back to the front of their queue.
+# KEYS: retry zset, queue
+# ARGV: now, max jobs to promote
+RETRY_PROMOTE = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+for _, job in ipairs(due) do
+    redis.call('ZREM', KEYS[1], job)
+    redis.call('RPUSH', KEYS[2], job)
+end
+return #due
+"""
+
+# Job assignment and node slots
+#
+# Each node declares a number of concurrency slots. The slots in use are the
+# members of node_slots:{node_id}, a zset of job_id scored by the time the
+# assignment expires; nodes:load mirrors its size for readers.
+#
+# Placement runs in the dispatcher, between LEASE_ACQUIRE and DISPATCH_ASSIGN.
+# The script then does everything else in one atomic step: take a slot per
+# job, release the queue leases, deliver the jobs to the node's node_jobs
+# list and set the job:{id}:assigned lease the aggregator releases.
+# A hedged copy has no queue lease: it passes the primary's assignment key as
+# both processing list and lease, is only delivered while the primary is still
+# assigned, and gets its own assignment key (job:{id}:hedge_assigned).
+# KEYS: nodes:load, node job list, node slots zset, then (processing list,
+#       lease zset, assignment key) for each job
+# ARGV: node id, delivery JSON (job or batch envelope), assignment TTL (s),
+#       now, node slot count, then the leased job JSON of each job
+# Expired slots keep counting until SLOTS_RECONCILE frees them, so the
+# dispatcher records their timeouts against the node.
+# Returns the number of jobs assigned, 0 if one of the queue leases was lost
+# (the reaper has requeued that job), -1 if the node has too few free slots.
+DISPATCH_ASSIGN = """
+local jobs = #ARGV - 5
+for i = 1, jobs do
+    local hedge = KEYS[3 * i + 1] == KEYS[3 * i + 2]
+    if hedge and redis.call('EXISTS', KEYS[3 * i + 2]) == 0 then
+        return 0
+    elseif not hedge and not redis.call('ZSCORE', KEYS[3 * i + 2], ARGV[5 + i]) then
+        return 0
+    end
+end
+if redis.call('ZCARD', KEYS[3]) + jobs > tonumber(ARGV[5]) then
+    return -1
+end
+local expires = tonumber(ARGV[4]) + tonumber(ARGV[3])
+for i = 1, jobs do
+    if KEYS[3 * i + 1] ~= KEYS[3 * i + 2] then
+        redis.call('LREM', KEYS[3 * i + 1], 1, ARGV[5 + i])
+        redis.call('ZREM', KEYS[3 * i + 2], ARGV[5 + i])
+    end
+    redis.call('SET', KEYS[3 * i + 3], ARGV[1], 'EX', tonumber(ARGV[3]))
+    redis.call('ZADD', KEYS[3], expires, cjson.decode(ARGV[5 + i])['job_id'])
+end
+redis.call('HSET', KEYS[1], ARGV[1], redis.call('ZCARD', KEYS[3]))
+redis.call('LPUSH', KEYS[2], ARGV[2])
+return jobs
+"""
+
+# Release a job's assignment and its slot on whichever node holds it now
+# (work stealing may have moved it). Safe to call more than once.
+# The slot zset name is derived from the assignment, so this script
+# assumes a single Redis instance.
+# KEYS: assignment key, nodes:load
+# ARGV: job id
+# Returns 1 if the assignment was released, 0 if it was already gone.
+JOB_COMPLETE = """
+local node = redis.call('GET', KEYS[1])
+if not node then
+    return 0
+end
+local slots = 'node_slots:' .. node
+redis.call('DEL', KEYS[1])
+redis.call('ZREM', slots, ARGV[1])
+redis.call('HSET', KEYS[2], node, redis.call('ZCARD', slots))
+return 1
+"""
+
+# Job state machine
+#
+# job:{job_id}:state holds "{status}|{owner}" where owner identifies the
+# writer of the transition (the job_results entry id for finalization), so a
+# redelivered result can tell its own earlier transition from a rival one. A
+# missing key means the job is pending. Allowed sources come from
+# shared.models.JOB_TRANSITIONS; use shared.job_events.transition_call.
+# KEYS: state key, metrics:jobs, job event stream
+# ARGV: new status, owner, ttl, job id, now, node id, allowed source statuses...
+# Returns 1 if the transition happened (and counts it in metrics:jobs and
+# appends it to the event log), 2 if this owner already made it, 0 if the job
+# is in a state that forbids it.
+JOB_TRANSITION = """
+local status, owner = 'pending', ''
+local current = redis.call('GET', KEYS[1])
+if current then
+    status, owner = string.match(current, '^([^|]*)|(.*)$')
+end
+if status == ARGV[1] and owner == ARGV[2] and owner ~= '' then
+    return 2
+end
+for i = 7, #ARGV do
+    if ARGV[i] == status then
+        redis.call('SET', KEYS[1], ARGV[1] .. '|' .. ARGV[2], 'EX', ARGV[3])
+        redis.call('HINCRBY', KEYS[2], ARGV[1], 1)
+        redis.call('XADD', KEYS[3], '*', 'job_id', ARGV[4], 'event', ARGV[1], 'ts', ARGV[5],
+            'owner', ARGV[2], 'node_id', ARGV[6])
+        return 1
+    end
+end
+return 0
+"""
+
+# Result cache
+#
+# Opt-in memoization of (model, input) at the gateway. cache:result:{hash}
+# holds a finished result, cache:inflight:{hash} the job_id computing it and
+# cache:followers:{hash} the JSON of identical jobs waiting on that job.
+# KEYS: result key, inflight key, followers key
+
+# Look up a submission: serve it from the cache, make it the job that
+# computes the result, or queue it behind the job already doing so.
+# ARGV: job id, job JSON, ttl
+# Returns {'hit', result}, {'lead', job id} or {'follow', leader job id}.
+CACHE_LOOKUP = """
+local hit = redis.call('GET', KEYS[1])
+if hit then
+    return {'hit', hit}
+end
+if redis.call('SET', KEYS[2], ARGV[1], 'NX', 'EX', ARGV[3]) then
+    return {'lead', ARGV[1]}
+end
+redis.call('RPUSH', KEYS[3], ARGV[2])
+redis.call('EXPIRE', KEYS[3], ARGV[3])
+return {'follow', redis.call('GET', KEYS[2])}
+"""
+
+# Hand back the jobs waiting on a finished (or failed) leader.
+# KEYS: inflight key, followers key
+# ARGV: leader job id
+# Returns the followers' job JSON, empty if another job now leads.
+CACHE_RELEASE = """
+local leader = redis.call('GET', KEYS[1])
+if leader and leader ~= ARGV[1] then
+    return {}
+end
+redis.call('DEL', KEYS[1])
+local followers = redis.call('LRANGE', KEYS[2], 0, -1)
+redis.call('DEL', KEYS[2])
+return followers
+"""
+
+# Byte budgets (shared.result_store.LRUBudget)
+#
+# results:{name}:lru is a zset of entries scored by last access,
+# results:{name}:size a hash of their sizes, results:{name}:bytes the sum and
+# results:{name}:expires a zset of the entries whose data has a TTL, scored
+# by when it expires.
+# KEYS: lru zset, size hash, bytes counter, expires zset
+
+# Add or replace an entry; a re-add only counts the size difference.
+# ARGV: entry, size, now, expiry time ('' when the data has no TTL)
+# Returns the bytes now counted.
+LRU_ADD = """
+local previous = tonumber(redis.call('HGET', KEYS[2], ARGV[1]) or 0)
+redis.call('HSET', KEYS[2], ARGV[1], ARGV[2])
+redis.call('ZADD', KEYS[1], ARGV[3], ARGV[1])
+if ARGV[4] ~= '' then
+    redis.call('ZADD', KEYS[4], ARGV[4], ARGV[1])
+else
+    redis.call('ZREM', KEYS[4], ARGV[1])
+end
+return redis.call('INCRBY', KEYS[3], tonumber(ARGV[2]) - previous)
+"""
+
+# Forget entries whose data expired, then drop the least recently used ones
+# until the budget is met.
+# ARGV: now, budget (bytes)
+# Returns the entries dropped over budget (the caller deletes their data).
+LRU_EVICT = """
+local function forget(entry)
+    redis.call('DECRBY', KEYS[3], tonumber(redis.call('HGET', KEYS[2], entry) or 0))
+    redis.call('HDEL', KEYS[2], entry)
+    redis.call('ZREM', KEYS[1], entry)
+    redis.call('ZREM', KEYS[4], entry)
+end
+for _, entry in ipairs(redis.call('ZRANGEBYSCORE', KEYS[4], '-inf', ARGV[1])) do
+    forget(entry)
+end
+local evicted = {}
+while tonumber(redis.call('GET', KEYS[3]) or 0) > tonumber(ARGV[2]) do
+    local oldest = redis.call('ZRANGE', KEYS[1], 0, 0)
+    if #oldest == 0 then
+        break
+    end
+    forget(oldest[1])
+    table.insert(evicted, oldest[1])
+end
+return evicted
+"""
+
+# Node reputation (see shared/reputation.py)
+#
+# Decays the node's success / failure / timeout counts and deviation sum to
+# now, then adds the new outcome. For a timed execution, the relative
+# deviation |x - mean| / mean from the node's exec stats for the model is
+# added as well; run it before EXEC_STATS_UPDATE so x is not in the mean yet.
+# KEYS: reputation hash, exec stats hash
+# ARGV: now, half-life (s), outcome field, weight, execution time or '', model
+REPUTATION_UPDATE = """
+local now = tonumber(ARGV[1])
+local fields = {'success', 'failure', 'timeout', 'deviation'}
+local values = redis.call('HMGET', KEYS[1], 'success', 'failure', 'timeout', 'deviation', 'ts')
+local decay = 1
+if values[5] then
+    decay = 0.5 ^ (math.max(0, now - tonumber(values[5])) / tonumber(ARGV[2]))
+end
+local record = {}
+for i, field in ipairs(fields) do
+    record[field] = (tonumber(values[i]) or 0) * decay
+end
+record[ARGV[3]] = record[ARGV[3]] + tonumber(ARGV[4])
+if ARGV[5] ~= '' then
+    local mean = tonumber(redis.call('HGET', KEYS[2], ARGV[6] .. ':mean'))
+    if mean and mean > 0 then
+        record['deviation'] = record['deviation'] + math.abs(tonumber(ARGV[5]) - mean) / mean
+    end
+end
+redis.call('HSET', KEYS[1], 'success', record['success'], 'failure', record['failure'],
+    'timeout', record['timeout'], 'deviation', record['deviation'], 'ts', now)
+return 1
+"""
+
+# Free the slots of assignments that timed out and resync nodes:load.
+# KEYS: node slots zset, nodes:load
+# ARGV: node id, now
+# Returns the number of leaked slots freed.
+SLOTS_RECONCILE = """
+local freed = redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[2])
+redis.call('HSET', KEYS[2], ARGV[1], redis.call('ZCARD', KEYS[1]))
+return freed
+"""
+
+# Per-(node, model) execution time statistics
+#
+# Exponentially weighted mean and variance of execution_time, kept in the
+# node:{node_id}:exec_stats hash as {model}:mean, {model}:var and {model}:n.
+# KEYS: exec stats hash
+# ARGV: model name, execution time (s), smoothing factor alpha
+EXEC_STATS_UPDATE = """
+local mean_field = ARGV[1] .. ':mean'
+local var_field = ARGV[1] .. ':var'
+local x = tonumber(ARGV[2])
+local alpha = tonumber(ARGV[3])
+local mean = tonumber(redis.call('HGET', KEYS[1], mean_field))
+local var = 0
+if mean == nil then
+    mean = x
+else
+    local diff = x - mean
+    local incr = alpha * diff
+    mean = mean + incr
+    var = (1 - alpha) * ((tonumber(redis.call('HGET', KEYS[1], var_field)) or 0) + diff * incr)
+end
+redis.call('HSET', KEYS[1], mean_field, mean, var_field, var)
+return redis.call('HINCRBY', KEYS[1], ARGV[1] .. ':n', 1)
+"""
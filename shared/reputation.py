@@ -0,0 +1,50 @@
+"""Node reputation computed from observed job outcomes
+
+The aggregator records every result in node:{node_id}:reputation with the
+REPUTATION_UPDATE script (the dispatcher adds assignments that timed out):
+success, failure and timeout counts plus the summed relative deviation of
+execution times from the node's own mean, all decayed exponentially with a
+half-life so old outcomes fade out.
+
+The functions here do not talk to Redis. Reading applies the decay up to
+now, so a drained node that gets no more jobs drifts back to the prior and
+is tried again.
+"""
+
+from typing import Any, Dict
+
+SUCCESS = 'success'
+FAILURE = 'failure'
+TIMEOUT = 'timeout'
+
+
+def reputation_key(node_id: str) -> str:
+    return f'node:{node_id}:reputation'
+
+
+def decayed(record: Dict[str, Any], now: float, half_life: float) -> Dict[str, float]:
+    """Outcome counts and deviation sum decayed up to now"""
+    ts = record.get('ts')
+    factor = 0.5 ** (max(0.0, now - float(ts)) / half_life) if ts is not None else 1.0
+    return {
+        field: float(record.get(field, 0)) * factor
+        for field in (SUCCESS, FAILURE, TIMEOUT, 'deviation')
+    }
+
+
+def reputation(record: Dict[str, Any], now: float, half_life: float, prior: float) -> Dict[str, float]:
+    """Compact reputation of a node
+
+    score is the success rate smoothed with `prior` phantom successes, so a
+    node with little history starts near 1.0 instead of swinging on its
+    first result; timeouts count as failures.
+    """
+    counts = decayed(record, now, half_life)
+    total = counts[SUCCESS] + counts[FAILURE] + counts[TIMEOUT]
+    return {
+        'success_rate': counts[SUCCESS] / total if total else 1.0,
+        'timeout_rate': counts[TIMEOUT] / total if total else 0.0,
+        'latency_deviation': counts['deviation'] / counts[SUCCESS] if counts[SUCCESS] else 0.0,
+        'samples': total,
+        'score': (counts[SUCCESS] + prior) / (total + prior)
+    }
@@ -0,0 +1,64 @@
+"""Memoized inference results, keyed by model and input
+
+Jobs submitted with cache enabled carry cache_key, a hash of the model name
+and the canonical JSON of input_data (which includes generation params). The
+gateway serves repeats from cache:result:{hash} and coalesces identical
+submissions behind the one job computing the result (see CACHE_LOOKUP); the
+aggregator fills the cache and finishes the waiting jobs when that job ends.
+
+Cached results are bounded by RESULT_CACHE_TTL and by an LRU byte budget.
+ResultCache uses the redis.asyncio client API.
+"""
+
+import hashlib
+import json
+
+from shared.config import Config
+from shared.redis_scripts import CACHE_RELEASE
+from shared.result_store import LRUBudget
+
+
+# Recency zset of the cache's LRUBudget, touched by the gateway on hits
+LRU_KEY = 'results:cache:lru'
+
+
+def cache_key(model_name: str, input_data) -> str:
+    canonical = json.dumps([model_name, input_data], sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def result_key(key: str) -> str:
+    return f'cache:result:{key}'
+
+
+def lookup_keys(key: str) -> list:
+    """KEYS for CACHE_LOOKUP"""
+    return [result_key(key), f'cache:inflight:{key}', f'cache:followers:{key}']
+
+
+def release_keys(key: str) -> list:
+    """KEYS for CACHE_RELEASE"""
+    return lookup_keys(key)[1:]
+
+
+class ResultCache:
+    def __init__(self, redis):
+        self.redis = redis
+        self.lru = LRUBudget(redis, 'cache', Config.RESULT_CACHE_BUDGET_BYTES)
+        self.release_script = redis.register_script(CACHE_RELEASE)
+
+    async def store(self, key, result):
+        """Cache a result unless it is too large to be worth keeping"""
+        size = len(result.encode())
+        if size > Config.RESULT_CACHE_MAX_BYTES:
+            return False
+        await self.redis.setex(result_key(key), Config.RESULT_CACHE_TTL, result)
+        await self.lru.add(key, size, Config.RESULT_CACHE_TTL)
+        for evicted in await self.lru.over_budget():
+            await self.redis.delete(result_key(evicted))
+        return True
+
+    async def release(self, key, leader_id):
+        """Jobs that were waiting on leader_id, as decoded job dicts"""
+        followers = await self.release_script(keys=release_keys(key), args=[leader_id])
+        return [json.loads(job_json) for job_json in followers]
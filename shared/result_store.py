@@ -0,0 +1,202 @@
+"""Tiered storage for job results
+
+Results are placed by size:
+
+- inline: up to RESULT_INLINE_MAX_BYTES, kept as-is in Redis (result:{job_id},
+  with a TTL) and in jobs.result
+- pg: up to RESULT_PG_MAX_BYTES, zlib-compressed in the job_result_blobs table
+- lob: anything larger, zlib-compressed in a PostgreSQL large object listed
+  in job_result_objects
+
+Every tier lives in Redis or PostgreSQL, so a result written by one service
+can be read by any other. For the pg and lob tiers jobs.result only holds a
+small reference stub, and the payload is read lazily on request. Each tier
+is bounded by a byte budget with LRU eviction. An evicted inline result is
+still readable from jobs.result; an evicted pg or lob result is gone.
+
+Uses the redis.asyncio client API.
+"""
+
+import json
+import logging
+import time
+import zlib
+from typing import Optional
+
+from shared.config import Config
+from shared.redis_scripts import LRU_ADD, LRU_EVICT
+
+logger = logging.getLogger(__name__)
+
+INLINE = 'inline'
+PG = 'pg'
+LOB = 'lob'
+
+
+def tier_for(size: int) -> str:
+    if size <= Config.RESULT_INLINE_MAX_BYTES:
+        return INLINE
+    if size <= Config.RESULT_PG_MAX_BYTES:
+        return PG
+    return LOB
+
+
+def reference(tier: str) -> str:
+    """Stub stored in jobs.result for results kept elsewhere"""
+    return json.dumps({'result_ref': tier})
+
+
+def parse_reference(stored: Optional[str]) -> Optional[str]:
+    """Tier named by a stub, None for an inline result"""
+    if not stored or not stored.startswith('{"result_ref"'):
+        return None
+    return json.loads(stored)['result_ref']
+
+
+class LRUBudget:
+    """Byte budget over a set of entries, evicting the least recently used
+
+    Kept in Redis so every aggregator and gateway shares it: a zset of
+    job_id scored by last access, a hash of entry sizes and a byte counter
+    (see LRU_ADD). Entries whose data has a TTL are forgotten once it expires.
+    """
+
+    def __init__(self, redis, name, budget):
+        self.redis = redis
+        self.lru_key = f'results:{name}:lru'
+        self.size_key = f'results:{name}:size'
+        self.bytes_key = f'results:{name}:bytes'
+        self.expires_key = f'results:{name}:expires'
+        self.budget = budget
+        self.add_script = redis.register_script(LRU_ADD)
+        self.evict_script = redis.register_script(LRU_EVICT)
+
+    @property
+    def keys(self):
+        return [self.lru_key, self.size_key, self.bytes_key, self.expires_key]
+
+    async def add(self, job_id, size, ttl=None):
+        """Count an entry (again); ttl is the lifetime of its data, if any"""
+        now = time.time()
+        await self.add_script(keys=self.keys, args=[job_id, size, now, now + ttl if ttl else ''])
+
+    async def touch(self, job_id):
+        await self.redis.zadd(self.lru_key, {job_id: time.time()}, xx=True)
+
+    async def over_budget(self):
+        """Forget expired entries, then pop least recently used ones until the budget is met"""
+        return await self.evict_script(keys=self.keys, args=[time.time(), self.budget])
+
+
+class ResultStore:
+    def __init__(self, redis, db_pool):
+        self.redis = redis
+        self.db_pool = db_pool
+        self.inline_lru = LRUBudget(redis, INLINE, Config.RESULT_INLINE_BUDGET_BYTES)
+        self.pg_lru = LRUBudget(redis, PG, Config.RESULT_PG_BUDGET_BYTES)
+        self.lob_lru = LRUBudget(redis, LOB, Config.RESULT_LOB_BUDGET_BYTES)
+
+    async def save(self, job_id, result):
+        """Store a result in its tier; returns the value for jobs.result"""
+        if result is None:
+            return None
+
+        data = result.encode()
+        tier = tier_for(len(data))
+
+        if tier == INLINE:
+            await self.redis.setex(f'result:{job_id}', Config.RESULT_INLINE_TTL, result)
+            await self.inline_lru.add(job_id, len(data), Config.RESULT_INLINE_TTL)
+            # Evicted results stay readable from jobs.result
+            for evicted in await self.inline_lru.over_budget():
+                await self.redis.delete(f'result:{evicted}')
+            return result
+
+        compressed = zlib.compress(data)
+        if tier == PG:
+            async with self.db_pool.acquire() as conn:
+                await conn.execute("""
+                    INSERT INTO job_result_blobs (job_id, data, size_bytes)
+                    VALUES ($1, $2, $3)
+                    ON CONFLICT (job_id) DO UPDATE SET data = EXCLUDED.data, size_bytes = EXCLUDED.size_bytes
+                """, job_id, compressed, len(data))
+            await self.pg_lru.add(job_id, len(compressed))
+            evicted = await self.pg_lru.over_budget()
+            if evicted:
+                await self._remove_blobs(evicted)
+                logger.info(f"🗑️ Evicted {len(evicted)} results from PostgreSQL: {', '.join(evicted)}")
+        else:
+            await self._write_object(job_id, compressed)
+            await self.lob_lru.add(job_id, len(compressed))
+            evicted = await self.lob_lru.over_budget()
+            if evicted:
+                await self._remove_objects(evicted)
+                logger.info(f"🗑️ Evicted {len(evicted)} large results: {', '.join(evicted)}")
+
+        return reference(tier)
+
+    async def load(self, job_id, stored=None):
+        """Read a result from whichever tier holds it, None if unknown or evicted
+
+        stored is the jobs.result value when the caller already has it.
+        """
+        inline = await self.redis.get(f'result:{job_id}')
+        if inline is not None:
+            await self.inline_lru.touch(job_id)
+            return inline
+
+        if stored is None and self.db_pool:
+            async with self.db_pool.acquire() as conn:
+                stored = await conn.fetchval("SELECT result FROM jobs WHERE job_id = $1", job_id)
+
+        tier = parse_reference(stored)
+        if tier is None:
+            return stored
+
+        if tier == PG:
+            async with self.db_pool.acquire() as conn:
+                compressed = await conn.fetchval(
+                    "SELECT data FROM job_result_blobs WHERE job_id = $1", job_id
+                )
+            if compressed is not None:
+                await self.pg_lru.touch(job_id)
+        elif tier == LOB:
+            async with self.db_pool.acquire() as conn:
+                compressed = await conn.fetchval(
+                    "SELECT lo_get(oid) FROM job_result_objects WHERE job_id = $1", job_id
+                )
+            if compressed is not None:
+                await self.lob_lru.touch(job_id)
+        else:
+            # Stubs of retired tiers (results once kept on an aggregator's disk)
+            compressed = None
+
+        return zlib.decompress(compressed).decode() if compressed is not None else None
+
+    async def _write_object(self, job_id, compressed):
+        """Store a large result, replacing any object the job had before"""
+        async with self.db_pool.acquire() as conn:
+            async with conn.transaction():
+                previous = await conn.fetchval(
+                    "SELECT oid FROM job_result_objects WHERE job_id = $1 FOR UPDATE", job_id
+                )
+                await conn.execute("""
+                    INSERT INTO job_result_objects (job_id, oid, size_bytes)
+                    VALUES ($1, lo_from_bytea(0, $2), $3)
+                    ON CONFLICT (job_id) DO UPDATE SET oid = EXCLUDED.oid, size_bytes = EXCLUDED.size_bytes
+                """, job_id, compressed, len(compressed))
+                if previous is not None:
+                    await conn.execute("SELECT lo_unlink($1)", previous)
+
+    async def _remove_blobs(self, job_ids):
+        async with self.db_pool.acquire() as conn:
+            await conn.execute("DELETE FROM job_result_blobs WHERE job_id = ANY($1::text[])", job_ids)
+
+    async def _remove_objects(self, job_ids):
+        async with self.db_pool.acquire() as conn:
+            await conn.execute("""
+                WITH removed AS (
+                    DELETE FROM job_result_objects WHERE job_id = ANY($1::text[]) RETURNING oid
+                )
+                SELECT lo_unlink(oid) FROM removed
+            """, job_ids)
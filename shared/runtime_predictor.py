@@ -0,0 +1,67 @@
+"""Online runtime predictor shared by the aggregator and the dispatchers
+
+Runtimes are learned per (model_name, node_type, input size bucket) with the
+EXEC_STATS_UPDATE script, in the RUNTIME_STATS_KEY hash. Every observation
+also updates the coarser (model, any node type) and (model, any node type,
+any size) entries, so a prediction backs off to them when the exact key has
+not been seen yet.
+
+The functions here do not talk to Redis: callers load the hash and run the
+update script with their own client.
+"""
+
+import json
+import math
+from typing import Any, Dict, List, Optional
+
+RUNTIME_STATS_KEY = 'runtime:stats'
+ANY = '*'
+
+# Standard normal quantile for the 95th percentile
+Z_P95 = 1.645
+
+
+def input_size(input_data: Any) -> int:
+    """Size in bytes of a job's input, as serialized by the gateway"""
+    if isinstance(input_data, str):
+        return len(input_data)
+    return len(json.dumps(input_data))
+
+
+def size_bucket(size: int) -> int:
+    """Power-of-two bucket of an input size"""
+    return int(math.log2(size + 1))
+
+
+def stats_keys(model_name: str, node_type: Optional[str], size: int) -> List[str]:
+    """Hash key prefixes for an observation, most specific first"""
+    bucket = size_bucket(size)
+    return [
+        f'{model_name}|{node_type or ANY}|{bucket}',
+        f'{model_name}|{ANY}|{bucket}',
+        f'{model_name}|{ANY}|{ANY}',
+    ]
+
+
+def training_keys(model_name: str, node_type: Optional[str], size: int) -> List[str]:
+    """Every prefix one completed job updates (no duplicates without a node type)"""
+    return list(dict.fromkeys(stats_keys(model_name, node_type, size)))
+
+
+def predict_runtime(stats: Dict[str, str], model_name: str, node_type: Optional[str],
+                    size: int, default: Optional[float] = None) -> Optional[float]:
+    """Predicted execution time in seconds, or default when nothing was learned"""
+    for key in stats_keys(model_name, node_type, size):
+        mean = stats.get(f'{key}:mean')
+        if mean is not None:
+            return float(mean)
+    return default
+
+
+def runtime_p95(stats: Dict[str, str], model_name: str) -> Optional[float]:
+    """Approximate 95th percentile runtime of a model (normal approximation)"""
+    key = f'{model_name}|{ANY}|{ANY}'
+    mean = stats.get(f'{key}:mean')
+    if mean is None:
+        return None
+    return float(mean) + Z_P95 * float(stats.get(f'{key}:var', 0)) ** 0.5
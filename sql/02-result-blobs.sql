@@ -0,0 +1,7 @@
+-- Stockage compressé des résultats de taille moyenne (voir shared/result_store.py)
+CREATE TABLE IF NOT EXISTS job_result_blobs (
+    job_id VARCHAR(64) PRIMARY KEY,
+    data BYTEA NOT NULL,
+    size_bytes INTEGER NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
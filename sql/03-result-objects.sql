@@ -0,0 +1,7 @@
+-- Résultats volumineux en large objects PostgreSQL, lisibles par tous les services (voir shared/result_store.py)
+CREATE TABLE IF NOT EXISTS job_result_objects (
+    job_id VARCHAR(64) PRIMARY KEY,
+    oid OID NOT NULL,
+    size_bytes INTEGER NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""Test the dispatch/completion Lua scripts against a live Redis"""
+import asyncio
+import json
+import sys
+import time
+
+import aioredis
+
+from shared.redis_scripts import DISPATCH_ASSIGN, JOB_COMPLETE, LEASE_ACQUIRE, SLOTS_RECONCILE
+
+PREFIX = "test:dispatch"
+QUEUE = f"{PREFIX}:queue"
+PROCESSING = f"{QUEUE}:processing"
+LEASES = f"{QUEUE}:leases"
+LOAD = f"{PREFIX}:nodes:load"
+NODE_ID = f"{PREFIX}:node"
+NODE_JOBS = f"{PREFIX}:node_jobs:{NODE_ID}"
+# JOB_COMPLETE derives the slot key from the node id, which carries the prefix
+NODE_SLOTS = f"node_slots:{NODE_ID}"
+
+
+def assigned_key(job_id):
+    return f"{PREFIX}:job:{job_id}:assigned"
+
+
+async def lease(redis, acquire, job_id):
+    """Queue a job and lease it like the dispatcher does"""
+    await redis.lpush(QUEUE, json.dumps({"job_id": job_id, "model_name": "resnet50"}))
+    _, job_json = await acquire(keys=[QUEUE, PROCESSING, LEASES], args=[9999999999])
+    return job_json
+
+
+async def assign(redis, script, jobs, delivery, slots=4, ttl=300):
+    keys = [LOAD, NODE_JOBS, NODE_SLOTS]
+    args = [NODE_ID, delivery, ttl, time.time(), slots]
+    for job_id, job_json in jobs:
+        keys.extend([PROCESSING, LEASES, assigned_key(job_id)])
+        args.append(job_json)
+    return await script(keys=keys, args=args)
+
+
+async def cleanup(redis):
+    keys = await redis.keys(f"{PREFIX}:*") + await redis.keys(f"{NODE_SLOTS}*")
+    if keys:
+        await redis.delete(*keys)
+
+
+def check(condition, message):
+    print(f"{'✅' if condition else '❌'} {message}")
+    return condition
+
+
+async def run_checks(redis_url="redis://localhost:6379"):
+    print("🔍 Testing dispatch scripts...")
+    redis = aioredis.from_url(redis_url, encoding="utf-8", decode_responses=True)
+    acquire = redis.register_script(LEASE_ACQUIRE)
+    dispatch = redis.register_script(DISPATCH_ASSIGN)
+    complete = redis.register_script(JOB_COMPLETE)
+    reconcile = redis.register_script(SLOTS_RECONCILE)
+    ok = True
+
+    try:
+        await cleanup(redis)
+
+        # Single job: lease released, slot taken, job delivered, assignment set
+        job_json = await lease(redis, acquire, "job_1")
+        assigned = await assign(redis, dispatch, [("job_1", job_json)], job_json)
+        ok &= check(assigned == 1, "Single assignment returns 1")
+        ok &= check(await redis.llen(PROCESSING) == 0, "Processing list emptied")
+        ok &= check(await redis.zcard(LEASES) == 0, "Queue lease released")
+        ok &= check(await redis.hget(LOAD, NODE_ID) == "1", "Node load incremented")
+        ok &= check(await redis.lrange(NODE_JOBS, 0, -1) == [job_json], "Job delivered to node")
+        ok &= check(await redis.get(assigned_key("job_1")) == NODE_ID, "Assignment recorded")
+        ok &= check(0 < await redis.ttl(assigned_key("job_1")) <= 300, "Assignment has a TTL")
+        ok &= check(await redis.zscore(NODE_SLOTS, "job_1") is not None, "Slot taken")
+
+        # Completion gives the slot back, exactly once
+        done = [assigned_key("job_1"), LOAD]
+        ok &= check(await complete(keys=done, args=["job_1"]) == 1, "Completion releases assignment")
+        ok &= check(await redis.hget(LOAD, NODE_ID) == "0", "Node load decremented")
+        ok &= check(await complete(keys=done, args=["job_1"]) == 0, "Second completion is a no-op")
+        ok &= check(await redis.hget(LOAD, NODE_ID) == "0", "Load never goes negative")
+
+        # Lost lease: nothing is delivered or counted
+        job_json = await lease(redis, acquire, "job_2")
+        await redis.zrem(LEASES, job_json)
+        await redis.delete(NODE_JOBS)
+        assigned = await assign(redis, dispatch, [("job_2", job_json)], job_json)
+        ok &= check(assigned == 0, "Assignment refused after lease loss")
+        ok &= check(await redis.llen(NODE_JOBS) == 0, "Nothing delivered after lease loss")
+        ok &= check(await redis.hget(LOAD, NODE_ID) == "0", "Load unchanged after lease loss")
+        await redis.delete(PROCESSING)
+
+        # Batch: one delivery, one load unit per job
+        jobs = [(job_id, await lease(redis, acquire, job_id)) for job_id in ("job_3", "job_4")]
+        envelope = json.dumps({"batch_id": "job_3", "jobs": [json.loads(j) for _, j in jobs]})
+        assigned = await assign(redis, dispatch, jobs, envelope)
+        ok &= check(assigned == 2, "Batch assignment returns job count")
+        ok &= check(await redis.llen(NODE_JOBS) == 1, "Batch delivered as one envelope")
+        ok &= check(await redis.hget(LOAD, NODE_ID) == "2", "Batch counts each job")
+        ok &= check(await redis.zcard(LEASES) == 0, "Batch leases released")
+
+        # Slots: a full node refuses more work and keeps the lease
+        job_json = await lease(redis, acquire, "job_5")
+        assigned = await assign(redis, dispatch, [("job_5", job_json)], job_json, slots=2)
+        ok &= check(assigned == -1, "Assignment refused without a free slot")
+        ok &= check(await redis.zcard(LEASES) == 1, "Queue lease kept when refused")
+        ok &= check(await redis.hget(LOAD, NODE_ID) == "2", "Load unchanged when refused")
+
+        # Hedged copy: no queue lease, needs the primary still assigned
+        hedge_node = f"{PREFIX}:hedge_node"
+        hedge_slots = f"node_slots:{hedge_node}"
+        hedge_key = f"{PREFIX}:job:job_3:hedge_assigned"
+        hedge_json = json.dumps({"job_id": "job_3", "model_name": "resnet50", "hedge": True})
+        hedge = dict(keys=[LOAD, f"{PREFIX}:node_jobs:{hedge_node}", hedge_slots,
+                           assigned_key("job_3"), assigned_key("job_3"), hedge_key],
+                     args=[hedge_node, hedge_json, 300, time.time(), 1, hedge_json])
+        ok &= check(await dispatch(**hedge) == 1, "Hedge assigned while the primary runs")
+        ok &= check(await redis.get(hedge_key) == hedge_node, "Hedge has its own assignment")
+        ok &= check(await redis.hget(LOAD, hedge_node) == "1", "Hedge takes a slot on its node")
+        ok &= check(await dispatch(**hedge) == -1, "Hedge respects the node's slot limit")
+        await complete(keys=[hedge_key, LOAD], args=["job_3"])
+        ok &= check(await redis.hget(LOAD, hedge_node) == "0", "Hedge slot released on its own node")
+        ok &= check(await redis.hget(LOAD, NODE_ID) == "2", "Primary slot untouched by the hedge")
+        await redis.delete(hedge_slots)
+
+        # Timed-out assignments are reclaimed (and counted) by the reconciler only
+        await redis.zadd(NODE_SLOTS, {"job_3": 0, "job_4": 0})
+        assigned = await assign(redis, dispatch, [("job_5", job_json)], job_json, slots=2)
+        ok &= check(assigned == -1, "Assignment leaves expired slots to the reconciler")
+        freed = await reconcile(keys=[NODE_SLOTS, LOAD], args=[NODE_ID, time.time()])
+        ok &= check(freed == 2, "Reconciler frees leaked slots")
+        ok &= check(await redis.hget(LOAD, NODE_ID) == "0", "Reconciler resyncs load")
+
+    finally:
+        await cleanup(redis)
+        await redis.close()
+
+    return ok
+
+
+def test_dispatch_scripts():
+    assert asyncio.run(run_checks()), "Dispatch script checks failed"
+
+
+if __name__ == "__main__":
+    try:
+        if asyncio.run(run_checks()):
+            print("\n🎉 Dispatch scripts behave correctly")
+            sys.exit(0)
+        print("\n💥 Dispatch script checks failed")
+        sys.exit(1)
+    except Exception as e:
+        print(f"💥 Test failed: {e}")
+        sys.exit(1)
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""Test that results stored by one process are readable from another
+
+The aggregator writes results and the gateway reads them from a different
+container, so every tier must live in shared storage. Needs a live Redis
+and PostgreSQL (with sql/02-result-blobs.sql and sql/03-result-objects.sql).
+"""
+import asyncio
+import json
+import subprocess
+import sys
+
+import asyncpg
+import redis.asyncio as redis
+
+from shared.config import Config
+from shared.result_store import INLINE, LOB, PG, ResultStore, parse_reference
+
+PREFIX = "test_result_store"
+SIZES = {
+    INLINE: Config.RESULT_INLINE_MAX_BYTES // 2,
+    PG: Config.RESULT_PG_MAX_BYTES // 2,
+    LOB: Config.RESULT_PG_MAX_BYTES * 2
+}
+
+
+def payload(tier):
+    return json.dumps({"tier": tier, "data": "x" * SIZES[tier]})
+
+
+async def connect():
+    return (redis.from_url(Config.REDIS_URL, decode_responses=True),
+            await asyncpg.create_pool(Config.POSTGRES_URL))
+
+
+async def write():
+    """Writer process: store one result per tier, print the jobs.result values"""
+    client, pool = await connect()
+    try:
+        store = ResultStore(client, pool)
+        stored = {tier: await store.save(f"{PREFIX}_{tier}", payload(tier)) for tier in SIZES}
+    finally:
+        await client.close()
+        await pool.close()
+    print(json.dumps(stored))
+
+
+async def cleanup(client, pool):
+    job_ids = [f"{PREFIX}_{tier}" for tier in SIZES]
+    store = ResultStore(client, pool)
+    await client.delete(*[f"result:{job_id}" for job_id in job_ids])
+    for lru in (store.inline_lru, store.pg_lru, store.lob_lru):
+        for job_id in job_ids:
+            size = int(await client.hget(lru.size_key, job_id) or 0)
+            await client.zrem(lru.lru_key, job_id)
+            await client.zrem(lru.expires_key, job_id)
+            await client.hdel(lru.size_key, job_id)
+            await client.decrby(lru.bytes_key, size)
+    async with pool.acquire() as conn:
+        await conn.execute("DELETE FROM job_result_blobs WHERE job_id = ANY($1::text[])", job_ids)
+        await store._remove_objects(job_ids)
+
+
+def check(condition, message):
+    print(f"{'✅' if condition else '❌'} {message}")
+    return condition
+
+
+async def run_checks():
+    print("🔍 Testing cross-process result reads...")
+    client, pool = await connect()
+    ok = True
+
+    try:
+        await cleanup(client, pool)
+        writer = subprocess.run([sys.executable, __file__, "--write"],
+                                capture_output=True, text=True, check=True)
+        stored = json.loads(writer.stdout.strip().splitlines()[-1])
+
+        store = ResultStore(client, pool)
+        for tier in SIZES:
+            expected = None if tier == INLINE else tier
+            ok &= check(parse_reference(stored[tier]) == expected, f"{tier}: stored in the {tier} tier")
+            result = await store.load(f"{PREFIX}_{tier}", stored[tier])
+            ok &= check(result == payload(tier), f"{tier}: readable from another process")
+
+        # Storing a result again only counts it once against the budget
+        for tier, lru in ((INLINE, store.inline_lru), (PG, store.pg_lru), (LOB, store.lob_lru)):
+            counted = int(await client.get(lru.bytes_key) or 0)
+            await store.save(f"{PREFIX}_{tier}", payload(tier))
+            ok &= check(int(await client.get(lru.bytes_key) or 0) == counted, f"{tier}: re-save not double counted")
+    finally:
+        await cleanup(client, pool)
+        await client.close()
+        await pool.close()
+
+    return ok
+
+
+def test_result_store():
+    assert asyncio.run(run_checks()), "Result store checks failed"
+
+
+if __name__ == "__main__":
+    if "--write" in sys.argv:
+        asyncio.run(write())
+        sys.exit(0)
+    try:
+        if asyncio.run(run_checks()):
+            print("\n🎉 Every result tier is shared between processes")
+            sys.exit(0)
+        print("\n💥 Result store checks failed")
+        sys.exit(1)
+    except Exception as e:
+        print(f"💥 Test failed: {e}")
+        sys.exit(1)
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""Test the scheduler simulator with jobs for a region no node serves"""
+import json
+import os
+import sys
+import tempfile
+
+from services.dispatcher.simulator import main, build_nodes, load_trace, Simulator
+from services.dispatcher.placement import PlacementContext
+
+JOBS = 200
+# 10% of the jobs target a region without nodes
+REMOTE_EVERY = 10
+
+
+def check(condition, message):
+    print(f"{'✅' if condition else '❌'} {message}")
+    return condition
+
+
+def write_trace(path):
+    with open(path, 'w') as f:
+        for i in range(JOBS):
+            region = 'us-east-1' if i % REMOTE_EVERY == 0 else 'eu-west-1'
+            f.write(json.dumps({
+                'job_id': f'job_{i}', 'model_name': 'resnet50', 'region': region,
+                'submitted_ts': 1000 + i * 0.1, 'execution_time': 0.5
+            }) + '\n')
+
+
+def simulate(jobs, policy, region_latency=None):
+    ctx = PlacementContext(region_latency=region_latency or {}, spill_wait_threshold=2.0)
+    return Simulator(jobs, build_nodes('4:eu-west-1:1', 0.0), policy, ctx, 16).run()
+
+
+def run_checks():
+    print("🔍 Testing the scheduler simulator...")
+    ok = True
+
+    with tempfile.TemporaryDirectory() as tmp:
+        trace = os.path.join(tmp, 'trace.jsonl')
+        write_trace(trace)
+        jobs = load_trace(trace, 1.0)
+        remote = JOBS // REMOTE_EVERY
+
+        for policy in ('fifo', 'sjf'):
+            # Unknown latency: remote jobs can never run, local ones must not wait on them
+            report = simulate(jobs, policy)
+            ok &= check(report['completed'] == JOBS - remote, f"{policy}: every local job completes")
+            ok &= check(report['unplaced'] == remote, f"{policy}: remote jobs reported as unplaced")
+            ok &= check(report['completed'] + report['dropped'] + report['unplaced'] == JOBS,
+                        f"{policy}: every job is accounted for")
+
+            # Known latency: remote jobs spill once they waited the threshold
+            report = simulate(jobs, policy, {'us-east-1|eu-west-1': 80})
+            ok &= check(report['completed'] == JOBS, f"{policy}: remote jobs spill and complete")
+            ok &= check(report['unplaced'] == 0, f"{policy}: nothing left unplaced after spilling")
+
+        # Command line: the latency option reaches the placement context
+        main([trace, '--policies', 'fifo', '--nodes', '2:eu-west-1', '--region-latency', 'us-east-1|eu-west-1=80'])
+
+    return ok
+
+
+def test_simulator():
+    assert run_checks(), "Simulator checks failed"
+
+
+if __name__ == "__main__":
+    try:
+        if run_checks():
+            print("\n🎉 Simulator accounts for every job")
+            sys.exit(0)
+        print("\n💥 Simulator checks failed")
+        sys.exit(1)
+    except Exception as e:
+        print(f"💥 Test failed: {e}")
+        sys.exit(1)
@@ -0,0 +1,96 @@
+"""Unit tests for node ranking (services/dispatcher/placement.py)"""
+from services.dispatcher.placement import PlacementContext, expected_completion, rank_nodes
+
+NOW = 1000.0
+
+
+def node(**fields):
+    info = {'status': 'available', 'current_load': 0.0, 'capacity': 1.0, 'slots': 1,
+            'warm_models': [], 'region': 'eu-west-1'}
+    info.update(fields)
+    return info
+
+
+def gpt2_job(**fields):
+    job = {'model_name': 'gpt2', 'input_data': {'prompt': 'hi'}, 'region': 'eu-west-1',
+           'submitted_ts': NOW}
+    job.update(fields)
+    return job
+
+
+def test_warm_node_with_history_outranks_cold_node_without():
+    ctx = PlacementContext(runtime_stats={'gpt2|*|*:mean': '5.0', 'gpt2|*|*:var': '0.25'},
+                           cold_load_seconds=3.0)
+    nodes = {
+        'warm': node(warm_models=['gpt2'], exec_stats={'gpt2:mean': '5.0', 'gpt2:var': '1.0'}),
+        'cold': node(),
+    }
+
+    ranked = rank_nodes(nodes, gpt2_job(), ctx, NOW)
+
+    assert [node_id for node_id, _ in ranked] == ['warm', 'cold']
+
+
+def test_completion_without_history_uses_cluster_prediction_and_load_time():
+    ctx = PlacementContext(runtime_stats={'gpt2|*|*:mean': '4.0'}, cold_load_seconds=2.0)
+
+    # Cluster mean, a std-dev as large as the mean, then the model load
+    assert expected_completion(node(), gpt2_job(), ctx) == 4.0 + 4.0 + 2.0
+
+
+def test_completion_without_any_history_falls_back_to_default_runtime():
+    ctx = PlacementContext(default_runtime=1.5)
+
+    assert expected_completion(node(warm_models=['gpt2']), gpt2_job(), ctx) == 3.0
+
+
+def test_remote_node_only_after_spill_wait_and_within_latency():
+    ctx = PlacementContext(region_latency={'us-east-1|eu-west-1': 80}, spill_wait_threshold=2.0,
+                           spill_max_latency_ms=150.0)
+    nodes = {'eu': node(), 'ap': node(region='ap-south-1')}
+    job = gpt2_job(region='us-east-1')
+
+    assert rank_nodes(nodes, job, ctx, NOW + 1.0) == []
+    # Once the job waited the threshold only the node with a known, close enough latency qualifies
+    assert [node_id for node_id, _ in rank_nodes(nodes, job, ctx, NOW + 2.0)] == ['eu']
+
+
+def test_local_node_outranks_remote_one_when_spilling():
+    ctx = PlacementContext(region_latency={'us-east-1|eu-west-1': 80}, spill_wait_threshold=0.0)
+    nodes = {'eu': node(), 'us': node(region='us-east-1')}
+
+    ranked = rank_nodes(nodes, gpt2_job(region='us-east-1'), ctx, NOW)
+
+    assert [node_id for node_id, _ in ranked] == ['us', 'eu']
+
+
+def test_node_below_drain_score_gets_no_jobs():
+    ctx = PlacementContext(reputation_prior=1.0, reputation_drain_score=0.5)
+    failing = {'success': 0, 'failure': 5, 'timeout': 5, 'deviation': 0, 'ts': NOW}
+    nodes = {'healthy': node(), 'failing': node(reputation=failing)}
+
+    ranked = rank_nodes(nodes, gpt2_job(), ctx, NOW)
+
+    assert [node_id for node_id, _ in ranked] == ['healthy']
+
+
+def test_lower_reputation_lowers_score():
+    ctx = PlacementContext(reputation_prior=5.0, reputation_drain_score=0.1)
+    shaky = {'success': 5, 'failure': 2, 'timeout': 0, 'deviation': 0, 'ts': NOW}
+    nodes = {'shaky': node(reputation=shaky), 'trusted': node()}
+
+    ranked = rank_nodes(nodes, gpt2_job(), ctx, NOW)
+
+    assert [node_id for node_id, _ in ranked] == ['trusted', 'shaky']
+
+
+def test_busy_or_unsupported_nodes_are_skipped():
+    ctx = PlacementContext()
+    nodes = {
+        'full': node(slots=2, slots_used=2),
+        'offline': node(status='offline'),
+        'other_models': node(capabilities={'supported_models': ['resnet50']}),
+        'free': node(),
+    }
+
+    assert [node_id for node_id, _ in rank_nodes(nodes, gpt2_job(), ctx, NOW)] == ['free']
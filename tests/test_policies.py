@@ -0,0 +1,47 @@
+"""Unit tests for the job ordering policies (services/dispatcher/policies.py)"""
+from services.dispatcher.policies import edf_key, sjf_key, will_miss_deadline
+
+NOW = 1000.0
+STATS = {'gpt2|*|*:mean': '5.0', 'resnet50|*|*:mean': '0.5'}
+
+
+def job(job_id, model_name='resnet50', **fields):
+    data = {'job_id': job_id, 'model_name': model_name, 'input_data': {}, 'submitted_ts': NOW}
+    data.update(fields)
+    return data
+
+
+def order(jobs, key):
+    return [data['job_id'] for data in sorted(jobs, key=key)]
+
+
+def test_sjf_runs_shortest_predicted_job_first():
+    jobs = [job('slow', 'gpt2'), job('unknown', 'bert'), job('fast', 'resnet50')]
+
+    assert order(jobs, lambda data: sjf_key(data, STATS, NOW, 0.0, 1.0)) == ['fast', 'unknown', 'slow']
+
+
+def test_sjf_aging_lets_a_long_waiting_job_overtake():
+    jobs = [job('fast', 'resnet50'), job('old', 'gpt2', submitted_ts=NOW - 100)]
+
+    assert order(jobs, lambda data: sjf_key(data, STATS, NOW, 0.0, 1.0)) == ['fast', 'old']
+    assert order(jobs, lambda data: sjf_key(data, STATS, NOW, 0.1, 1.0)) == ['old', 'fast']
+
+
+def test_edf_orders_by_deadline_then_default_timeout():
+    jobs = [
+        job('no_deadline', submitted_ts=None),
+        job('late', deadline_ts=NOW + 60),
+        job('default', submitted_ts=NOW - 10),
+        job('soon', deadline_ts=NOW + 5),
+    ]
+
+    # 'default' is due at submitted_ts + 30
+    assert order(jobs, lambda data: edf_key(data, 30.0)) == ['soon', 'default', 'late', 'no_deadline']
+
+
+def test_will_miss_deadline_uses_predicted_runtime():
+    assert will_miss_deadline(job('tight', 'gpt2', deadline_ts=NOW + 4), STATS, NOW, 30.0)
+    assert not will_miss_deadline(job('fits', 'gpt2', deadline_ts=NOW + 6), STATS, NOW, 30.0)
+    # Unknown models get the benefit of the doubt
+    assert not will_miss_deadline(job('unknown', 'bert', deadline_ts=NOW + 0.1), STATS, NOW, 30.0)
@@ -0,0 +1,36 @@
+"""Unit tests for partition ownership (services/dispatcher/sharding.py)"""
+from services.dispatcher.sharding import HashRing
+
+PARTITIONS = [f'jobs:queue:eu-west-1:p{n}' for n in range(64)]
+
+
+def owners(members):
+    ring = HashRing(members)
+    return {partition: ring.owner(partition) for partition in PARTITIONS}
+
+
+def test_every_partition_has_one_live_owner():
+    members = ['a', 'b', 'c']
+
+    assignment = owners(members)
+
+    assert set(assignment.values()) <= set(members)
+    assert len(set(assignment.values())) == len(members)
+
+
+def test_ownership_does_not_depend_on_member_order():
+    assert owners(['a', 'b', 'c']) == owners(['c', 'a', 'b'])
+
+
+def test_only_the_leaving_members_partitions_move():
+    before = owners(['a', 'b', 'c'])
+    after = owners(['a', 'b'])
+
+    moved = [partition for partition in PARTITIONS if before[partition] != after[partition]]
+
+    assert moved
+    assert all(before[partition] == 'c' for partition in moved)
+
+
+def test_empty_ring_owns_nothing():
+    assert HashRing([]).owner('jobs:queue:eu-west-1:p0') is None